@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Anomaly Detection - rolling baselines and z-scores for every event and day.
+
+Each day is scored against EWMA level and day-of-week baselines as they stood
+the day before, for all events at once. Scan state is checkpointed so a
+refresh resumes from its first changed day.
+"""
+
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from query_engine import QueryEngine, get_engine, parse_day
+
+
+LEVEL_SPAN = 14  # Days
+DOW_SPAN = 4  # Weeks
+MIN_HISTORY = 7  # Days before a level z-score is defined
+MIN_DOW_HISTORY = 3  # Same-weekday samples before the weekday baseline is used
+CHECKPOINT_EVERY = 7  # Columns between stored scan states
+CHECKPOINT_SPAN = 42  # Trailing columns that keep checkpoints
+
+LEVEL_ALPHA = 2 / (LEVEL_SPAN + 1)
+DOW_ALPHA = 2 / (DOW_SPAN + 1)
+
+
+# ============= SCAN STATE =============
+
+@dataclass
+class ScanState:
+    """Baselines of every event after some day."""
+    mean: np.ndarray  # Events
+    var: np.ndarray
+    count: np.ndarray
+    dow_mean: np.ndarray  # Events x 7 weekdays
+    dow_var: np.ndarray
+    dow_count: np.ndarray
+
+    @classmethod
+    def empty(cls, n_events: int) -> 'ScanState':
+        return cls(
+            mean=np.zeros(n_events), var=np.zeros(n_events), count=np.zeros(n_events, dtype=np.int64),
+            dow_mean=np.zeros((n_events, 7)), dow_var=np.zeros((n_events, 7)),
+            dow_count=np.zeros((n_events, 7), dtype=np.int64),
+        )
+
+    def copy(self) -> 'ScanState':
+        return ScanState(*(a.copy() for a in (self.mean, self.var, self.count,
+                                                self.dow_mean, self.dow_var, self.dow_count)))
+
+    def grow(self, n_events: int) -> 'ScanState':
+        """A copy with zeroed state for events added since."""
+        extra = n_events - len(self.mean)
+        if extra <= 0:
+            return self.copy()
+        pad = lambda a: np.concatenate([a, np.zeros((extra,) + a.shape[1:], dtype=a.dtype)])
+        return ScanState(*(pad(a) for a in (self.mean, self.var, self.count,
+                                              self.dow_mean, self.dow_var, self.dow_count)))
+
+
+def _ewma_step(x: np.ndarray, mean: np.ndarray, var: np.ndarray, count: np.ndarray,
+               alpha: float, seen: np.ndarray) -> None:
+    """Fold x into the EWMA mean/variance (in place) where `seen`."""
+    diff = x - mean
+    increment = alpha * diff
+    first = seen & (count == 0)
+    rest = seen & (count > 0)
+    mean[first] = x[first]
+    var[rest] = (1 - alpha) * (var[rest] + diff[rest] * increment[rest])
+    mean[rest] += increment[rest]
+    count[seen] += 1
+
+
+def _z(x: np.ndarray, mean: np.ndarray, var: np.ndarray) -> np.ndarray:
+    return (x - mean) / np.sqrt(np.maximum(var, np.abs(mean)) + 1.0)
+
+
+def weekdays(days: np.ndarray) -> np.ndarray:
+    """Weekday per day (Monday = 0)."""
+    return ((days.astype('datetime64[D]').astype(np.int64) + 3) % 7).astype(np.int64)
+
+
+def scan(values: np.ndarray, present: np.ndarray, days: np.ndarray, state: ScanState,
+         start: int = 0) -> Tuple[np.ndarray, np.ndarray, Dict[int, ScanState]]:
+    """Score columns start.. and advance `state`. Returns (z, expected, checkpoints)."""
+    n_events, n_days = values.shape
+    width = n_days - start
+    z = np.full((n_events, width), np.nan, dtype=np.float32)
+    expected = np.full((n_events, width), np.nan, dtype=np.float32)
+    checkpoints: Dict[int, ScanState] = {}
+    dows = weekdays(days)
+
+    for col in range(start, n_days):
+        x = values[:, col].astype(np.float64)
+        seen = present[:, col]
+        w = dows[col]
+        dow_mean, dow_var, dow_count = state.dow_mean[:, w], state.dow_var[:, w], state.dow_count[:, w]
+
+        z_level = _z(x, state.mean, state.var)
+        z_dow = _z(x, dow_mean, dow_var)
+        level_ok = seen & (state.count >= MIN_HISTORY)
+        use_dow = level_ok & (dow_count >= MIN_DOW_HISTORY) & (np.abs(z_dow) < np.abs(z_level))
+        score = np.where(use_dow, z_dow, z_level)
+        base = np.where(use_dow, dow_mean, state.mean)
+        z[:, col - start] = np.where(level_ok, score, np.nan)
+        expected[:, col - start] = np.where(level_ok, base, np.nan)
+
+        _ewma_step(x, state.mean, state.var, state.count, LEVEL_ALPHA, seen)
+        _ewma_step(x, dow_mean, dow_var, dow_count, DOW_ALPHA, seen)  # Column views: updates state
+
+        if col == n_days - 1 or (col >= n_days - CHECKPOINT_SPAN and (col + 1) % CHECKPOINT_EVERY == 0):
+            checkpoints[col] = state.copy()
+    return z, expected, checkpoints
+
+
+# ============= MODEL =============
+
+@dataclass
+class AnomalyModel:
+    """Scores of every event/day plus the scan state needed to extend them."""
+    names: List[str]
+    days: np.ndarray
+    z: np.ndarray  # Events x days (NaN where undefined)
+    expected: np.ndarray  # Baseline each day was scored against
+    checkpoints: Dict[int, ScanState]  # Column -> state after that column
+
+    @classmethod
+    def build(cls, engine: QueryEngine) -> 'AnomalyModel':
+        state = ScanState.empty(len(engine.names))
+        z, expected, checkpoints = scan(engine.values, engine.present, engine.days, state)
+        return cls(list(engine.names), engine.days, z, expected, checkpoints)
+
+    def resume(self, engine: QueryEngine, first_changed: int) -> Optional['AnomalyModel']:
+        """Rescore from the last checkpoint before first_changed, or None if there is none."""
+        if engine.names[:len(self.names)] != self.names:
+            return None
+        if first_changed > len(self.days) or (engine.days[:first_changed] != self.days[:first_changed]).any():
+            return None
+        usable = [col for col in self.checkpoints if col < first_changed]
+        if not usable:
+            return None
+        col = max(usable)
+
+        n_events = len(engine.names)
+        state = self.checkpoints[col].grow(n_events)
+        z_tail, expected_tail, new_checkpoints = scan(engine.values, engine.present, engine.days,
+                                                      state, col + 1)
+        z = np.full((n_events, len(engine.days)), np.nan, dtype=np.float32)
+        expected = np.full_like(z, np.nan)
+        z[:len(self.names), :col + 1] = self.z[:, :col + 1]
+        expected[:len(self.names), :col + 1] = self.expected[:, :col + 1]
+        z[:, col + 1:] = z_tail
+        expected[:, col + 1:] = expected_tail
+
+        oldest = len(engine.days) - CHECKPOINT_SPAN
+        checkpoints = {c: s for c, s in self.checkpoints.items()
+                       if oldest <= c <= col and (c + 1) % CHECKPOINT_EVERY == 0}
+        checkpoints.update(new_checkpoints)
+        return replace(self, names=list(engine.names), days=engine.days, z=z,
+                       expected=expected, checkpoints=checkpoints)
+
+    def top(self, engine: QueryEngine, lo: int, hi: int, k: int, min_z: float = 0.0,
+            rows: Optional[np.ndarray] = None, direction: str = 'both') -> List[Dict]:
+        """The k most anomalous event/days in columns [lo, hi), strongest first."""
+        rows = np.arange(len(self.names)) if rows is None else rows
+        window = self.z[rows, lo:hi]
+        if direction == 'up':
+            strength = window
+        elif direction == 'down':
+            strength = -window
+        else:
+            strength = np.abs(window)
+        strength = np.where(np.isfinite(strength) & (strength >= min_z), strength, -np.inf)
+        flat = strength.ravel()
+        k = min(k, int(np.isfinite(flat).sum()))
+        if k <= 0:
+            return []
+        best = np.argpartition(-flat, k - 1)[:k]
+        best = best[np.argsort(-flat[best], kind='stable')]
+        r, c = np.unravel_index(best, window.shape)
+
+        anomalies = []
+        for row, col in zip(rows[r].tolist(), (c + lo).tolist()):
+            value = engine.values[row, col].item()
+            expected = float(self.expected[row, col])
+            anomalies.append({
+                "event": self.names[row],
+                "date": engine.day_strings[col],
+                "value": value,
+                "expected": round(expected, 1),
+                "z_score": round(float(self.z[row, col]), 2),
+                "change_percent": round((value - expected) / expected * 100, 1) if expected > 0 else None,
+            })
+        return anomalies
+
+
+def level_shifts(engine: QueryEngine, lo: int, hi: int, k: int, baseline_days: int = 28,
+                 min_z: float = 0.0, rows: Optional[np.ndarray] = None) -> List[Dict]:
+    """Events whose mean over [lo, hi) moved the most from the baseline_days before lo."""
+    rows = np.arange(len(engine.names)) if rows is None else rows
+    b_lo = max(0, lo - baseline_days)
+    if hi <= lo or lo <= b_lo:
+        return []
+    before = np.where(engine.present[rows, b_lo:lo], engine.values[rows, b_lo:lo], np.nan).astype(np.float64)
+    after = np.where(engine.present[rows, lo:hi], engine.values[rows, lo:hi], np.nan).astype(np.float64)
+    n_before = np.isfinite(before).sum(axis=1)
+    n_after = np.isfinite(after).sum(axis=1)
+    valid = (n_before >= MIN_HISTORY) & (n_after > 0)
+    if not valid.any():
+        return []
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_before = np.nanmean(np.where(valid[:, None], before, 0), axis=1)
+        var_before = np.nanvar(np.where(valid[:, None], before, 0), axis=1)
+        mean_after = np.nanmean(np.where(valid[:, None], after, 0), axis=1)
+        z = (mean_after - mean_before) / np.sqrt(
+            (np.maximum(var_before, np.abs(mean_before)) + 1.0) / np.maximum(n_after, 1)
+        )
+    z = np.where(valid & (np.abs(z) >= min_z), z, np.nan)
+    order = np.argsort(-np.nan_to_num(np.abs(z), nan=-1.0), kind='stable')
+    order = order[np.isfinite(z[order])][:k]
+    return [{
+        "event": engine.names[row],
+        "baseline_mean": round(float(mean_before[i]), 1),
+        "window_mean": round(float(mean_after[i]), 1),
+        "shift_z": round(float(z[i]), 2),
+        "change_percent": (round(float((mean_after[i] - mean_before[i]) / mean_before[i] * 100), 1)
+                           if mean_before[i] > 0 else None),
+    } for i, row in zip(order.tolist(), rows[order].tolist())]
+
+
+# ============= SNAPSHOT HOOKS =============
+
+def get_anomaly_model(snapshot) -> AnomalyModel:
+    """The anomaly model for a MetricSnapshot, built once per data version."""
+    return snapshot.derive('anomaly_model', lambda s: AnomalyModel.build(get_engine(s)))
+
+
+def update_anomaly_model(model: AnomalyModel, snapshot, delta: Dict) -> Optional[AnomalyModel]:
+    """Incremental hook: rescore from the first changed day (None to rebuild)."""
+    engine = get_engine(snapshot)
+    changed = [day for series in (delta.get('events') or {}).values() for day in series]
+    if not changed:
+        return model if engine.names == model.names and len(engine.days) == len(model.days) else None
+    first = int(np.searchsorted(engine.days, parse_day(min(changed))))
+    return model.resume(engine, first)
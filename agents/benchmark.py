@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Benchmark - latency, throughput and memory of the agent's tools and runs.
+
+Runs each scale in a fresh worker against stub_llm.py replaying
+bench_transcripts.json, measuring data load, every tool (micro) and whole
+runs (e2e). --compare flags p50/p95 regressions between two result files.
+
+Usage:
+    python benchmark.py                                   # 1x and 100x
+    python benchmark.py --scales 1x 100x 10000x --out ../data/benchmarks/run.json
+    python benchmark.py --compare before.json after.json --threshold 0.2
+    python benchmark.py --record                          # re-record transcripts from the live LLM
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from synthetic_data import SCALES, write_dataset
+
+
+AGENTS_DIR = Path(__file__).parent
+SYNTHETIC_DIR = AGENTS_DIR.parent / 'data' / 'synthetic'
+RESULTS_DIR = AGENTS_DIR.parent / 'data' / 'benchmarks'
+TRANSCRIPTS_PATH = AGENTS_DIR / 'bench_transcripts.json'
+
+DEFAULT_SCALES = ['1x', '100x']
+ITERATIONS = 50  # Timed calls per micro-benchmark
+MAX_MICRO_SECONDS = 5.0  # Stop a micro-benchmark early once it has run this long
+E2E_RUNS = 3  # Sequential passes over the transcripts
+E2E_CONCURRENCY = 8  # Threads calling run_agent at once
+REGRESSION_THRESHOLD = 0.2  # Relative slowdown reported by --compare
+STUB_START_TIMEOUT = 10.0  # Seconds to wait for the stub to listen
+
+
+# ============= MEASUREMENT =============
+
+def _ms(seconds: List[float]) -> Dict:
+    """p50 / p95 / mean in milliseconds and calls per second."""
+    values = np.asarray(seconds) * 1000
+    return {
+        "n": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p95_ms": round(float(np.percentile(values, 95)), 4),
+        "mean_ms": round(float(values.mean()), 4),
+        "ops_per_sec": round(1000 / float(values.mean()), 2) if values.mean() > 0 else None,
+    }
+
+
+def _traced_peak_mb(func: Callable[[], object]) -> float:
+    """Peak Python/numpy allocation while running func, in MB."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+    finally:
+        tracemalloc.stop()
+
+
+def _max_rss_mb() -> float:
+    """Peak resident memory of this process so far, in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 2 ** 20 if sys.platform == 'darwin' else rss / 1024, 1)
+
+
+def bench(func: Callable[[], object], iterations: int = ITERATIONS,
+          max_seconds: float = MAX_MICRO_SECONDS) -> Dict:
+    """Time func: its first call separately, then up to `iterations` more."""
+    started = time.perf_counter()
+    func()
+    first = time.perf_counter() - started
+
+    times = []
+    deadline = time.perf_counter() + max_seconds
+    for _ in range(iterations):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+        if t > deadline:
+            break
+    return {"first_ms": round(first * 1000, 4), **_ms(times), "peak_mb": _traced_peak_mb(func)}
+
+
+# ============= WORKER =============
+
+def _shift(day: str, days: int) -> str:
+    return str(np.datetime64(day, 'D') + days)
+
+
+def micro_cases(names: List[str], end: str) -> Dict[str, Dict]:
+    """Representative arguments for every tool over the last month of data."""
+    month, week = _shift(end, -29), _shift(end, -6)
+    return {
+        "get_business_summary": {},
+        "get_metric_data": {"event_name": names[0], "start_date": month, "end_date": end},
+        "get_daily_trend": {"event_name": names[1], "days": 30},
+        "calculate_conversion": {"start_event": names[0], "end_event": names[4],
+                                 "start_date": month, "end_date": end},
+        "analyze_funnel": {"steps": names[:5], "start_date": month, "end_date": end},
+        "count_unique_users": {"events": names[:2], "start_date": month, "end_date": end},
+        "compare_periods": {"event_name": names[5], "period1_start": _shift(end, -13),
+                            "period1_end": _shift(end, -7), "period2_start": week, "period2_end": end},
+        "query_metrics": {"events": names[:5], "start_date": month, "end_date": end,
+                          "aggregations": ["total", "avg", "dod_change"]},
+        "detect_anomalies": {"start_date": week, "end_date": end, "top_k": 10},
+        "get_ugc_summary": {},
+        "get_top_videos": {"limit": 10, "start_date": month, "end_date": end},
+        "get_creator_stats": {"limit": 10},
+        "get_ugc_by_date": {"start_date": week, "end_date": end, "limit": 10},
+        "get_ugc_correlation": {"event_name": names[0], "max_lag": 7, "by_creator": True, "limit": 5},
+    }
+
+
+def _is_error(result: str) -> bool:
+    try:
+        data = json.loads(result)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(data, dict) and 'error' in data
+
+
+def run_worker(iterations: int, e2e_runs: int, concurrency: int) -> Dict:
+    """Benchmark the agent configured by this process's environment."""
+    # Configuration is read at import, so the parent sets the environment first
+    import business_agent as agent
+    from event_index import get_event_index
+    from query_engine import get_engine
+    from ugc import get_ugc_index
+
+    def load() -> Tuple:
+        snapshot = agent.STORE.snapshot()
+        return get_engine(snapshot), get_event_index(snapshot), get_ugc_index(agent.get_ugc_snapshot())
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    engine, _, ugc = load()
+    load_seconds = time.perf_counter() - started
+    load_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    agent.build_system_prompt()
+    report = {
+        "dataset": {"events": len(engine.names), "days": len(engine.days), "videos": len(ugc.views)},
+        "load": {"seconds": round(load_seconds, 4), "peak_mb": round(load_peak / 2 ** 20, 3),
+                 "rss_mb": _max_rss_mb()},
+        "micro": {},
+    }
+
+    # Tools, called directly so every call does the work
+    for name, args in micro_cases(list(engine.names), engine.day_strings[-1]).items():
+        func = agent.TOOL_FUNCTIONS[name]
+        result = bench(lambda: func(dict(args)), iterations)
+        result["error"] = _is_error(func(dict(args)))
+        report["micro"][f"tool:{name}"] = result
+        print(f"   {'❌' if result['error'] else '⏱️ '} {name:24} p50 {result['p50_ms']:9.3f} ms "
+              f"p95 {result['p95_ms']:9.3f} ms (first {result['first_ms']:.1f} ms)", flush=True)
+
+    events = agent.load_mixpanel_data()['events']
+    synthetic = engine.names[-1]
+    for kind, query in (("exact", engine.names[0]), ("alias", "signups"),
+                        ("fuzzy", "dashbord views"), ("synthetic", synthetic.replace('_', ' '))):
+        report["micro"][f"find_event:{kind}"] = bench(lambda: agent.find_event(events, query), iterations * 20)
+
+    args = micro_cases(list(engine.names), engine.day_strings[-1])["query_metrics"]
+    agent.execute_tool("query_metrics", args)
+    report["micro"]["execute_tool:cache_hit"] = bench(lambda: agent.execute_tool("query_metrics", args),
+                                                      iterations * 20)
+
+    report["e2e"] = run_e2e(agent, e2e_runs, concurrency)
+    report["rss_mb"] = _max_rss_mb()
+    return report
+
+
+def _run_once(agent, question: str) -> Tuple[float, int, Optional[str]]:
+    """One cold run_agent call: (seconds, tool calls, error)."""
+    agent.TOOL_CACHE.clear()
+    tool_calls, error = 0, None
+    started = time.perf_counter()
+    for event in agent.run_agent(question, [], stream=True, fast_path=False):
+        if event.type == 'tool_call':
+            tool_calls += 1
+        elif event.type == 'error':
+            error = str(event.content)
+    return time.perf_counter() - started, tool_calls, error
+
+
+def run_e2e(agent, runs: int, concurrency: int) -> Dict:
+    questions = [t['question'] for t in load_transcript_file(TRANSCRIPTS_PATH)]
+    _run_once(agent, questions[0])  # Warm the client connection
+
+    sequential, errors, tool_calls = [], [], 0
+    for _ in range(runs):
+        for question in questions:
+            seconds, calls, error = _run_once(agent, question)
+            sequential.append(seconds)
+            tool_calls += calls
+            if error:
+                errors.append(error)
+
+    peak_mb = max(_traced_peak_mb(lambda: _run_once(agent, q)) for q in questions)
+
+    jobs = questions * max(1, runs)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        concurrent = list(pool.map(lambda q: _run_once(agent, q), jobs))
+    wall = time.perf_counter() - started
+    errors += [error for _, _, error in concurrent if error]
+
+    seq = _ms(sequential)
+    con = _ms([seconds for seconds, _, _ in concurrent])
+    print(f"   🤖 e2e sequential p50 {seq['p50_ms']:.1f} ms p95 {seq['p95_ms']:.1f} ms | "
+          f"{concurrency} threads {len(jobs) / wall:.1f} runs/s | {len(errors)} errors", flush=True)
+    return {
+        "sequential": {**seq, "runs_per_sec": seq["ops_per_sec"],
+                       "tool_calls_per_run": round(tool_calls / max(1, len(sequential)), 2)},
+        "concurrent": {**con, "threads": concurrency, "runs_per_sec": round(len(jobs) / wall, 2)},
+        "peak_mb": peak_mb,
+        "errors": errors[:10],
+        "error_count": len(errors),
+    }
+
+
+# ============= ORCHESTRATION =============
+
+def load_transcript_file(path: Path) -> List[Dict]:
+    with open(path, 'r') as f:
+        return json.load(f)['transcripts']
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stub(transcripts: Path) -> Tuple[subprocess.Popen, str]:
+    """Start stub_llm.py replaying the transcripts. Returns (process, base URL)."""
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, str(AGENTS_DIR / 'stub_llm.py'), '--port', str(port), '--replay', str(transcripts)],
+        stdout=subprocess.DEVNULL, cwd=AGENTS_DIR,
+    )
+    deadline = time.monotonic() + STUB_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Stub LLM did not start on port {port}")
+
+
+def ensure_dataset(scale: str, seed: int) -> Dict[str, str]:
+    """The scale's dataset files, generated on first use."""
+    directory = SYNTHETIC_DIR / f"{scale}-seed{seed}"
+    manifest = directory / 'manifest.json'
+    if manifest.exists():
+        with open(manifest, 'r') as f:
+            return json.load(f)
+    print(f"🏗️  Generating {scale} dataset in {directory}", flush=True)
+    paths = write_dataset(directory, SCALES[scale], seed)
+    with open(manifest, 'w') as f:
+        json.dump(paths, f)
+    return paths
+
+
+def run_scale(scale: str, seed: int, base_url: str, iterations: int, e2e_runs: int,
+              concurrency: int) -> Dict:
+    """Benchmark one scale in a fresh worker process (clean caches and memory peaks)."""
+    paths = ensure_dataset(scale, seed)
+    env = dict(os.environ,
+               MIXPANEL_DATA_PATH=paths['mixpanel'],
+               UGC_DATA_PATH=paths['ugc'],
+               AGENT_SKETCH_DB=paths.get('sketches', os.devnull),
+               MULEROUTER_BASE_URL=base_url,
+               MULEROUTER_API_KEY='stub')
+    with tempfile.NamedTemporaryFile(suffix='.json') as out:
+        subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), '--worker', '--result-file', out.name,
+             '--iterations', str(iterations), '--runs', str(e2e_runs), '--concurrency', str(concurrency)],
+            env=env, cwd=AGENTS_DIR, check=True,
+        )
+        with open(out.name, 'r') as f:
+            return json.load(f)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=AGENTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(scales: List[str], seed: int, iterations: int, e2e_runs: int, concurrency: int) -> Dict:
+    stub, base_url = start_stub(TRANSCRIPTS_PATH)
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": seed,
+            "iterations": iterations,
+            "e2e_runs": e2e_runs,
+            "concurrency": concurrency,
+        },
+        "scales": {},
+    }
+    try:
+        for scale in scales:
+            s = SCALES[scale]
+            print(f"\n📦 {scale}: {s.events:,} events x {s.days:,} days, {s.videos:,} videos", flush=True)
+            results["scales"][scale] = run_scale(scale, seed, base_url, iterations, e2e_runs, concurrency)
+    finally:
+        stub.terminate()
+        stub.wait()
+    return results
+
+
+# ============= COMPARISON =============
+
+def _latencies(results: Dict) -> Dict[str, float]:
+    """Flattened 'scale/section/name/stat' -> value for every latency in a result file."""
+    flat = {}
+    for scale, report in results.get("scales", {}).items():
+        flat[f"{scale}/load/seconds"] = report["load"]["seconds"]
+        for name, stats in report.get("micro", {}).items():
+            for stat in ("p50_ms", "p95_ms"):
+                flat[f"{scale}/micro/{name}/{stat}"] = stats[stat]
+        for mode in ("sequential", "concurrent"):
+            for stat in ("p50_ms", "p95_ms"):
+                flat[f"{scale}/e2e/{mode}/{stat}"] = report["e2e"][mode][stat]
+    return flat
+
+
+def compare(old: Dict, new: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[Dict]:
+    """Latencies in both result files, slowest relative change first."""
+    before, after = _latencies(old), _latencies(new)
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        a, b = before[key], after[key]
+        change = (b - a) / a if a > 0 else 0.0
+        rows.append({"metric": key, "before": a, "after": b, "change": round(change, 4),
+                     "regression": change > threshold})
+    return sorted(rows, key=lambda r: -r["change"])
+
+
+def print_comparison(rows: List[Dict], threshold: float) -> int:
+    regressions = [r for r in rows if r["regression"]]
+    improvements = [r for r in rows if r["change"] < -threshold]
+    for label, group in (("🔴 Regressions", regressions), ("🟢 Improvements", improvements)):
+        if group:
+            print(f"{label} (beyond {threshold:.0%}):")
+            for r in group:
+                print(f"   {r['metric']:60} {r['before']:>12.3f} -> {r['after']:>12.3f} ({r['change']:+.1%})")
+    print(f"\n📊 {len(rows)} latencies compared: {len(regressions)} regressions, "
+          f"{len(improvements)} improvements")
+    return 1 if regressions else 0
+
+
+# ============= RECORDING =============
+
+def record_transcripts(path: Path) -> int:
+    """Re-record the transcript file's questions against the configured (live) LLM."""
+    from business_agent import run_agent
+
+    recorded = []
+    for transcript in load_transcript_file(path):
+        messages: List[Dict] = []
+        for _ in run_agent(transcript['question'], messages, fast_path=False):
+            pass
+        turns = []
+        for message in messages[2:]:
+            if message.get('role') != 'assistant':
+                continue
+            if message.get('tool_calls'):
+                turns.append({"tool_calls": [
+                    {"name": call['function']['name'], "arguments": json.loads(call['function']['arguments'] or '{}')}
+                    for call in message['tool_calls']
+                ]})
+            else:
+                turns.append({"content": message.get('content') or ''})
+        print(f"🎙️  {len(turns)} turns | {transcript['question']}")
+        recorded.append({"question": transcript['question'], "turns": turns})
+
+    with open(path, 'r') as f:
+        data = json.load(f)
+    data['transcripts'] = recorded
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.write('\n')
+    print(f"💾 Wrote {path}")
+    return 0
+
+
+# ============= CLI =============
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the agent's tools and runs on synthetic data")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=DEFAULT_SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help="Timed calls per micro-benchmark")
+    parser.add_argument('--runs', type=int, default=E2E_RUNS, help="Sequential passes over the transcripts")
+    parser.add_argument('--concurrency', type=int, default=E2E_CONCURRENCY, help="Threads for the concurrent pass")
+    parser.add_argument('--out', help="Result file (default: data/benchmarks/<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two result files")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative slowdown counted as a regression")
+    parser.add_argument('--record', action='store_true',
+                        help="Re-record bench_transcripts.json from the configured LLM")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        report = run_worker(args.iterations, args.runs, args.concurrency)
+        with open(args.result_file, 'w') as f:
+            json.dump(report, f)
+        return 0
+    if args.record:
+        return record_transcripts(TRANSCRIPTS_PATH)
+    if args.compare:
+        with open(args.compare[0], 'r') as f:
+            old = json.load(f)
+        with open(args.compare[1], 'r') as f:
+            new = json.load(f)
+        return print_comparison(compare(old, new, args.threshold), args.threshold)
+
+    results = run_suite(args.scales, args.seed, args.iterations, args.runs, args.concurrency)
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Wrote {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,12 +6,40 @@ A proper agentic system with tool use, reasoning, and multi-step execution.
 Uses OpenAI-compatible API (MuleRouter + Qwen).
 """
 
+import asyncio
+import contextvars
+import inspect
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Generator
-from dataclasses import dataclass
-from openai import OpenAI
+from typing import Dict, List, Optional, Any, AsyncIterator, Awaitable, Generator
+from dataclasses import dataclass, field
+import numpy as np
+from openai import AsyncOpenAI
+
+from metric_store import MetricStore, MetricSnapshot
+from query_engine import get_engine, parse_day, update_engine
+from event_index import EventIndex, EventMatch, get_event_index, update_event_index
+from tool_cache import ToolResultCache
+from intent_router import route_query
+from history import HistoryManager
+from llm_client import LLMClient
+import tracing
+from prompt_prefetch import get_data_summary
+from funnel import compute_funnel, format_rate
+from anomaly import get_anomaly_model, level_shifts, update_anomaly_model
+from metric_db import DB_SUFFIXES, union_sketches
+from ugc import (
+    MAX_LAG, MIN_BEST_LAG_DAYS, format_views, get_creator_correlations, get_ugc_index, get_view_correlations,
+    normalize_handle, parse_posted
+)
+from output_shaping import (
+    closest_events, dumps, fit, max_tokens_hint, not_found, partial_buckets, point_budget, shape_series,
+    top_events_by_volume, BASE_TOKENS, DEFAULT_MAX_TOKENS,
+)
 
 # ============= CONFIGURATION =============
 
@@ -19,35 +47,95 @@ MULEROUTER_API_KEY = os.getenv(
     'MULEROUTER_API_KEY',
     'sk-mr-896ba94c90409b4cebd0f99735519843c3e7e28f76dd3e6bcb6e9102af4de694'
 )
-MULEROUTER_BASE_URL = 'https://api.mulerouter.ai/vendors/openai/v1'
-MODEL_NAME = 'qwen3-max'
+MULEROUTER_BASE_URL = os.getenv('MULEROUTER_BASE_URL', 'https://api.mulerouter.ai/vendors/openai/v1')
+MODEL_NAME = os.getenv('MULEROUTER_MODEL', 'qwen3-max')
 MAX_ITERATIONS = 10  # Maximum tool call iterations
+MAX_TOOL_WORKERS = int(os.getenv('AGENT_TOOL_WORKERS', '8'))  # Parallel tool calls per process
+AGENT_TIMEOUT = float(os.getenv('AGENT_TIMEOUT', '120'))  # Seconds per agent run
+TOOL_TIMEOUT = float(os.getenv('AGENT_TOOL_TIMEOUT', '30'))  # Seconds per tool call
+TOOL_CACHE_SIZE = int(os.getenv('TOOL_CACHE_SIZE', '1024'))  # Cached tool results
+TOOL_CACHE_TTL = float(os.getenv('TOOL_CACHE_TTL', '300'))  # Seconds a cached result lives
+FAST_PATH = os.getenv('AGENT_FAST_PATH', '1') != '0'  # Answer templated questions without the LLM
+PROMPT_PREFETCH = os.getenv('AGENT_PROMPT_PREFETCH', '1') != '0'  # Data summary in the system prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv('AGENT_HISTORY_TOKENS', '24000'))  # Prompt budget per LLM call
+
+# Data path: the JSON export, a store built by ingest.py (.db) or a metric_file.py file (.bmet)
+DATA_PATH = Path(os.getenv(
+    'MIXPANEL_DATA_PATH',
+    str(Path(__file__).parent.parent / 'data' / 'mixpanel-data.json')
+))
+
+# Per event/day user sketches written by ingest.py (for count_unique_users)
+SKETCH_DB_PATH = Path(os.getenv(
+    'AGENT_SKETCH_DB',
+    str(DATA_PATH if DATA_PATH.suffix in DB_SUFFIXES else Path(__file__).parent.parent / 'data' / 'metrics.db')
+))
+
+# Creator video export scraped from SideShift (for the UGC tools)
+UGC_DATA_PATH = Path(os.getenv(
+    'UGC_DATA_PATH',
+    str(Path(__file__).parent.parent / 'data' / 'ugc-data.json')
+))
+
+# Pooled LLM client, configured by the LLM_* environment variables
+LLM = LLMClient(api_key=MULEROUTER_API_KEY, base_url=MULEROUTER_BASE_URL)
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Get the MuleRouter client for the running event loop."""
+    return LLM.client()
+
 
-# Data path
-DATA_PATH = Path(__file__).parent.parent / 'data' / 'mixpanel-data.json'
+# ============= DATA LOADING =============
+
+# Process-wide store; daily deltas update derived structures instead of rebuilding them
+STORE = MetricStore(DATA_PATH)
+STORE.register_incremental('engine', update_engine)
+STORE.register_incremental('event_index', update_event_index)
+STORE.register_incremental('anomaly_model', update_anomaly_model)
 
-# Create OpenAI client for MuleRouter
-client = OpenAI(
-    api_key=MULEROUTER_API_KEY,
-    base_url=MULEROUTER_BASE_URL
+# Snapshot pinned by the agent run in progress, so its tools see one data version
+_pinned_snapshot: contextvars.ContextVar[Optional[MetricSnapshot]] = contextvars.ContextVar(
+    'pinned_snapshot', default=None
 )
 
 
-# ============= DATA LOADING =============
+def get_snapshot() -> MetricSnapshot:
+    """Get the versioned snapshot of the Mixpanel data (the run's pinned one, if any)."""
+    pinned = _pinned_snapshot.get()
+    return pinned if pinned is not None else STORE.snapshot()
+
+
+# UGC export, indexed once per version (see ugc.py)
+UGC_STORE = MetricStore(UGC_DATA_PATH)
+
+
+def get_ugc_snapshot() -> MetricSnapshot:
+    """Get the versioned snapshot of the UGC data."""
+    return UGC_STORE.snapshot()
+
 
 def load_mixpanel_data() -> Dict:
-    """Load Mixpanel data from JSON file."""
-    try:
-        if DATA_PATH.exists():
-            with open(DATA_PATH, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading Mixpanel data: {e}")
-    return {}
+    """Load Mixpanel data (served from the in-memory store, do not mutate)."""
+    return get_snapshot().data
 
 
 # ============= TOOL DEFINITIONS =============
 
+# Accepted by every tool; results are shaped to stay within it
+MAX_TOKENS_PARAM = {
+    "type": "integer",
+    "description": f"Optional cap on the result size in tokens (default {DEFAULT_MAX_TOKENS}). Long daily series are rolled up to weekly or monthly totals to fit."
+}
+
+# Aggregations accepted by query_metrics
+AGGREGATIONS = ('total', 'avg', 'min', 'max', 'daily', 'dod_change')
+
+# detect_anomalies scans this many trailing days unless given a range
+DEFAULT_ANOMALY_DAYS = 7
+ANOMALY_METHOD = ("z = (value - baseline) / std, vs the event's EWMA level and its same-weekday "
+                  "average (the smaller |z| of the two); level_shifts compare the window mean with the 28 days before")
+
 TOOLS = [
     {
         "type": "function",
@@ -56,7 +144,9 @@ TOOLS = [
             "description": "Get an overview of all available business metrics and KPIs. Use this FIRST to understand what data is available before making specific queries.",
             "parameters": {
                 "type": "object",
-                "properties": {},
+                "properties": {
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
                 "required": []
             }
         }
@@ -80,7 +170,8 @@ TOOLS = [
                     "end_date": {
                         "type": "string",
                         "description": "Optional end date filter (YYYY-MM-DD format)"
-                    }
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
                 },
                 "required": ["event_name"]
             }
@@ -101,7 +192,8 @@ TOOLS = [
                     "days": {
                         "type": "integer",
                         "description": "Number of recent days to show (default: 7)"
-                    }
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
                 },
                 "required": ["event_name"]
             }
@@ -122,12 +214,80 @@ TOOLS = [
                     "end_event": {
                         "type": "string",
                         "description": "The ending event in the funnel (e.g., 'signup_completed', 'subscription_order_initiated')"
-                    }
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional start date (YYYY-MM-DD)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional end date (YYYY-MM-DD)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
                 },
                 "required": ["start_event", "end_event"]
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "analyze_funnel",
+            "description": "Multi-step funnel: conversion and drop-off between each pair of adjacent steps, overall conversion, and the conversion series per day (or week/month). Steps are daily event counts, so a step can exceed 100% of the previous one.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Ordered funnel steps, at least two (e.g., ['welcome_screen_viewed', 'signup_started', 'signup_completed'])"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional start date (YYYY-MM-DD)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional end date (YYYY-MM-DD)"
+                    },
+                    "granularity": {
+                        "type": "string",
+                        "enum": ["day", "week", "month"],
+                        "description": "Bucket size for the conversion series (default: finest that fits max_tokens)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": ["steps"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "count_unique_users",
+            "description": "Approximate number of DISTINCT users who did any of the given events over a date range (e.g., 'how many unique users chatted this month', 'users who did A or B'). Do not add up daily counts for this; they double-count users.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "events": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Events to count users for; with several, a user counts once if they did any of them"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional start date (YYYY-MM-DD)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional end date (YYYY-MM-DD)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": ["events"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -155,100 +315,345 @@ TOOLS = [
                     "period2_end": {
                         "type": "string",
                         "description": "End date of second (previous) period (YYYY-MM-DD)"
-                    }
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
                 },
                 "required": ["event_name", "period1_start", "period1_end", "period2_start", "period2_end"]
             }
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "query_metrics",
+            "description": "Fetch several metrics and aggregations in ONE call: totals, averages, min/max, daily (or weekly/monthly) values and day-over-day changes for a list of events over a date range. Prefer this over calling get_metric_data once per event.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "events": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Events/metrics to query (e.g., ['signup_completed', 'dashboard_viewed'])"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional start date (YYYY-MM-DD)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional end date (YYYY-MM-DD)"
+                    },
+                    "aggregations": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(AGGREGATIONS)},
+                        "description": "What to compute per event (default: total, avg). 'daily' returns the series, 'dod_change' the change between consecutive days (or weeks/months)."
+                    },
+                    "granularity": {
+                        "type": "string",
+                        "enum": ["day", "week", "month"],
+                        "description": "Bucket size for daily and dod_change (default: finest that fits max_tokens)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": ["events"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "detect_anomalies",
+            "description": "Scan ALL events at once for unusual days and level shifts (e.g., 'what changed this week', 'anything unusual yesterday'). Each day is scored against the event's recent level and its usual value on that weekday. Use this instead of calling get_daily_trend per event.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional start of the window to scan (YYYY-MM-DD, default: last 7 days of data)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional end of the window (YYYY-MM-DD, default: latest day)"
+                    },
+                    "events": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Optional events to limit the scan to (default: all)"
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": "Number of anomalies and shifts to return (default 10)"
+                    },
+                    "min_z": {
+                        "type": "number",
+                        "description": "Minimum |z-score| to report (default 3)"
+                    },
+                    "direction": {
+                        "type": "string",
+                        "enum": ["both", "up", "down"],
+                        "description": "Only spikes (up), only drops (down) or both (default)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_ugc_summary",
+            "description": "Overview of TikTok UGC (creator video) performance: total views, engagement, posts, creators, platforms and top creators.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_top_videos",
+            "description": "Top UGC videos by views, optionally for one creator, one platform or a posting date range.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of videos to return (default 10)"
+                    },
+                    "creator": {
+                        "type": "string",
+                        "description": "Optional creator handle (e.g., '@creator')"
+                    },
+                    "platform": {
+                        "type": "string",
+                        "description": "Optional platform (e.g., 'tiktok')"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Optional first posting date (YYYY-MM-DD)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Optional last posting date (YYYY-MM-DD)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_creator_stats",
+            "description": "Per-creator UGC statistics (posts, total and average views, first/last post). Without a creator, returns the top creators by views.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "creator": {
+                        "type": "string",
+                        "description": "Optional creator handle; omit for all creators"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of creators to return when no creator is given (default 20)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_ugc_by_date",
+            "description": "UGC videos posted on a date or in a date range, with their views and a per-day breakdown.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "date": {
+                        "type": "string",
+                        "description": "A single posting date (YYYY-MM-DD)"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Start of a posting date range (YYYY-MM-DD)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "End of a posting date range (YYYY-MM-DD)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of videos to list (default 20, most viewed first)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_ugc_correlation",
+            "description": "Lagged correlation between daily UGC views and a Mixpanel event (e.g., 'did UGC drive signups', 'which creators drove signups'). Views are attributed to the day a video was posted.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "event_name": {
+                        "type": "string",
+                        "description": "Event to correlate with (default: signup_completed)"
+                    },
+                    "max_lag": {
+                        "type": "integer",
+                        "description": f"Largest delay in days between posting and the event to test (default 7, max {MAX_LAG})"
+                    },
+                    "by_creator": {
+                        "type": "boolean",
+                        "description": "Also rank creators by how well their posting days track the event (default true)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of creators to return (default 10)"
+                    },
+                    "max_tokens": MAX_TOKENS_PARAM
+                },
+                "required": []
+            }
+        }
     }
 ]
 
 
 # ============= TOOL IMPLEMENTATIONS =============
 
+def resolve_event(snapshot: MetricSnapshot, name: str) -> EventMatch:
+    """Resolve an event name against the snapshot's name index."""
+    return get_event_index(snapshot).resolve(name)
+
+
 def find_event(events: Dict, name: str) -> tuple:
-    """Find an event by name (fuzzy matching)."""
-    event_key = name.lower().replace(' ', '_').replace('-', '_')
-    for k in events.keys():
-        if k.lower() == event_key or event_key in k.lower() or k.lower() in event_key:
-            return k, events[k]
-    return None, None
+    """Find an event by name (exact, alias or ranked fuzzy match)."""
+    snapshot = get_snapshot()
+    if events is snapshot.data.get('events'):
+        index = get_event_index(snapshot)
+    else:
+        index = EventIndex(events.keys())
+    key = index.resolve(name).key
+    if key is None:
+        return None, None
+    return key, events[key]
+
+
+def _int_arg(args: Dict, key: str, default: int, low: int, high: int) -> int:
+    """An integer argument clamped to [low, high] (default if missing or malformed)."""
+    try:
+        value = int(args.get(key, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(low, min(value, high))
+
+
+def _with_match(result: Dict, *matches: EventMatch) -> Dict:
+    """Attach match details to a tool result when a name was not exact."""
+    inexact = [m.to_dict() for m in matches if m.method != 'exact']
+    if inexact:
+        result["name_resolution"] = inexact
+    return result
 
 
 def tool_get_business_summary(args: Dict) -> str:
     """Get business summary."""
-    data = load_mixpanel_data()
+    snapshot = get_snapshot()
+    data = snapshot.data
     if not data:
-        return json.dumps({"error": "No Mixpanel data available"})
+        return dumps({"error": "No Mixpanel data available"})
 
-    return json.dumps({
+    max_tokens = max_tokens_hint(args)
+    result = {
         "project_id": data.get("project_id"),
         "date_range": data.get("date_range"),
         "scraped_at": data.get("scraped_at"),
         "summary": data.get("summary", {}),
         "available_metrics": list(data.get("events", {}).keys())
-    }, indent=2)
+    }
+
+    # With many events, list the busiest ones that fit
+    budget = point_budget(max_tokens)
+    if len(result["available_metrics"]) > budget:
+        result["available_metric_count"] = len(result["available_metrics"])
+        result["available_metrics"] = top_events_by_volume(get_engine(snapshot), budget)
+
+    return fit(result, max_tokens)
 
 
 def tool_get_metric_data(args: Dict) -> str:
     """Get metric data."""
-    data = load_mixpanel_data()
+    snapshot = get_snapshot()
+    data = snapshot.data
     if not data:
-        return json.dumps({"error": "No Mixpanel data available"})
+        return dumps({"error": "No Mixpanel data available"})
 
     event_name = args.get("event_name", "")
     start_date = args.get("start_date")
     end_date = args.get("end_date")
+    max_tokens = max_tokens_hint(args)
 
-    events = data.get("events", {})
-    matching_key, event_data = find_event(events, event_name)
+    match = resolve_event(snapshot, event_name)
+    matching_key = match.key
 
     if not matching_key:
-        return json.dumps({
-            "error": f"Event '{event_name}' not found",
-            "available_events": list(events.keys())
-        })
+        return fit(not_found(snapshot, "Event", event_name), max_tokens)
 
-    # Filter by date
-    if start_date or end_date:
-        event_data = {
-            d: v for d, v in event_data.items()
-            if (not start_date or d >= start_date) and (not end_date or d <= end_date)
-        }
+    engine = get_engine(snapshot)
+    try:
+        event_data, granularity, partial = shape_series(engine, matching_key, start_date, end_date, max_tokens)
+        stats = engine.range_stats(matching_key, start_date, end_date)
+    except ValueError as e:
+        return dumps({"error": str(e)})
 
-    values = list(event_data.values())
-    return json.dumps({
+    result = {
         "event": matching_key,
+        "granularity": granularity,
         "data": event_data,
-        "stats": {
-            "total": sum(values),
-            "average": round(sum(values) / len(values)) if values else 0,
-            "max": max(values) if values else 0,
-            "min": min(values) if values else 0,
-            "days": len(values)
-        }
-    }, indent=2)
+        "stats": stats.to_dict()
+    }
+    if partial:
+        result["partial_buckets"] = partial
+    return fit(_with_match(result, match), max_tokens)
 
 
 def tool_get_daily_trend(args: Dict) -> str:
     """Get daily trend."""
-    data = load_mixpanel_data()
+    snapshot = get_snapshot()
+    data = snapshot.data
     if not data:
-        return json.dumps({"error": "No Mixpanel data available"})
+        return dumps({"error": "No Mixpanel data available"})
 
     event_name = args.get("event_name", "")
-    days = args.get("days", 7)
+    max_tokens = max_tokens_hint(args)
+    try:
+        days = int(args.get("days", 7))
+    except (TypeError, ValueError):
+        days = 7
+    # Each trend entry costs about 20 tokens
+    days = max(1, min(days, (max_tokens - BASE_TOKENS) // 20))
 
-    events = data.get("events", {})
-    matching_key, event_data = find_event(events, event_name)
+    match = resolve_event(snapshot, event_name)
+    matching_key = match.key
 
     if not matching_key:
-        return json.dumps({
-            "error": f"Event '{event_name}' not found",
-            "available_events": list(events.keys())
-        })
+        return fit(not_found(snapshot, "Event", event_name), max_tokens)
 
-    dates = sorted(event_data.keys())[-days:]
+    event_data = get_engine(snapshot).tail(matching_key, days)
+    dates = list(event_data.keys())
     trend = []
 
     for i, date in enumerate(dates):
@@ -264,72 +669,232 @@ def tool_get_daily_trend(args: Dict) -> str:
 
         trend.append(entry)
 
-    return json.dumps({
+    return fit(_with_match({
         "event": matching_key,
         "days": days,
         "trend": trend
-    }, indent=2)
+    }, match), max_tokens)
 
 
 def tool_calculate_conversion(args: Dict) -> str:
     """Calculate conversion between events."""
-    data = load_mixpanel_data()
+    snapshot = get_snapshot()
+    data = snapshot.data
     if not data:
-        return json.dumps({"error": "No Mixpanel data available"})
+        return dumps({"error": "No Mixpanel data available"})
 
     start_event = args.get("start_event", "")
     end_event = args.get("end_event", "")
+    start_date = args.get("start_date")
+    end_date = args.get("end_date")
+    max_tokens = max_tokens_hint(args)
 
-    events = data.get("events", {})
-
-    start_key, start_data = find_event(events, start_event)
-    end_key, end_data = find_event(events, end_event)
+    start_match = resolve_event(snapshot, start_event)
+    end_match = resolve_event(snapshot, end_event)
+    start_key, end_key = start_match.key, end_match.key
 
     if not start_key:
-        return json.dumps({"error": f"Start event '{start_event}' not found"})
+        return fit(not_found(snapshot, "Start event", start_event), max_tokens)
     if not end_key:
-        return json.dumps({"error": f"End event '{end_event}' not found"})
+        return fit(not_found(snapshot, "End event", end_event), max_tokens)
 
-    start_total = sum(start_data.values())
-    end_total = sum(end_data.values())
+    try:
+        funnel = _shaped_funnel(get_engine(snapshot), [start_key, end_key], start_date, end_date,
+                                None, max_tokens)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+    start_total, end_total = funnel.totals[0].item(), funnel.totals[1].item()
     conversion = (end_total / start_total * 100) if start_total > 0 else 0
 
-    return json.dumps({
+    result = {
         "funnel": f"{start_key} -> {end_key}",
         "start_event": {"name": start_key, "total": start_total},
         "end_event": {"name": end_key, "total": end_total},
         "conversion_rate": f"{conversion:.2f}%",
-        "drop_off": f"{100 - conversion:.2f}%"
-    }, indent=2)
+        "drop_off": f"{100 - conversion:.2f}%",
+        "granularity": funnel.granularity,
+        "conversion_series": funnel.series_dict(),
+    }
+    partial = partial_buckets(funnel.labels, funnel.covered, funnel.length)
+    if partial:
+        result["partial_buckets"] = partial
+    if start_date or end_date:
+        result["range"] = f"{start_date or 'start'} to {end_date or 'end'}"
+    if conversion > 100:
+        result["note"] = FUNNEL_VOLUME_NOTE
+    return fit(_with_match(result, start_match, end_match), max_tokens)
+
+
+# Explains conversions above 100% on count data
+FUNNEL_VOLUME_NOTE = (
+    "Steps are daily event counts, not unique users; above 100% means the later "
+    "event fired more often than the earlier one."
+)
+
+
+def _shaped_funnel(engine, steps: List[str], start_date: Optional[str], end_date: Optional[str],
+                   granularity: Optional[str], max_tokens: int, series_per_bucket: int = 1):
+    """The funnel at the given granularity, or the finest whose series fit the budget."""
+    budget = point_budget(max_tokens - 25 * len(steps))
+    for g in ([granularity] if granularity else ['day', 'week', 'month']):
+        funnel = compute_funnel(engine, steps, start_date, end_date, g)
+        if len(funnel.labels) * series_per_bucket <= budget:
+            break
+    return funnel
+
+
+def tool_analyze_funnel(args: Dict) -> str:
+    """Multi-step funnel with per-bucket conversion series."""
+    snapshot = get_snapshot()
+    data = snapshot.data
+    if not data:
+        return dumps({"error": "No Mixpanel data available"})
+
+    names = args.get("steps") or []
+    if isinstance(names, str):
+        names = [names]
+    start_date = args.get("start_date")
+    end_date = args.get("end_date")
+    granularity = args.get("granularity")
+    max_tokens = max_tokens_hint(args)
+
+    if len(names) < 2:
+        return dumps({"error": "A funnel needs at least two steps"})
+    if granularity not in (None, 'day', 'week', 'month'):
+        return dumps({"error": f"Unknown granularity '{granularity}', expected day, week or month"})
+
+    steps, matches = [], []
+    for name in names:
+        match = resolve_event(snapshot, str(name))
+        if match.key is None:
+            return fit(not_found(snapshot, "Step", str(name)), max_tokens)
+        steps.append(match.key)
+        matches.append(match)
+
+    try:
+        # The per-pair series are included only when they fit alongside the overall one
+        funnel = _shaped_funnel(get_engine(snapshot), steps, start_date, end_date,
+                                granularity, max_tokens)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+
+    result = {
+        "funnel": " -> ".join(steps),
+        "range": f"{start_date or 'start'} to {end_date or 'end'}",
+        "overall_conversion": format_rate(funnel.overall),
+        "steps": funnel.step_rows(),
+        "granularity": funnel.granularity,
+        "overall_series": funnel.series_dict(),
+    }
+    partial = partial_buckets(funnel.labels, funnel.covered, funnel.length)
+    if partial:
+        result["partial_buckets"] = partial
+    if len(steps) > 2 and (len(steps) - 1) * len(funnel.labels) <= point_budget(max_tokens - 25 * len(steps)):
+        result["step_series"] = {
+            f"{steps[i]} -> {steps[i + 1]}": funnel.series_dict(i) for i in range(len(steps) - 1)
+        }
+    if np.any(funnel.step_conversion > 1):
+        result["note"] = FUNNEL_VOLUME_NOTE
+    return fit(_with_match(result, *matches), max_tokens)
+
+
+def tool_count_unique_users(args: Dict) -> str:
+    """Distinct users over a range, merged from per-day HyperLogLog sketches."""
+    snapshot = get_snapshot()
+    names = args.get("events") or []
+    if isinstance(names, str):
+        names = [names]
+    start_date = args.get("start_date")
+    end_date = args.get("end_date")
+    max_tokens = max_tokens_hint(args)
+
+    if not names:
+        return dumps({"error": "No events given"})
+    try:
+        for day in (start_date, end_date):
+            if day:
+                parse_day(day)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+    if not SKETCH_DB_PATH.exists():
+        return dumps({"error": "No user-level data available; unique users need raw events ingested with ingest.py"})
+
+    keys, matches = [], []
+    for name in names:
+        match = resolve_event(snapshot, str(name)) if snapshot.data else None
+        key = match.key if match is not None and match.key else str(name)
+        if key not in keys:
+            keys.append(key)
+            if match is not None and match.key:
+                matches.append(match)
+
+    sketches, merged = union_sketches(SKETCH_DB_PATH, keys, start_date, end_date)
+    if not sketches:
+        return fit({
+            "error": "No user sketches for these events in this range",
+            "events": keys,
+            "range": f"{start_date or 'start'} to {end_date or 'end'}",
+        }, max_tokens)
+
+    per_event = {key: round(sketch.estimate()) for key, sketch in sketches.items()}
+    union = None
+    for sketch in sketches.values():
+        union = sketch.copy() if union is None else union.merge(sketch)
+    error = union.relative_error
+
+    result = {
+        "events": keys,
+        "range": f"{start_date or 'start'} to {end_date or 'end'}",
+        "unique_users": round(union.estimate()),
+        "per_event": per_event,
+        "error_bound": f"±{error * 100:.2f}% standard error (95% of estimates within ±{2 * error * 100:.1f}%)",
+        "event_days_merged": merged,
+    }
+    if len(sketches) == 2:
+        # Inclusion-exclusion; its error is relative to the union, so small overlaps are rough
+        a, b = per_event.values()
+        result["users_in_both"] = max(0, a + b - result["unique_users"])
+    missing = [key for key in keys if key not in sketches]
+    if missing:
+        result["no_user_data"] = missing
+    return fit(_with_match(result, *matches), max_tokens)
 
 
 def tool_compare_periods(args: Dict) -> str:
     """Compare two time periods."""
-    data = load_mixpanel_data()
+    snapshot = get_snapshot()
+    data = snapshot.data
     if not data:
-        return json.dumps({"error": "No Mixpanel data available"})
+        return dumps({"error": "No Mixpanel data available"})
 
     event_name = args.get("event_name", "")
     p1_start = args.get("period1_start")
     p1_end = args.get("period1_end")
     p2_start = args.get("period2_start")
     p2_end = args.get("period2_end")
+    max_tokens = max_tokens_hint(args)
 
-    events = data.get("events", {})
-    matching_key, event_data = find_event(events, event_name)
+    missing = [key for key in ("period1_start", "period1_end", "period2_start", "period2_end") if not args.get(key)]
+    if missing:
+        return dumps({"error": f"Missing required argument(s): {', '.join(missing)}"})
+
+    match = resolve_event(snapshot, event_name)
+    matching_key = match.key
 
     if not matching_key:
-        return json.dumps({"error": f"Event '{event_name}' not found"})
+        return fit(not_found(snapshot, "Event", event_name), max_tokens)
 
-    def period_total(start, end):
-        return sum(v for d, v in event_data.items() if start <= d <= end)
+    engine = get_engine(snapshot)
+    try:
+        p1_total = engine.total(matching_key, p1_start, p1_end)
+        p2_total = engine.total(matching_key, p2_start, p2_end)
+    except ValueError as e:
+        return dumps({"error": str(e)})
 
-    p1_total = period_total(p1_start, p1_end)
-    p2_total = period_total(p2_start, p2_end)
     change = p1_total - p2_total
     change_pct = (change / p2_total * 100) if p2_total > 0 else 0
 
-    return json.dumps({
+    return fit(_with_match({
         "event": matching_key,
         "period1": {"range": f"{p1_start} to {p1_end}", "total": p1_total},
         "period2": {"range": f"{p2_start} to {p2_end}", "total": p2_total},
@@ -338,7 +903,363 @@ def tool_compare_periods(args: Dict) -> str:
             "percent_change": f"{change_pct:+.1f}%",
             "trend": "up" if change > 0 else "down" if change < 0 else "flat"
         }
-    }, indent=2)
+    }, match), max_tokens)
+
+
+def tool_query_metrics(args: Dict) -> str:
+    """Several events and aggregations over one date range, in one pass."""
+    snapshot = get_snapshot()
+    data = snapshot.data
+    if not data:
+        return dumps({"error": "No Mixpanel data available"})
+
+    names = args.get("events") or []
+    if isinstance(names, str):
+        names = [names]
+    start_date = args.get("start_date")
+    end_date = args.get("end_date")
+    granularity = args.get("granularity")
+    max_tokens = max_tokens_hint(args)
+
+    requested = args.get("aggregations") or ['total', 'avg']
+    if isinstance(requested, str):
+        requested = [requested]
+    aggregations = []
+    for agg in requested:
+        agg = str(agg).lower().replace('-', '_')
+        agg = {'average': 'avg', 'dod': 'dod_change', 'change': 'dod_change'}.get(agg, agg)
+        if agg not in AGGREGATIONS:
+            return dumps({"error": f"Unknown aggregation '{agg}', expected one of {', '.join(AGGREGATIONS)}"})
+        if agg not in aggregations:
+            aggregations.append(agg)
+    if granularity not in (None, 'day', 'week', 'month'):
+        return dumps({"error": f"Unknown granularity '{granularity}', expected day, week or month"})
+
+    keys, matches, unknown = [], [], []
+    for name in names:
+        match = resolve_event(snapshot, str(name))
+        if match.key is None:
+            unknown.append({"event": name, "closest_matches": closest_events(snapshot, str(name), 5)})
+        elif match.key not in keys:
+            keys.append(match.key)
+            matches.append(match)
+    if not keys:
+        return fit({"error": "No matching events", "unknown_events": unknown}, max_tokens)
+
+    engine = get_engine(snapshot)
+    try:
+        stats = engine.range_stats_many(keys, start_date, end_date)
+        # Series points per bucket across all events; pick the finest granularity that fits
+        per_bucket = len(keys) * (('daily' in aggregations) + 2 * ('dod_change' in aggregations))
+        budget = point_budget(max_tokens - 20 * len(keys))
+        for g in ([granularity] if granularity else ['day', 'week', 'month']):
+            labels, sums, present = engine.bucket_matrix([engine.rows[k] for k in keys],
+                                                         start_date, end_date, g)
+            if not per_bucket or len(labels) * per_bucket <= budget:
+                break
+        granularity = g
+        _, covered, length = engine.bucket_days(start_date, end_date, granularity)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+
+    # Even the coarsest buckets overflow: keep the most recent ones
+    if per_bucket and len(labels) * per_bucket > budget:
+        keep = max(2, budget // per_bucket)
+        labels, sums, present = labels[-keep:], sums[:, -keep:], present[:, -keep:]
+        covered, length = covered[-keep:], length[-keep:]
+    # Weeks or months cut by the range or the data's edges are not comparable to full ones
+    full = covered == length
+
+    if 'dod_change' in aggregations and sums.shape[1] > 1:
+        changes = sums[:, 1:] - sums[:, :-1]
+        both = present[:, 1:] & present[:, :-1] & full[1:] & full[:-1]
+        previous = sums[:, :-1].astype(np.float64)
+        percents = np.divide(changes, previous, out=np.zeros(changes.shape), where=previous > 0) * 100
+
+    metrics = {}
+    for i, key in enumerate(keys):
+        row = stats[key].to_dict()
+        entry: Dict[str, Any] = {"days": row["days"]}
+        if 'total' in aggregations:
+            entry["total"] = row["total"]
+        if 'avg' in aggregations:
+            entry["average"] = row["average"]
+        if 'min' in aggregations:
+            entry["min"] = row["min"]
+        if 'max' in aggregations:
+            entry["max"] = row["max"]
+        if 'daily' in aggregations:
+            values = sums[i].tolist()
+            entry["daily"] = {labels[c]: values[c] for c in np.flatnonzero(present[i])}
+        if 'dod_change' in aggregations:
+            cols = np.flatnonzero(both[i]) if sums.shape[1] > 1 else []
+            deltas = changes[i].tolist() if sums.shape[1] > 1 else []
+            entry["change"] = {labels[c + 1]: deltas[c] for c in cols}
+            entry["change_percent"] = {labels[c + 1]: f"{percents[i, c]:+.1f}%" for c in cols}
+        metrics[key] = entry
+
+    result = {
+        "range": f"{start_date or 'start'} to {end_date or 'end'}",
+        "granularity": granularity,
+        "aggregations": aggregations,
+        "metrics": metrics,
+    }
+    if not full.all():
+        result["partial_buckets"] = partial_buckets(labels, covered, length)
+        result["note"] = "Partial buckets hold fewer days and are left out of change comparisons"
+    if unknown:
+        result["unknown_events"] = unknown
+    return fit(_with_match(result, *matches), max_tokens)
+
+
+def tool_detect_anomalies(args: Dict) -> str:
+    """Top anomalous event/days and level shifts over a window, across all events."""
+    snapshot = get_snapshot()
+    if not snapshot.data:
+        return dumps({"error": "No Mixpanel data available"})
+    engine = get_engine(snapshot)
+    if not len(engine.days):
+        return dumps({"error": "No daily data available"})
+    max_tokens = max_tokens_hint(args)
+    top_k = _int_arg(args, "top_k", 10, 1, 100)
+    direction = args.get("direction") if args.get("direction") in ("up", "down") else "both"
+    try:
+        min_z = max(0.0, float(args.get("min_z", 3.0)))
+    except (TypeError, ValueError):
+        min_z = 3.0
+
+    end_date = args.get("end_date")
+    start_date = args.get("start_date")
+    try:
+        if not start_date:
+            last = parse_day(end_date) if end_date else engine.days[-1]
+            start_date = str(last - np.timedelta64(DEFAULT_ANOMALY_DAYS - 1, 'D'))
+        lo, hi = engine.column_range(start_date, end_date)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+
+    rows, matches, unknown = None, [], []
+    names = args.get("events")
+    if names:
+        keys = []
+        for name in (names if isinstance(names, list) else [names]):
+            match = resolve_event(snapshot, str(name))
+            if match.key:
+                matches.append(match)
+                if match.key not in keys:
+                    keys.append(match.key)
+            else:
+                unknown.append(name)
+        if not keys:
+            return fit(not_found(snapshot, "Event", str(unknown[0])), max_tokens)
+        rows = np.array([engine.rows[key] for key in keys])
+
+    model = get_anomaly_model(snapshot)
+    result = {
+        "range": f"{start_date} to {end_date or engine.day_strings[-1]}",
+        "events_scanned": len(engine.names) if rows is None else len(rows),
+        "anomalies": model.top(engine, lo, hi, top_k, min_z, rows, direction),
+        "level_shifts": level_shifts(engine, lo, hi, top_k, min_z=min_z, rows=rows),
+        "method": ANOMALY_METHOD,
+    }
+    if unknown:
+        result["unknown_events"] = unknown
+    return fit(_with_match(result, *matches), max_tokens)
+
+
+# ============= UGC TOOLS =============
+
+UGC_VIEWS_NOTE = ("UGC views are lifetime views of each video, counted on the day it was posted; "
+                  "correlation shows co-movement, not cause")
+BEST_LAG_RULE = (f"Best lag: strongest positive correlation among lags with at least {MIN_BEST_LAG_DAYS} "
+                 f"overlapping days and p < 0.05; several lags are tried, so treat it as a lead, not a finding")
+
+
+def _check_dates(*values: Optional[str]) -> Optional[str]:
+    """Error message for the first unparseable date, or None."""
+    for value in values:
+        if value and np.isnat(parse_posted(value)):
+            return f"Invalid date: {value!r} (expected YYYY-MM-DD)"
+    return None
+
+
+def tool_get_ugc_summary(args: Dict) -> str:
+    """Get UGC summary."""
+    ugc_snapshot = get_ugc_snapshot()
+    data = ugc_snapshot.data
+    if not data:
+        return dumps({"error": "No UGC data available"})
+    index = get_ugc_index(ugc_snapshot)
+    max_tokens = max_tokens_hint(args)
+
+    top = np.argsort(-index.creator_views, kind='stable')[:5]
+    dated = index.sorted_days
+    result = {
+        "scraped_at": data.get("scrapedAt"),
+        "summary": data.get("summary", {}),
+        "video_count": len(index),
+        "creator_count": len(index.creators),
+        "platforms": {
+            platform: len(rows) for platform, rows in zip(index.platforms, index.by_platform)
+        },
+        "posted_range": f"{dated[0]} to {dated[-1]}" if len(dated) else None,
+        "top_creators": [
+            {"creator": index.creator_labels[row],
+             "views": format_views(int(index.creator_views[row])),
+             "posts": int(index.creator_posts[row])}
+            for row in top.tolist()
+        ],
+    }
+    return fit(result, max_tokens)
+
+
+def tool_get_top_videos(args: Dict) -> str:
+    """Get the most viewed videos, optionally filtered."""
+    ugc_snapshot = get_ugc_snapshot()
+    if not ugc_snapshot.data:
+        return dumps({"error": "No UGC data available"})
+    index = get_ugc_index(ugc_snapshot)
+    max_tokens = max_tokens_hint(args)
+    limit = _int_arg(args, "limit", 10, 1, 100)
+    creator, platform = args.get("creator"), args.get("platform")
+    start_date, end_date = args.get("start_date"), args.get("end_date")
+
+    error = _check_dates(start_date, end_date)
+    if error:
+        return dumps({"error": error})
+    if creator and normalize_handle(creator) not in index.creator_rows:
+        return dumps({"error": f"Creator '{creator}' not found", "creators": index.creators[:20]})
+
+    matches = index.select(creator, platform, start_date, end_date)
+    result = {
+        "matching_videos": len(matches),
+        "videos": [index.video(i) for i in matches[:limit].tolist()],
+    }
+    filters = {"creator": creator, "platform": platform, "start_date": start_date, "end_date": end_date}
+    filters = {k: v for k, v in filters.items() if v}
+    if filters:
+        result["filters"] = filters
+    return fit(result, max_tokens)
+
+
+def tool_get_creator_stats(args: Dict) -> str:
+    """Get statistics for one creator, or the top creators."""
+    ugc_snapshot = get_ugc_snapshot()
+    if not ugc_snapshot.data:
+        return dumps({"error": "No UGC data available"})
+    index = get_ugc_index(ugc_snapshot)
+    max_tokens = max_tokens_hint(args)
+    creator = args.get("creator")
+
+    if creator:
+        row = index.creator_rows.get(normalize_handle(creator))
+        if row is None:
+            return dumps({"error": f"Creator '{creator}' not found", "creators": index.creators[:20]})
+        stats = index.creator_stats(row)
+        stats["top_videos"] = [index.video(i) for i in index.by_creator[row][:5].tolist()]
+        return fit(stats, max_tokens)
+
+    limit = _int_arg(args, "limit", 20, 1, 200)
+    rows = np.argsort(-index.creator_views, kind='stable')[:limit]
+    return fit({
+        "creator_count": len(index.creators),
+        "creators": [index.creator_stats(row) for row in rows.tolist()],
+    }, max_tokens)
+
+
+def tool_get_ugc_by_date(args: Dict) -> str:
+    """Get videos posted on a date or in a date range."""
+    ugc_snapshot = get_ugc_snapshot()
+    if not ugc_snapshot.data:
+        return dumps({"error": "No UGC data available"})
+    index = get_ugc_index(ugc_snapshot)
+    max_tokens = max_tokens_hint(args)
+    limit = _int_arg(args, "limit", 20, 1, 200)
+    start_date = args.get("date") or args.get("start_date")
+    end_date = args.get("date") or args.get("end_date")
+
+    error = _check_dates(start_date, end_date)
+    if error:
+        return dumps({"error": error})
+
+    posted = index.date_range(start_date, end_date)
+    days, first = np.unique(index.posted[posted], return_index=True)
+    views_per_day = np.add.reduceat(index.views[posted], first) if len(posted) else []
+    ranked = posted[np.argsort(-index.views[posted], kind='stable')]
+    result = {
+        "range": f"{start_date or 'start'} to {end_date or 'end'}",
+        "video_count": len(posted),
+        "total_views": int(index.views[posted].sum()),
+        "by_day": {str(day): {"videos": int(n), "views": int(v)}
+                   for day, n, v in zip(days, np.diff(np.append(first, len(posted))), views_per_day)},
+        "videos": [index.video(i) for i in ranked[:limit].tolist()],
+    }
+    return fit(result, max_tokens)
+
+
+def _lag_dict(values: np.ndarray) -> Dict[str, Optional[float]]:
+    return {str(lag): (round(float(r), 3) if np.isfinite(r) else None) for lag, r in enumerate(values)}
+
+
+def tool_get_ugc_correlation(args: Dict) -> str:
+    """Correlate daily UGC views with a Mixpanel event at several lags."""
+    snapshot = get_snapshot()
+    ugc_snapshot = get_ugc_snapshot()
+    if not snapshot.data:
+        return dumps({"error": "No Mixpanel data available"})
+    if not ugc_snapshot.data:
+        return dumps({"error": "No UGC data available"})
+    max_tokens = max_tokens_hint(args)
+    event_name = args.get("event_name") or "signup_completed"
+    max_lag = _int_arg(args, "max_lag", 7, 0, MAX_LAG)
+    limit = _int_arg(args, "limit", 10, 1, 100)
+
+    match = resolve_event(snapshot, event_name)
+    if not match.key:
+        return fit(not_found(snapshot, "Event", event_name), max_tokens)
+
+    correlation = get_view_correlations(snapshot, ugc_snapshot)[match.key]
+    r = correlation.r[0, :max_lag + 1]
+    days = correlation.days[:max_lag + 1]
+    result: Dict[str, Any] = {
+        "event": match.key,
+        "correlation_by_lag_days": _lag_dict(r),
+        "days_compared_by_lag": {str(lag): int(n) for lag, n in enumerate(days)},
+        "note": UGC_VIEWS_NOTE,
+        "best_lag_rule": BEST_LAG_RULE,
+    }
+    best, value = correlation.best(0, max_lag)
+    if best is not None:
+        result["best_lag_days"] = best
+        result["best_correlation"] = round(value, 3)
+        result["days_compared"] = int(days[best])
+    elif np.isfinite(r).any():
+        result["best_lag_days"] = None
+        result["significance"] = "No lag has a significant positive correlation"
+    else:
+        result["error"] = "Not enough overlapping days between UGC posts and this event"
+
+    if args.get("by_creator", True):
+        index = get_ugc_index(ugc_snapshot)
+        creators = get_creator_correlations(snapshot, ugc_snapshot, match.key)
+        per_creator = np.where(creators.significant(), creators.r, np.nan)[:, :max_lag + 1]
+        defined = np.isfinite(per_creator).any(axis=1)
+        rows = np.flatnonzero(defined)
+        best_lags = np.nanargmax(per_creator[rows], axis=1) if len(rows) else np.array([], dtype=np.int64)
+        best_r = per_creator[rows, best_lags]
+        order = np.argsort(-best_r, kind='stable')[:limit]
+        result["creators"] = [
+            {"creator": index.creator_labels[row],
+             "best_lag_days": int(lag),
+             "correlation": round(float(value), 3),
+             "days_compared": int(creators.days[lag]),
+             "posts": int(index.creator_posts[row]),
+             "views": format_views(int(index.creator_views[row]))}
+            for row, lag, value in zip(rows[order].tolist(), best_lags[order].tolist(), best_r[order].tolist())
+        ]
+        result["creators_without_significant_correlation"] = int((~defined).sum())
+
+    return fit(_with_match(result, match), max_tokens)
 
 
 # Tool dispatcher
@@ -347,15 +1268,147 @@ TOOL_FUNCTIONS = {
     "get_metric_data": tool_get_metric_data,
     "get_daily_trend": tool_get_daily_trend,
     "calculate_conversion": tool_calculate_conversion,
+    "analyze_funnel": tool_analyze_funnel,
+    "count_unique_users": tool_count_unique_users,
     "compare_periods": tool_compare_periods,
+    "query_metrics": tool_query_metrics,
+    "detect_anomalies": tool_detect_anomalies,
+    "get_ugc_summary": tool_get_ugc_summary,
+    "get_top_videos": tool_get_top_videos,
+    "get_creator_stats": tool_get_creator_stats,
+    "get_ugc_by_date": tool_get_ugc_by_date,
+    "get_ugc_correlation": tool_get_ugc_correlation,
 }
 
 
+# ============= TOOL RESULT CACHE =============
+
+# Arguments that name events; resolved before caching so aliases share an entry
+EVENT_ARGUMENTS = ('event_name', 'start_event', 'end_event', 'events', 'steps')
+
+# Tools whose results depend on the UGC data
+UGC_TOOLS = ('get_ugc_summary', 'get_top_videos', 'get_creator_stats', 'get_ugc_by_date', 'get_ugc_correlation')
+
+# Tools whose results depend on the user sketches
+SKETCH_TOOLS = ('count_unique_users',)
+
+TOOL_CACHE = ToolResultCache(max_entries=TOOL_CACHE_SIZE, ttl=TOOL_CACHE_TTL)
+STORE.register_listener(lambda snapshot: TOOL_CACHE.retain_version(snapshot.version))
+
+
+def _canonicalize_args(snapshot: MetricSnapshot, args: Dict) -> tuple:
+    """Resolve event names in tool arguments. Returns (args, matches)."""
+    canonical = {k: v for k, v in args.items() if v is not None}
+    matches = []
+    for arg in EVENT_ARGUMENTS:
+        value = canonical.get(arg)
+        names = value if isinstance(value, list) else [value]
+        resolved = []
+        for name in names:
+            match = resolve_event(snapshot, name) if isinstance(name, str) else None
+            if match is not None and match.key is not None:
+                matches.append(match)
+                name = match.key
+            resolved.append(name)
+        if arg in canonical:
+            canonical[arg] = resolved if isinstance(value, list) else resolved[0]
+    return canonical, matches
+
+
+def _file_signature(path: Path) -> Optional[List[int]]:
+    """(mtime_ns, size) of a file, or None if it is missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _cache_lookup(name: str, args: Dict) -> tuple:
+    """Returns (cache key, canonical args, matches, cached result or None)."""
+    snapshot = get_snapshot()
+    canonical, matches = _canonicalize_args(snapshot, args if isinstance(args, dict) else {})
+    versioned = dict(canonical)
+    if name in UGC_TOOLS:
+        # Also keyed on the UGC data, which is versioned separately
+        versioned["_ugc_version"] = get_ugc_snapshot().version
+    if name in SKETCH_TOOLS:
+        # And on the sketch DB, which ingest.py rewrites outside the store
+        versioned["_sketch_db"] = _file_signature(SKETCH_DB_PATH)
+    key = (name, json.dumps(versioned, sort_keys=True, default=str), snapshot.version)
+    return key, canonical, matches, TOOL_CACHE.get(key)
+
+
+def _annotate(result: str, matches: List[EventMatch]) -> str:
+    """Add name resolution details for inexact names to a (shared) cached result."""
+    if all(m.method == 'exact' for m in matches):
+        return result
+    try:
+        data = json.loads(result)
+    except json.JSONDecodeError:
+        return result
+    if not isinstance(data, dict):
+        return result
+    return dumps(_with_match(data, *matches))
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
 def execute_tool(name: str, args: Dict) -> str:
-    """Execute a tool by name."""
-    if name in TOOL_FUNCTIONS:
-        return TOOL_FUNCTIONS[name](args)
-    return json.dumps({"error": f"Unknown tool: {name}"})
+    """Execute a tool by name (results are cached per data version)."""
+    if name not in TOOL_FUNCTIONS:
+        return json.dumps({"error": f"Unknown tool: {name}"})
+
+    func = TOOL_FUNCTIONS[name]
+    key, canonical, matches, result = _cache_lookup(name, args)
+    if result is None:
+        if inspect.iscoroutinefunction(func):
+            if _running_loop() is not None:
+                raise RuntimeError(f"Tool '{name}' is async; inside an event loop use await aexecute_tool()")
+            result = asyncio.run(func(canonical))
+        else:
+            result = func(canonical)
+        TOOL_CACHE.put(key, result)
+    return _annotate(result, matches)
+
+
+# Bounded pool shared by all conversations for synchronous tools
+_tool_executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix='agent-tool')
+
+
+async def aexecute_tool(name: str, args: Dict) -> str:
+    """Execute a tool by name without blocking the event loop."""
+    func = TOOL_FUNCTIONS.get(name)
+    if func is None:
+        return json.dumps({"error": f"Unknown tool: {name}"})
+    if not inspect.iscoroutinefunction(func):
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(_tool_executor, ctx.run, execute_tool, name, args)
+
+    key, canonical, matches, result = _cache_lookup(name, args)
+    if result is None:
+        result = await func(canonical)
+        TOOL_CACHE.put(key, result)
+    return _annotate(result, matches)
+
+
+async def _run_tool(name: str, args: Dict) -> str:
+    """Execute a tool, turning timeouts and failures into an error result."""
+    with tracing.span('tool', tool=name, outcome='ok') as span:
+        try:
+            return await asyncio.wait_for(aexecute_tool(name, args), TOOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            span.set(outcome='timeout')
+            return json.dumps({"error": f"Tool '{name}' timed out after {TOOL_TIMEOUT:g}s"})
+        except Exception as e:
+            span.set(outcome='error')
+            return json.dumps({"error": f"Tool '{name}' failed: {e}"})
 
 
 # ============= SYSTEM PROMPT =============
@@ -368,15 +1421,21 @@ You are an AI Chief of Staff providing business intelligence. You have access to
 ## IMPORTANT: Always Use Tools
 - NEVER make up numbers or guess data
 - ALWAYS call tools to get real data before answering
-- Start with get_business_summary if you need to know what metrics are available
-- Use multiple tools if needed to fully answer the question
+- Get everything you need in as FEW calls as possible: use **query_metrics** to fetch several events and aggregations at once, and issue independent calls together in one turn
+- The key events below are known; only call get_business_summary if you need the full list of metrics
 
 ## Available Tools
-1. **get_business_summary** - Overview of all metrics (use first to see what's available!)
-2. **get_metric_data** - Detailed data for a specific event with stats
-3. **get_daily_trend** - Day-over-day changes for recent days
-4. **calculate_conversion** - Funnel conversion between two events
-5. **compare_periods** - Compare metrics between time periods
+1. **query_metrics** - PREFERRED: totals, averages, min/max, daily values and day-over-day changes for several events in one call
+2. **get_business_summary** - Overview of all metrics and what's available
+3. **get_metric_data** - Detailed data for a single event with stats
+4. **get_daily_trend** - Day-over-day changes for recent days
+5. **calculate_conversion** - Conversion between two events, with its daily series
+6. **analyze_funnel** - Multi-step funnel: step-to-step and overall conversion, drop-off and daily series
+7. **count_unique_users** - Distinct users over any date range, for one event or "A or B" (never sum daily counts for this)
+8. **compare_periods** - Compare metrics between time periods
+9. **detect_anomalies** - "What changed?": scans every event at once for unusual days (z-scores) and level shifts
+10. **get_ugc_summary** / **get_top_videos** / **get_creator_stats** / **get_ugc_by_date** - TikTok UGC: overview, top videos, per-creator stats, videos by posting date
+11. **get_ugc_correlation** - Did UGC drive an event (default signups)? Lagged correlation of daily UGC views with the event, overall and per creator
 
 ## Business Context
 - **Product**: ZUAI - Mobile app where students scan homework problems, AI explains step-by-step
@@ -394,111 +1453,482 @@ Current date: 2026-01-30
 """
 
 
+def build_system_prompt(snapshot: Optional[MetricSnapshot] = None, prefetch: bool = PROMPT_PREFETCH) -> str:
+    """The system prompt, optionally followed by the snapshot's data summary."""
+    if not prefetch:
+        return SYSTEM_PROMPT
+    summary = get_data_summary(snapshot or get_snapshot())
+    return f"{SYSTEM_PROMPT}\n{summary}\n" if summary else SYSTEM_PROMPT
+
+
 # ============= AGENT LOOP =============
 
 @dataclass
 class AgentEvent:
     """Event emitted during agent execution."""
-    type: str  # 'thinking', 'tool_call', 'tool_result', 'response', 'error'
+    type: str  # 'route', 'thinking', 'tool_call', 'tool_result', 'response_delta', 'response', 'metrics', 'error'
     content: Any
 
 
-def run_agent(user_message: str, messages: List[Dict] = None) -> Generator[AgentEvent, None, List[Dict]]:
+class AgentInterrupted(Exception):
+    """Raised inside a run when its session is cancelled or runs out of time."""
+
+
+class AgentSession:
+    """Handle for one in-flight agent run: its deadline, cancellation and pinned snapshot."""
+
+    def __init__(self, session_id: str, timeout: Optional[float] = AGENT_TIMEOUT,
+                 snapshot: Optional[MetricSnapshot] = None):
+        self.session_id = session_id
+        self.timeout = timeout
+        self.cancelled = False
+        self.trace = tracing.start_trace(session_id)
+        with tracing.bound(self.trace):
+            self.snapshot = snapshot or STORE.snapshot()
+        self._loop = asyncio.get_running_loop()
+        self._deadline = self._loop.time() + timeout if timeout else None
+        self._tasks: set = set()
+        # Tasks of this run see its snapshot through get_snapshot()
+        self._context = contextvars.copy_context()
+        self._context.run(_pinned_snapshot.set, self.snapshot)
+        self._context.run(tracing.bind, self.trace)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None if unbounded)."""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - self._loop.time())
+
+    def cancel(self) -> None:
+        """Cancel the run. Safe to call from any thread."""
+        self.cancelled = True
+        self._loop.call_soon_threadsafe(self.cancel_tasks)
+
+    def cancel_tasks(self) -> None:
+        """Cancel every task still running for this session."""
+        for task in list(self._tasks):
+            task.cancel()
+
+    def spawn(self, coro: Awaitable) -> asyncio.Task:
+        """Start a task owned by this run."""
+        if asyncio.iscoroutine(coro):
+            task = self._loop.create_task(coro, context=self._context)
+        else:
+            task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def check(self) -> None:
+        """Raise AgentInterrupted if the run was cancelled or is out of time."""
+        if self.cancelled:
+            raise AgentInterrupted('Cancelled')
+        if self.remaining() == 0:
+            raise AgentInterrupted(f'Timed out after {self.timeout:g}s')
+
+    async def guard(self, aw: Awaitable) -> Any:
+        """Await one step of the run, respecting cancellation and the deadline."""
+        self.check()
+        task = self.spawn(aw)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.remaining())
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if not done:
+            task.cancel()
+            raise AgentInterrupted(f'Timed out after {self.timeout:g}s')
+        if task.cancelled():
+            raise AgentInterrupted('Cancelled')
+        return task.result()
+
+
+# Default prompt budget; stale tool results and old turns are compacted to fit
+HISTORY = HistoryManager(budget=HISTORY_TOKEN_BUDGET)
+
+# In-flight runs by session ID, for cancel_session()
+_sessions: Dict[str, AgentSession] = {}
+
+
+def cancel_session(session_id: str) -> bool:
+    """Cancel the in-flight run of a session. Returns False if none is running."""
+    session = _sessions.get(session_id)
+    if session is None:
+        return False
+    session.cancel()
+    return True
+
+
+async def _call_llm(messages: List[Dict], stream: bool = False) -> Any:
+    # Streams end with a usage chunk when tracing, for the token counts
+    extra = {"stream_options": {"include_usage": True}} if stream and tracing.TRACING else {}
+    return await LLM.create(
+        model=MODEL_NAME,
+        messages=messages,
+        tools=TOOLS,
+        tool_choice="auto",
+        temperature=0.7,
+        max_tokens=4096,
+        stream=stream,
+        **extra
+    )
+
+
+def _metrics_event(session: AgentSession, final: bool = False) -> Optional[AgentEvent]:
+    """A 'metrics' event with the spans recorded since the last one (and the run totals if final)."""
+    if session.trace is None:
+        return None
+    spans = session.trace.drain()
+    if not spans and not final:
+        return None
+    content: Dict[str, Any] = {"spans": spans}
+    if final:
+        content["run"] = session.trace.summary()
+    return AgentEvent(type='metrics', content=content)
+
+
+@dataclass
+class _ToolCall:
+    """A tool call requested by the model and, once started, its task."""
+    id: str
+    name: str = ''
+    arguments: str = ''
+    task: Optional[asyncio.Task] = None
+
+    def start(self, session: AgentSession) -> AgentEvent:
+        """Start executing the call and return its tool_call event."""
+        try:
+            args = json.loads(self.arguments)
+        except json.JSONDecodeError:
+            args = {}
+        self.task = session.spawn(_run_tool(self.name, args))
+        return AgentEvent(type='tool_call', content={'name': self.name, 'args': args, 'id': self.id})
+
+
+@dataclass
+class _Turn:
+    """What the model produced in one iteration, and how long the call took."""
+    content: str = ''
+    tool_calls: List[_ToolCall] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    queue_seconds: Optional[float] = None  # Until the response headers (streaming)
+    ttft_seconds: Optional[float] = None  # Until the first content or tool call token
+    usage: Any = None
+
+    def record(self, session: AgentSession, iteration: int, stream: bool, outcome: str) -> None:
+        """Add the call's llm span to the run's trace."""
+        if session.trace is None:
+            return
+        session.trace.add(
+            'llm', time.perf_counter() - self.started, self.started,
+            outcome=outcome, iteration=iteration, stream=stream,
+            queue_seconds=self.queue_seconds, ttft_seconds=self.ttft_seconds,
+            prompt_tokens=getattr(self.usage, 'prompt_tokens', None),
+            completion_tokens=getattr(self.usage, 'completion_tokens', None),
+            tool_calls=len(self.tool_calls),
+        )
+
+
+def _read_completion(response: Any, turn: _Turn) -> None:
+    """Fill a turn from a non-streaming completion."""
+    message = response.choices[0].message
+    turn.content = message.content or ''
+    turn.ttft_seconds = time.perf_counter() - turn.started
+    turn.usage = getattr(response, 'usage', None)
+    for tc in message.tool_calls or []:
+        turn.tool_calls.append(_ToolCall(tc.id, tc.function.name, tc.function.arguments))
+
+
+def _arguments_complete(arguments: str) -> bool:
+    """True once streamed arguments form a complete JSON object."""
+    if not arguments.rstrip().endswith('}'):
+        return False
+    try:
+        return isinstance(json.loads(arguments), dict)
+    except json.JSONDecodeError:
+        return False
+
+
+async def _stream_turn(session: AgentSession, messages: List[Dict],
+                       turn: _Turn) -> AsyncIterator[AgentEvent]:
+    """Stream one completion; each tool call starts once its arguments are complete JSON."""
+    stream = await session.guard(_call_llm(messages, stream=True))
+    turn.queue_seconds = time.perf_counter() - turn.started
+    chunks = stream.__aiter__()
+    by_index: Dict[int, _ToolCall] = {}
+
+    while True:
+        try:
+            chunk = await session.guard(chunks.__anext__())
+        except StopAsyncIteration:
+            break
+        if getattr(chunk, 'usage', None) is not None:
+            turn.usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if turn.ttft_seconds is None and (delta.content or delta.tool_calls):
+            turn.ttft_seconds = time.perf_counter() - turn.started
+
+        if delta.content:
+            turn.content += delta.content
+            yield AgentEvent(type='response_delta', content=delta.content)
+
+        for fragment in delta.tool_calls or []:
+            # Fragments of several calls may interleave; only the index ties them together
+            call = by_index.get(fragment.index)
+            if call is None:
+                call = by_index[fragment.index] = _ToolCall(id=fragment.id or f'call_{len(by_index)}')
+                turn.tool_calls.append(call)
+
+            if fragment.id:
+                call.id = fragment.id
+            if fragment.function is not None:
+                call.name += fragment.function.name or ''
+                call.arguments += fragment.function.arguments or ''
+            if call.task is None and call.name and _arguments_complete(call.arguments):
+                yield call.start(session)
+
+
+async def arun_agent(user_message: str, messages: List[Dict] = None, *,
+                     session_id: Optional[str] = None,
+                     timeout: Optional[float] = AGENT_TIMEOUT,
+                     stream: bool = False,
+                     fast_path: bool = FAST_PATH,
+                     prefetch: bool = PROMPT_PREFETCH,
+                     history: Optional[HistoryManager] = None,
+                     snapshot: Optional[MetricSnapshot] = None) -> AsyncIterator[AgentEvent]:
     """
     Run the agent with tool calling support.
     Yields events during execution for real-time feedback.
-    Returns the updated message history.
+    The message history is updated in place; cancel_session() or `timeout` stop the run.
     """
     if messages is None:
         messages = []
 
-    # Add system prompt if not present
+    history = history or HISTORY
+    session = AgentSession(session_id or f'session_{id(messages)}', timeout, snapshot)
+
+    # Add system prompt if not present; ours is rebuilt if the data changed since
+    with tracing.bound(session.trace):
+        system_prompt = build_system_prompt(session.snapshot, prefetch)
     if not messages or messages[0].get('role') != 'system':
-        messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
+        messages.insert(0, {"role": "system", "content": system_prompt})
+    elif messages[0].get('content', '').startswith(SYSTEM_PROMPT):
+        messages[0] = {"role": "system", "content": system_prompt}
 
     # Add user message
     messages.append({"role": "user", "content": user_message})
 
+    _sessions[session.session_id] = session
     iteration = 0
+    outcome = 'ok'
 
-    while iteration < MAX_ITERATIONS:
-        iteration += 1
-
-        yield AgentEvent(type='thinking', content=f'Iteration {iteration}: Calling LLM...')
-
-        # Call the model
-        try:
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=messages,
-                tools=TOOLS,
-                tool_choice="auto",
-                temperature=0.7,
-                max_tokens=4096
+    try:
+        # Templated questions are answered directly from the data
+        with tracing.bound(session.trace):
+            intent = route_query(user_message, session.snapshot) if fast_path else None
+        if intent is not None:
+            yield AgentEvent(type='route', content={'path': 'fast', 'intent': intent.name})
+            call_id = f'fast_{intent.name}'
+            yield AgentEvent(
+                type='tool_call',
+                content={'name': intent.tool, 'args': intent.args, 'id': call_id}
+            )
+            result = await session.guard(_run_tool(intent.tool, intent.args))
+            yield AgentEvent(
+                type='tool_result',
+                content={'name': intent.tool, 'result': result, 'id': call_id}
             )
-        except Exception as e:
-            yield AgentEvent(type='error', content=f'API Error: {e}')
-            break
 
-        choice = response.choices[0]
-        message = choice.message
-
-        # Check if we have tool calls
-        if message.tool_calls:
-            # Add assistant message with tool calls
-            messages.append({
-                "role": "assistant",
-                "content": message.content or "",
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
+            answer = intent.render(result)
+            if answer is not None:
+                yield AgentEvent(type='response', content=answer)
+                messages.append({"role": "assistant", "content": answer})
+                metrics = _metrics_event(session, final=True)
+                if metrics:
+                    yield metrics
+                return
+            yield AgentEvent(type='route', content={'path': 'llm', 'reason': 'fast path declined'})
+        else:
+            yield AgentEvent(type='route', content={'path': 'llm'})
+
+        while iteration < MAX_ITERATIONS:
+            iteration += 1
+
+            yield AgentEvent(type='thinking', content=f'Iteration {iteration}: Calling LLM...')
+
+            compacted = history.compact(messages)
+            if compacted:
+                yield AgentEvent(
+                    type='thinking',
+                    content=f"Compacted history: {compacted['before']} -> {compacted['after']} tokens"
+                )
+
+            # Call the model
+            turn = _Turn()
+            try:
+                if stream:
+                    async for event in _stream_turn(session, messages, turn):
+                        yield event
+                else:
+                    _read_completion(await session.guard(_call_llm(messages)), turn)
+            except AgentInterrupted:
+                turn.record(session, iteration, stream, 'interrupted')
+                raise
+            except Exception as e:
+                turn.record(session, iteration, stream, 'error')
+                outcome = 'error'
+                yield AgentEvent(type='error', content=f'API Error: {e}')
+                break
+            turn.record(session, iteration, stream, 'ok')
+            metrics = _metrics_event(session)
+            if metrics:
+                yield metrics
+
+            # Check if we have tool calls
+            if turn.tool_calls:
+                # Add assistant message with tool calls
+                messages.append({
+                    "role": "assistant",
+                    "content": turn.content,
+                    "tool_calls": [
+                        {
+                            "id": call.id,
+                            "type": "function",
+                            "function": {
+                                "name": call.name,
+                                "arguments": call.arguments
+                            }
                         }
-                    }
-                    for tc in message.tool_calls
-                ]
-            })
-
-            # Execute each tool call
-            for tool_call in message.tool_calls:
-                tool_name = tool_call.function.name
+                        for call in turn.tool_calls
+                    ]
+                })
+
+                # Dispatch every call not already started while streaming
+                for call in turn.tool_calls:
+                    if call.task is None:
+                        yield call.start(session)
+
+                # Report results as they finish
+                results = {}
                 try:
-                    tool_args = json.loads(tool_call.function.arguments)
-                except json.JSONDecodeError:
-                    tool_args = {}
+                    tasks = {call.task: call for call in turn.tool_calls}
+                    pending = set(tasks)
+                    while pending:
+                        done, pending = await session.guard(
+                            asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        )
+                        session.check()
+                        for task in done:
+                            call = tasks[task]
+                            results[call.id] = task.result()
+
+                            yield AgentEvent(
+                                type='tool_result',
+                                content={'name': call.name, 'result': results[call.id], 'id': call.id}
+                            )
+                finally:
+                    # Every tool_call needs a paired result, even when interrupted,
+                    # added in the order the model asked for them
+                    for call in turn.tool_calls:
+                        messages.append({
+                            "role": "tool",
+                            "tool_call_id": call.id,
+                            "content": results.get(
+                                call.id, json.dumps({"error": "Tool call interrupted"})
+                            )
+                        })
+
+                metrics = _metrics_event(session)
+                if metrics:
+                    yield metrics
+
+                # Continue loop to get next response
+                continue
 
-                yield AgentEvent(
-                    type='tool_call',
-                    content={'name': tool_name, 'args': tool_args}
-                )
+            # No tool calls - we have a final response
+            if turn.content:
+                yield AgentEvent(type='response', content=turn.content)
+                messages.append({"role": "assistant", "content": turn.content})
 
-                # Execute the tool
-                tool_result = execute_tool(tool_name, tool_args)
+            break
 
-                yield AgentEvent(
-                    type='tool_result',
-                    content={'name': tool_name, 'result': tool_result}
-                )
+        metrics = _metrics_event(session, final=True)
+        if metrics:
+            yield metrics
 
-                # Add tool result to messages
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": tool_result
-                })
+    except AgentInterrupted as e:
+        outcome = 'interrupted'
+        yield AgentEvent(type='error', content=f'{e} ({session.session_id})')
+        metrics = _metrics_event(session, final=True)
+        if metrics:
+            yield metrics
+
+    finally:
+        session.cancel_tasks()
+        if session.trace is not None:
+            if outcome == 'ok' and session.cancelled:
+                outcome = 'cancelled'
+            session.trace.add('run', time.perf_counter() - session.trace.started, session.trace.started,
+                              outcome=outcome, iterations=iteration)
+        if _sessions.get(session.session_id) is session:
+            del _sessions[session.session_id]
+
+
+# ============= SYNC WRAPPER =============
+
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
 
-            # Continue loop to get next response
-            continue
 
-        # No tool calls - we have a final response
-        if message.content:
-            yield AgentEvent(type='response', content=message.content)
-            messages.append({"role": "assistant", "content": message.content})
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop thread that drives arun_agent for synchronous callers."""
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='agent-loop', daemon=True).start()
+            _sync_loop = loop
+    return _sync_loop
 
-        break
+
+def run_agent(user_message: str, messages: List[Dict] = None,
+              **options) -> Generator[AgentEvent, None, List[Dict]]:
+    """
+    Run the agent with tool calling support.
+    Yields events during execution for real-time feedback.
+    Returns the updated message history.
+    """
+    if messages is None:
+        messages = []
+
+    loop = _background_loop()
+    events = arun_agent(user_message, messages, **options)
+    step: Optional[asyncio.Task] = None
+
+    async def next_event() -> AgentEvent:
+        nonlocal step
+        step = asyncio.current_task()
+        return await events.__anext__()
+
+    async def close() -> None:
+        # A step can still be running (Ctrl-C while waiting on it), and aclose()
+        # on a running generator raises: cancel the step and let it unwind first
+        if step is not None and not step.done():
+            step.cancel()
+            await asyncio.wait({step})
+        await events.aclose()
+
+    try:
+        while True:
+            try:
+                event = asyncio.run_coroutine_threadsafe(next_event(), loop).result()
+            except StopAsyncIteration:
+                break
+            yield event
+    finally:
+        asyncio.run_coroutine_threadsafe(close(), loop).result()
 
     return messages
 
@@ -534,11 +1964,25 @@ def main():
 
             print()
 
-            # Run agent and display events
-            for event in run_agent(user_input, messages):
-                if event.type == 'thinking':
+            # Run agent and display events, printing the answer as it streams
+            streamed = False
+            for event in run_agent(user_input, messages, stream=True):
+                if event.type == 'route':
+                    if event.content['path'] == 'fast':
+                        print(f"⚡ Fast path: {event.content['intent']}")
+
+                elif event.type == 'thinking':
+                    if streamed:
+                        print()
+                        streamed = False
                     print(f"💭 {event.content}")
 
+                elif event.type == 'response_delta':
+                    if not streamed:
+                        print("\n🤖 Assistant:")
+                        streamed = True
+                    print(event.content, end="", flush=True)
+
                 elif event.type == 'tool_call':
                     print(f"\n🔧 Calling tool: {event.content['name']}")
                     print(f"   Args: {json.dumps(event.content['args'], indent=2)}")
@@ -551,7 +1995,16 @@ def main():
                     print(f"   📊 Result: {result}")
 
                 elif event.type == 'response':
-                    print(f"\n🤖 Assistant:\n{event.content}")
+                    if streamed:
+                        print()
+                    else:
+                        print(f"\n🤖 Assistant:\n{event.content}")
+
+                elif event.type == 'metrics' and 'run' in event.content:
+                    run = event.content['run']
+                    print(f"⏱️  {run['seconds']:.2f}s: LLM {run.get('llm_seconds', 0):.2f}s "
+                          f"({run.get('llm_calls', 0)} calls), tools {run.get('tool_seconds', 0):.2f}s "
+                          f"({run.get('tool_calls', 0)} calls)")
 
                 elif event.type == 'error':
                     print(f"\n❌ Error: {event.content}")
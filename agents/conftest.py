@@ -0,0 +1,28 @@
+"""Pytest configuration for the agent modules."""
+
+import itertools
+
+import pytest
+
+# test_agent.py is a manual script against the live LLM, not a test module
+collect_ignore = ['test_agent.py']
+
+_versions = itertools.count(-1, -1)  # Below any real data version
+
+
+@pytest.fixture
+def pin_data():
+    """Pin a snapshot of {event: {date: value}} data for the tools under test."""
+    import business_agent
+    from metric_store import MetricSnapshot
+
+    tokens = []
+
+    def pin(events, **data):
+        snapshot = MetricSnapshot(version=next(_versions), data={"events": events, **data})
+        tokens.append(business_agent._pinned_snapshot.set(snapshot))
+        return snapshot
+
+    yield pin
+    for token in reversed(tokens):
+        business_agent._pinned_snapshot.reset(token)
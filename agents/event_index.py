@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Event Index - resolves free-text metric names to event keys.
+
+Built once per data version: an exact map over normalized names, an alias
+table for common phrasings ("signups", "dashboard views"), and a trigram
+inverted index that ranks fuzzy candidates with a score in [0, 1].
+"""
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# Below this fuzzy score a name is reported as not found
+MIN_FUZZY_SCORE = 0.35
+
+# Common phrasings -> canonical event. Only aliases whose target exists are used.
+DEFAULT_ALIASES = {
+    'signups': 'signup_completed',
+    'signup': 'signup_completed',
+    'sign_ups': 'signup_completed',
+    'new_users': 'signup_completed',
+    'signup_started': 'signup_start',
+    'registrations': 'successful_registration',
+    'dashboard_views': 'dashboard_viewed',
+    'dashboard': 'dashboard_viewed',
+    'chats': 'chat_messages',
+    'messages': 'chat_messages',
+    'chat_views': 'chat_screen_viewed',
+    'subscription_views': 'subscription_page_viewed',
+    'paywall_views': 'subscription_page_viewed',
+    'subscriptions': 'subscription_order_initiated',
+    'subscription_orders': 'subscription_order_initiated',
+    'orders': 'subscription_order_initiated',
+    'welcome_views': 'welcome_screen_viewed',
+    'retention': 'open_app_within_1_week',
+}
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(name: str) -> str:
+    """Canonical form of an event name: lowercase words joined by '_'."""
+    return _NON_WORD.sub('_', name.lower()).strip('_')
+
+
+def _trigrams(normalized: str) -> List[str]:
+    padded = ' ' + normalized.replace('_', ' ') + ' '
+    return list({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+# ============= RESULTS =============
+
+@dataclass
+class EventMatch:
+    """Outcome of resolving a name: the chosen key, how, and how sure."""
+    query: str
+    key: Optional[str]
+    score: float
+    method: str  # 'exact', 'alias', 'fuzzy' or 'none'
+    candidates: List[Tuple[str, float]] = field(default_factory=list)
+
+    @property
+    def confidence(self) -> str:
+        """Coarse confidence label for humans and the model."""
+        if self.score >= 0.9:
+            return 'high'
+        if self.score >= 0.6:
+            return 'medium'
+        return 'low'
+
+    def to_dict(self) -> Dict:
+        """Summary of the match for tool results."""
+        return {
+            "query": self.query,
+            "matched": self.key,
+            "method": self.method,
+            "score": round(self.score, 3),
+            "confidence": self.confidence,
+        }
+
+
+# ============= INDEX =============
+
+class EventIndex:
+    """Immutable name index over a set of event keys."""
+
+    def __init__(self, names: Iterable[str], aliases: Optional[Dict[str, str]] = None):
+        self.names = list(names)
+        self._keys = set(self.names)
+        self.exact: Dict[str, str] = {}
+        for name in self.names:
+            self.exact.setdefault(normalize(name), name)
+
+        self.aliases: Dict[str, str] = {}
+        for alias, target in (aliases if aliases is not None else DEFAULT_ALIASES).items():
+            key = self.exact.get(normalize(target))
+            if key is not None:
+                self.aliases[normalize(alias)] = key
+
+        postings: Dict[str, List[int]] = defaultdict(list)
+        sizes = np.zeros(len(self.names), dtype=np.float64)
+        for i, name in enumerate(self.names):
+            grams = _trigrams(normalize(name))
+            sizes[i] = len(grams)
+            for gram in grams:
+                postings[gram].append(i)
+        self.postings = {g: np.array(ids, dtype=np.int32) for g, ids in postings.items()}
+        self.sizes = sizes
+
+    def resolve(self, query: str, limit: int = 5) -> EventMatch:
+        """Resolve a name: exact match, then alias, then best trigram candidate."""
+        if query in self._keys:
+            return EventMatch(query, query, 1.0, 'exact')
+
+        normalized = normalize(query)
+        key = self.exact.get(normalized)
+        if key is not None:
+            return EventMatch(query, key, 1.0, 'exact')
+
+        key = self.aliases.get(normalized)
+        if key is None and normalized.endswith('s'):
+            key = self.exact.get(normalized[:-1]) or self.aliases.get(normalized[:-1])
+        if key is not None:
+            return EventMatch(query, key, 0.95, 'alias')
+
+        candidates = self.candidates(normalized, limit=limit)
+        if candidates and candidates[0][1] >= MIN_FUZZY_SCORE:
+            best, score = candidates[0]
+            return EventMatch(query, best, score, 'fuzzy', candidates)
+        return EventMatch(query, None, candidates[0][1] if candidates else 0.0, 'none', candidates)
+
+    def candidates(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Top fuzzy candidates for a name, best first, as (key, score)."""
+        grams = _trigrams(normalize(query))
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists or not self.names:
+            return []
+
+        overlap = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        # Blend Dice similarity with how much of the query the name contains
+        dice = 2 * overlap / (len(grams) + self.sizes)
+        containment = overlap / len(grams)
+        scores = 0.5 * dice + 0.5 * containment
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.names[i], round(float(scores[i]), 3)) for i in top if scores[i] > 0]
+
+
+def get_event_index(snapshot) -> EventIndex:
+    """The event index for a MetricSnapshot, built once per data version."""
+    return snapshot.derive(
+        'event_index', lambda s: EventIndex(s.data.get('events', {}).keys())
+    )
+
+
+def update_event_index(index: EventIndex, snapshot, delta: Dict) -> Optional[EventIndex]:
+    """Incremental hook: keep the index unless the delta added event names."""
+    if all(name in index._keys for name in delta.get('events') or {}):
+        return index
+    return None
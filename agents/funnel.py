@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Funnel Engine - N-step conversion over the date-aligned event matrix.
+
+Conversion is the ratio of step volumes (daily counts, not users), so it
+can exceed 100% when a later event fires more often than the one before it.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from query_engine import QueryEngine
+
+
+@dataclass
+class FunnelResult:
+    """Conversion of an ordered list of steps over one date range."""
+    steps: List[str]
+    totals: np.ndarray  # Per step
+    step_conversion: np.ndarray  # Step i+1 / step i, per adjacent pair (NaN if step i is 0)
+    labels: List[str]  # Bucket labels of the series
+    series: np.ndarray  # Pairs x buckets conversion (NaN where undefined)
+    overall_series: np.ndarray  # Last step / first step per bucket
+    granularity: str
+    covered: np.ndarray  # Days of each bucket inside the range
+    length: np.ndarray  # Days of a full bucket (a partial one covers fewer)
+
+    @property
+    def overall(self) -> float:
+        """Last step over first step for the whole range (NaN if the first is 0)."""
+        return _ratio(self.totals[-1], self.totals[0])
+
+    def step_rows(self) -> List[Dict]:
+        """Per-step totals, conversion from the previous step and drop-off."""
+        rows = []
+        for i, step in enumerate(self.steps):
+            row = {"event": step, "total": self.totals[i].item()}
+            if i > 0:
+                rate = self.step_conversion[i - 1]
+                row["conversion_from_previous"] = format_rate(rate)
+                row["drop_off"] = format_rate(max(0.0, 1 - rate)) if np.isfinite(rate) else "n/a"
+                row["lost"] = max(0, (self.totals[i - 1] - self.totals[i]).item())
+            rows.append(row)
+        return rows
+
+    def series_dict(self, pair: Optional[int] = None) -> Dict[str, str]:
+        """Conversion per bucket for one adjacent pair, or overall if pair is None."""
+        values = self.overall_series if pair is None else self.series[pair]
+        return {self.labels[c]: format_rate(values[c]) for c in np.flatnonzero(np.isfinite(values))}
+
+
+def _ratio(numerator, denominator) -> float:
+    return float(numerator) / float(denominator) if denominator > 0 else float('nan')
+
+
+def format_rate(rate: float) -> str:
+    """A ratio as a percentage string ('n/a' when undefined)."""
+    return f"{rate * 100:.2f}%" if np.isfinite(rate) else "n/a"
+
+
+def compute_funnel(engine: QueryEngine, steps: List[str], start: Optional[str] = None,
+                   end: Optional[str] = None, granularity: str = 'day') -> FunnelResult:
+    """Evaluate a funnel of at least two resolved event names."""
+    if len(steps) < 2:
+        raise ValueError("A funnel needs at least two steps")
+    rows = [engine.rows[step] for step in steps]
+    lo, hi = engine.column_range(start, end)
+    totals = engine.value_cumsum[rows, hi] - engine.value_cumsum[rows, lo]
+    denominators = totals[:-1].astype(np.float64)
+    step_conversion = np.divide(totals[1:], denominators, out=np.full(len(steps) - 1, np.nan),
+                                where=denominators > 0)
+
+    labels, sums, present = engine.bucket_matrix(rows, start, end, granularity)
+    _, covered, length = engine.bucket_days(start, end, granularity)
+    sums = sums.astype(np.float64)
+    # A bucket's rate is defined when both steps have data and the earlier one is non-zero
+    defined = present[1:] & present[:-1] & (sums[:-1] > 0)
+    series = np.divide(sums[1:], sums[:-1], out=np.full(defined.shape, np.nan), where=defined)
+    overall_defined = present[-1] & present[0] & (sums[0] > 0)
+    overall_series = np.divide(sums[-1], sums[0], out=np.full(len(labels), np.nan),
+                               where=overall_defined)
+
+    return FunnelResult(
+        steps=list(steps),
+        totals=totals,
+        step_conversion=step_conversion,
+        labels=list(labels),
+        series=series,
+        overall_series=overall_series,
+        granularity=granularity,
+        covered=covered,
+        length=length,
+    )
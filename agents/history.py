@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+History Manager - keeps the conversation sent to the model under a token budget.
+
+Older tool results are summarized first, then whole earlier turns are folded
+into a running summary; tool calls and their results are always folded together.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('cl100k_base')
+except Exception:  # optional dependency; fall back to a character heuristic
+    _ENCODING = None
+
+
+SUMMARY_HEADER = 'Summary of earlier conversation:'
+COMPACTED_KEY = '_compacted'
+
+# Per-message framing overhead in tokens (role, separators)
+MESSAGE_OVERHEAD = 4
+
+# Token counts remembered by text digest (the texts themselves are not kept)
+TOKEN_CACHE_SIZE = 4096
+
+
+# ============= TOKEN COUNTING =============
+
+_token_counts: 'OrderedDict[bytes, int]' = OrderedDict()
+_token_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """Token count of a string (tiktoken if installed, else ~4 chars/token)."""
+    if not text:
+        return 0
+    if _ENCODING is None:
+        return len(text) // 4 + 1
+    key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    with _token_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = len(_ENCODING.encode(text))
+    with _token_lock:
+        _token_counts[key] = count
+        while len(_token_counts) > TOKEN_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def message_tokens(message: Dict) -> int:
+    """Approximate prompt tokens for one chat message."""
+    tokens = MESSAGE_OVERHEAD + count_tokens(message.get('content') or '')
+    for call in message.get('tool_calls') or []:
+        function = call.get('function', {})
+        tokens += count_tokens(function.get('name', '')) + count_tokens(function.get('arguments', ''))
+    return tokens
+
+
+# ============= SUMMARIES =============
+
+def _shrink(value, depth: int = 0, max_entries: int = 12):
+    if isinstance(value, dict):
+        if depth > 0 and len(value) > max_entries:
+            return f"<{len(value)} entries omitted>"
+        return {k: _shrink(v, depth + 1, max_entries) for k, v in value.items()}
+    if isinstance(value, list):
+        if len(value) > 3:
+            return f"<{len(value)} items omitted>"
+        return [_shrink(v, depth + 1, max_entries) for v in value]
+    return value
+
+
+def summarize_tool_result(content: str, max_chars: int = 600) -> str:
+    """Compact form of a tool result: keeps headline numbers, drops series."""
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return content if len(content) <= max_chars else content[:max_chars] + '...'
+    if isinstance(data, dict) and data.get(COMPACTED_KEY):
+        return content
+
+    shrunk = _shrink(data)
+    if isinstance(shrunk, dict):
+        shrunk = {COMPACTED_KEY: True, **shrunk}
+    summary = json.dumps(shrunk, separators=(',', ':'), default=str)
+    return summary if len(summary) <= max_chars else summary[:max_chars] + '...'
+
+
+def _clip(text: str, limit: int) -> str:
+    text = ' '.join((text or '').split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def summarize_turn(turn: List[Dict]) -> str:
+    """One line per folded turn: the question, tools used and the answer."""
+    question = next((m.get('content', '') for m in turn if m.get('role') == 'user'), '')
+    tools = [
+        call.get('function', {}).get('name', '')
+        for m in turn for call in (m.get('tool_calls') or [])
+    ]
+    answer = next(
+        (m.get('content', '') for m in reversed(turn)
+         if m.get('role') == 'assistant' and m.get('content') and not m.get('tool_calls')),
+        ''
+    )
+    line = f"- User asked: {_clip(question, 200)}"
+    if tools:
+        line += f" | tools: {', '.join(dict.fromkeys(tools))}"
+    if answer:
+        line += f" | answer: {_clip(answer, 300)}"
+    return line
+
+
+# ============= MANAGER =============
+
+class HistoryManager:
+    """Enforces a prompt token budget on a message list, in place."""
+
+    def __init__(self, budget: int = 24000, keep_recent_turns: int = 2,
+                 tool_result_chars: int = 600, max_summary_lines: int = 40):
+        self.budget = budget
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_result_chars = tool_result_chars
+        self.max_summary_lines = max_summary_lines
+
+    def total_tokens(self, messages: List[Dict]) -> int:
+        """Approximate prompt tokens for a whole message list."""
+        return sum(message_tokens(m) for m in messages)
+
+    def compact(self, messages: List[Dict]) -> Optional[Dict]:
+        """Compact `messages` in place if over budget; returns {'before', 'after'} or None."""
+        before = total = self.total_tokens(messages)
+        if total <= self.budget:
+            return None
+
+        # Pass 1: summarize tool results from turns before the current one
+        turns = self._turn_starts(messages)
+        current = turns[-1] if turns else len(messages)
+        for i in range(current):
+            message = messages[i]
+            if message.get('role') != 'tool':
+                continue
+            old = message_tokens(message)
+            message['content'] = summarize_tool_result(message.get('content') or '', self.tool_result_chars)
+            total += message_tokens(message) - old
+            if total <= self.budget:
+                return {'before': before, 'after': total}
+
+        # Pass 2: fold the oldest turns into the running summary
+        while total > self.budget:
+            turns = self._turn_starts(messages)
+            if len(turns) <= self.keep_recent_turns:
+                break
+            start, end = turns[0], turns[1]
+            line = summarize_turn(messages[start:end])
+            removed = sum(message_tokens(m) for m in messages[start:end])
+            del messages[start:end]
+            total -= removed
+            total += self._append_summary(messages, line)
+
+        return {'before': before, 'after': total}
+
+    def _turn_starts(self, messages: List[Dict]) -> List[int]:
+        return [i for i, m in enumerate(messages) if m.get('role') == 'user']
+
+    def _append_summary(self, messages: List[Dict], line: str) -> int:
+        """Add a line to the summary message, creating it after the system prompt."""
+        position = 1 if messages and messages[0].get('role') == 'system' else 0
+        if (len(messages) > position and messages[position].get('role') == 'system'
+                and (messages[position].get('content') or '').startswith(SUMMARY_HEADER)):
+            summary = messages[position]
+            old = message_tokens(summary)
+            lines = summary['content'].split('\n')[1:] + [line]
+            summary['content'] = '\n'.join([SUMMARY_HEADER] + lines[-self.max_summary_lines:])
+            return message_tokens(summary) - old
+
+        summary = {"role": "system", "content": f"{SUMMARY_HEADER}\n{line}"}
+        messages.insert(position, summary)
+        return message_tokens(summary)
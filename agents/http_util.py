@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+HTTP Util - minimal asyncio HTTP/1.1 plumbing for server.py and stub_llm.py.
+
+Just enough of the protocol for local JSON and Server-Sent Events endpoints
+without adding a web framework dependency: request parsing with size
+limits, keep-alive, JSON responses, and chunked SSE streams.
+"""
+
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+REASONS = {
+    200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 408: 'Request Timeout', 409: 'Conflict', 413: 'Payload Too Large',
+    429: 'Too Many Requests', 500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable',
+}
+
+
+class HttpError(Exception):
+    """An error answered with a JSON body: {"error": message}."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]  # Lower-cased names
+    body: bytes = b''
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get('connection', '').lower() != 'close'
+
+    def json(self) -> Dict:
+        """The body as a JSON object (HttpError 400 if it is not one)."""
+        try:
+            data = json.loads(self.body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HttpError(400, "Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        return data
+
+
+async def read_request(reader: asyncio.StreamReader,
+                       max_body: int = MAX_BODY_BYTES) -> Optional[Request]:
+    """Read one request; None when the client closed the connection."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Headers too large")
+    if len(head) > MAX_HEADER_BYTES:
+        raise HttpError(413, "Headers too large")
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise HttpError(400, "Bad Content-Length")
+    if length > max_body:
+        raise HttpError(413, "Body too large")
+    body = await reader.readexactly(length) if length else b''
+
+    url = urlsplit(target)
+    return Request(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body)
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, data: Any,
+                    keep_alive: bool = True, headers: Optional[Dict[str, str]] = None) -> None:
+    body = json.dumps(data, default=str).encode('utf-8')
+    writer.write(_head(status, {
+        'Content-Type': 'application/json',
+        'Content-Length': str(len(body)),
+        'Connection': 'keep-alive' if keep_alive else 'close',
+        **(headers or {}),
+    }) + body)
+    await writer.drain()
+
+
+async def send_text(writer: asyncio.StreamWriter, status: int, text: str,
+                    content_type: str = 'text/plain; charset=utf-8', keep_alive: bool = True) -> None:
+    body = text.encode('utf-8')
+    writer.write(_head(status, {
+        'Content-Type': content_type,
+        'Content-Length': str(len(body)),
+        'Connection': 'keep-alive' if keep_alive else 'close',
+    }) + body)
+    await writer.drain()
+
+
+@dataclass
+class EventStream:
+    """A chunked text/event-stream response."""
+    writer: asyncio.StreamWriter
+    keep_alive: bool = False
+    started: bool = field(default=False, init=False)
+
+    async def start(self, headers: Optional[Dict[str, str]] = None) -> None:
+        self.writer.write(_head(200, {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Transfer-Encoding': 'chunked',
+            'Connection': 'keep-alive' if self.keep_alive else 'close',
+            **(headers or {}),
+        }))
+        self.started = True
+        await self.writer.drain()
+
+    async def send(self, data: Any, event: Optional[str] = None) -> None:
+        """Send one SSE frame; data that is not a string is JSON-encoded."""
+        text = data if isinstance(data, str) else json.dumps(data, default=str)
+        # One data field per line, or a newline in the text would end the frame early
+        lines = ''.join(f"data: {line}\n" for line in text.split('\n'))
+        frame = (f"event: {event}\n" if event else '') + lines + '\n'
+        payload = frame.encode('utf-8')
+        self.writer.write(f"{len(payload):x}\r\n".encode('ascii') + payload + b'\r\n')
+        await self.writer.drain()
+
+    async def end(self) -> None:
+        self.writer.write(b'0\r\n\r\n')
+        await self.writer.drain()
+
+
+async def close_writer(writer: asyncio.StreamWriter) -> None:
+    """Close a connection, ignoring a peer that is already gone."""
+    try:
+        writer.close()
+        await writer.wait_closed()
+    except (ConnectionError, OSError):
+        pass
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Ingest - stream raw Mixpanel exports into the SQLite metric store.
+
+Raw exports are NDJSON, one event per line:
+    {"event": "signup_completed", "properties": {"time": 1769731200, "distinct_id": "...", ...}}
+Lines are streamed and counted per (event, day) in bounded batches, with a
+HyperLogLog sketch of distinct users per event/day.
+
+Usage:
+    python ingest.py export.ndjson.gz [more files...] --db ../data/metrics.db
+    python ingest.py export.ndjson --property platform --property $os
+    python ingest.py ../data/mixpanel-data.json --format json
+Then point the agent at the store with MIXPANEL_DATA_PATH=../data/metrics.db.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from hll import HyperLogLog, hash_id
+from metric_db import MetricDB
+
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent / 'data' / 'metrics.db'
+BATCH_KEYS = 200_000  # Distinct keys held in memory before a flush
+PROGRESS_EVERY = 1_000_000  # Events between progress lines
+MAX_VALUE_LENGTH = 200  # Longer property values are cut
+MAX_SKETCHES = 2048  # Sketches held in memory before a flush (16 KB each)
+
+
+# ============= STATS =============
+
+@dataclass
+class IngestStats:
+    """Counters for one ingest run."""
+    lines: int = 0
+    events: int = 0
+    skipped: int = 0
+    flushes: int = 0
+    last_day: Optional[str] = None  # Latest event day seen (YYYY-MM-DD)
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Events per second so far."""
+        return self.events / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        return (f"{self.events:,} events from {self.lines:,} lines "
+                f"({self.skipped:,} skipped) in {self.elapsed:.1f}s "
+                f"- {self.rate:,.0f} events/sec")
+
+
+# ============= PIPELINE =============
+
+def read_lines(paths: Iterable[str]) -> Iterator[str]:
+    """Yield lines from each file in turn; .gz is decompressed, '-' is stdin."""
+    for path in paths:
+        if path == '-':
+            yield from io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        elif path.endswith('.gz'):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                yield from f
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                yield from f
+
+
+def parse_records(lines: Iterable[str], stats: IngestStats) -> Iterator[Dict]:
+    """Decode NDJSON lines, skipping blank and malformed ones."""
+    for line in lines:
+        stats.lines += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            stats.skipped += 1
+            continue
+        if isinstance(record, dict):
+            yield record
+        else:
+            stats.skipped += 1
+
+
+def event_keys(records: Iterable[Dict], stats: IngestStats, properties: List[str],
+               utc_offset_hours: float = 0.0
+               ) -> Iterator[Tuple[str, str, List[Tuple[str, str]], Optional[str]]]:
+    """Yield (event, day, [(property, value), ...], distinct_id) for each valid record."""
+    offset = int(utc_offset_hours * 3600)
+    day_names: Dict[int, str] = {}  # Day number -> YYYY-MM-DD, formatted once per day
+    for record in records:
+        name = record.get('event')
+        props = record.get('properties') or {}
+        try:
+            ts = float(props['time'])
+        except (KeyError, TypeError, ValueError):
+            stats.skipped += 1
+            continue
+        if not name:
+            stats.skipped += 1
+            continue
+        if ts > 1e11:  # Milliseconds
+            ts /= 1000
+
+        day_number = int(ts + offset) // 86400
+        day = day_names.get(day_number)
+        if day is None:
+            day = datetime.fromtimestamp(day_number * 86400, timezone.utc).date().isoformat()
+            day_names[day_number] = day
+            if stats.last_day is None or day > stats.last_day:
+                stats.last_day = day
+
+        values = []
+        for prop in properties:
+            value = props.get(prop)
+            if value is not None:
+                values.append((prop, str(value)[:MAX_VALUE_LENGTH]))
+        stats.events += 1
+        user = props.get('distinct_id')
+        yield str(name), day, values, (str(user) if user not in (None, '') else None)
+
+
+def aggregate(keys: Iterable[Tuple[str, str, List[Tuple[str, str]], Optional[str]]],
+              stats: IngestStats, batch_keys: int = BATCH_KEYS, sketch_users: bool = True,
+              max_sketches: int = MAX_SKETCHES, progress_every: int = PROGRESS_EVERY
+              ) -> Iterator[Tuple[Counter, Counter, Dict[Tuple[str, str], HyperLogLog]]]:
+    """Count events and sketch users per (event, day), yielding a batch whenever it fills up."""
+    counts: Counter = Counter()
+    property_counts: Counter = Counter()
+    sketches: Dict[Tuple[str, str], HyperLogLog] = {}
+    next_progress = progress_every
+    for name, day, values, user in keys:
+        counts[(name, day)] += 1
+        for prop, value in values:
+            property_counts[(name, prop, value, day)] += 1
+        if sketch_users and user is not None:
+            sketch = sketches.get((name, day))
+            if sketch is None:
+                sketch = sketches[(name, day)] = HyperLogLog()
+            sketch.add_hash(hash_id(user))
+        if len(counts) + len(property_counts) >= batch_keys or len(sketches) >= max_sketches:
+            yield counts, property_counts, sketches
+            counts, property_counts, sketches = Counter(), Counter(), {}
+        if stats.events >= next_progress:
+            print(f"  ... {stats.report()}", file=sys.stderr)
+            next_progress += progress_every
+    if counts or property_counts or sketches:
+        yield counts, property_counts, sketches
+
+
+# ============= INGEST =============
+
+def ingest_ndjson(db: MetricDB, paths: List[str], properties: Optional[List[str]] = None,
+                  utc_offset_hours: float = 0.0, batch_keys: int = BATCH_KEYS,
+                  sketch_users: bool = True, scraped_at: Optional[str] = None) -> IngestStats:
+    """Stream NDJSON exports into the store; scraped_at defaults to the latest event day."""
+    stats = IngestStats()
+    lines = read_lines(paths)
+    records = parse_records(lines, stats)
+    keys = event_keys(records, stats, properties or [], utc_offset_hours)
+    for counts, property_counts, sketches in aggregate(keys, stats, batch_keys, sketch_users):
+        db.add_counts((name, day, n) for (name, day), n in counts.items())
+        if property_counts:
+            db.add_property_counts(
+                (name, prop, value, day, n) for (name, prop, value, day), n in property_counts.items()
+            )
+        if sketches:
+            db.merge_sketches((name, day, sketch) for (name, day), sketch in sketches.items())
+        stats.flushes += 1
+    if scraped_at is None and stats.last_day is not None:
+        stored = db.get_meta('scraped_at')
+        scraped_at = max(stored, stats.last_day) if stored else stats.last_day
+    if scraped_at is not None:
+        db.set_meta(scraped_at=scraped_at)
+    return stats
+
+
+def ingest_json_export(db: MetricDB, path: str) -> IngestStats:
+    """Import the scraped JSON export; its daily totals replace stored values."""
+    stats = IngestStats()
+    with open(path, 'r') as f:
+        data = json.load(f)
+    rows = []
+    for name, series in data.get('events', {}).items():
+        for day, value in series.items():
+            rows.append((name, day, int(value)))
+            stats.events += int(value)
+        stats.lines += 1
+    db.set_counts(rows)
+    db.set_meta(**{
+        key: data[key] for key in ('project_id', 'scraped_at', 'summary') if data.get(key) is not None
+    })
+    stats.flushes = 1
+    return stats
+
+
+# ============= CLI =============
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest Mixpanel exports into the metric store")
+    parser.add_argument('inputs', nargs='+', help="NDJSON export files (.gz ok, '-' for stdin) or a JSON export")
+    parser.add_argument('--db', default=str(DEFAULT_DB_PATH), help="SQLite store to write")
+    parser.add_argument('--format', choices=['auto', 'ndjson', 'json'], default='auto',
+                        help="Input format; auto treats *.json as the scraped export")
+    parser.add_argument('--property', action='append', default=[], dest='properties',
+                        help="Also count per value of this property (repeatable)")
+    parser.add_argument('--utc-offset', type=float, default=0.0,
+                        help="Hours added to event times before bucketing by day")
+    parser.add_argument('--batch-keys', type=int, default=BATCH_KEYS,
+                        help="Distinct keys held in memory before flushing")
+    parser.add_argument('--no-sketches', action='store_true',
+                        help="Skip the per event/day distinct-user sketches")
+    parser.add_argument('--project-id', help="Project id stored with the data")
+    parser.add_argument('--scraped-at', type=date.fromisoformat,
+                        help="Date the export was taken (YYYY-MM-DD); defaults to its latest event day")
+    parser.add_argument('--reset', action='store_true', help="Clear stored counts first")
+    args = parser.parse_args(argv)
+
+    with MetricDB(args.db) as db:
+        if args.reset:
+            db.reset()
+        if args.project_id:
+            db.set_meta(project_id=args.project_id)
+
+        json_inputs = [p for p in args.inputs if args.format == 'json'
+                       or (args.format == 'auto' and p.endswith('.json'))]
+        ndjson_inputs = [p for p in args.inputs if p not in json_inputs]
+
+        for path in json_inputs:
+            stats = ingest_json_export(db, path)
+            print(f"📥 {path}: {stats.lines} events, {stats.events:,} total count")
+        if ndjson_inputs:
+            stats = ingest_ndjson(db, ndjson_inputs, args.properties, args.utc_offset,
+                                  args.batch_keys, not args.no_sketches,
+                                  args.scraped_at.isoformat() if args.scraped_at else None)
+            print(f"📥 {stats.report()} ({stats.flushes} flushes)")
+
+    print(f"✅ Store written to {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Intent Router - deterministic fast path for templated metric questions.
+
+Plans a single tool call for questions like "signups yesterday"; anything
+it is not sure about returns None and goes to the LLM.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from event_index import EventMatch, get_event_index
+
+
+# Fuzzy name matches below this score are left to the LLM
+MIN_MATCH_SCORE = 0.8
+
+# Longest metric phrase (in words) the router will try to resolve
+MAX_METRIC_WORDS = 4
+
+# Words that signal a question needing reasoning rather than a lookup
+_ANALYTICAL = re.compile(
+    r'\b(why|compare|compared|versus|vs|trend|should|recommend|explain|insight|'
+    r'breakdown|break down|correlat\w*|cause|predict|forecast|and|or|per)\b'
+)
+
+_STOPWORDS = {
+    'what', 'were', 'was', 'is', 'are', 'our', 'the', 'how', 'many', 'much',
+    'did', 'do', 'we', 'get', 'got', 'have', 'had', 'show', 'me', 'total',
+    'number', 'of', 'in', 'on', 'for', 'during', 'over', 'give', 'tell',
+    'count', 'a', 'my', 'please', 'there', 'been',
+}
+
+_CONVERSION = re.compile(
+    r'^(?:what(?:\'s| is| was)?\s+)?(?:the\s+|our\s+)?conversion(?:\s+rate)?\s+'
+    r'from\s+(?P<start>.+?)\s+to\s+(?P<end>.+?)$'
+)
+
+
+# ============= PLANS =============
+
+@dataclass
+class Intent:
+    """A planned fast-path answer: one tool call plus a formatter for its result."""
+    name: str
+    tool: str
+    args: Dict
+    format: Callable[[Dict], Optional[str]]
+
+    def render(self, result: str) -> Optional[str]:
+        """Format the tool result, or None if the answer is not trustworthy."""
+        try:
+            data = json.loads(result)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict) or 'error' in data:
+            return None
+        return self.format(data)
+
+
+# ============= DATES =============
+
+def reference_date(snapshot) -> date:
+    """'Today' as far as the data is concerned: the scrape date if known."""
+    scraped_at = snapshot.data.get('scraped_at')
+    if scraped_at:
+        try:
+            return date.fromisoformat(str(scraped_at)[:10])
+        except ValueError:
+            pass
+    return date.today()
+
+
+def _time_window(text: str, today: date) -> Optional[Tuple[str, date, date, str]]:
+    """Find a relative period. Returns (matched phrase, start, end, label)."""
+    match = re.search(r'\byesterday\b', text)
+    if match:
+        day = today - timedelta(days=1)
+        return match.group(0), day, day, 'yesterday'
+
+    match = re.search(r'\btoday\b', text)
+    if match:
+        return match.group(0), today, today, 'today'
+
+    match = re.search(r'\b(?:in\s+the\s+)?(?:last|past|previous)\s+(\d{1,3})\s+days?\b', text)
+    if match:
+        days = int(match.group(1))
+        if days < 1:
+            return None
+        end = today - timedelta(days=1)
+        return match.group(0), end - timedelta(days=days - 1), end, f'the last {days} days'
+
+    match = re.search(r'\b(?:in\s+the\s+)?past\s+week\b', text)
+    if match:
+        end = today - timedelta(days=1)
+        return match.group(0), end - timedelta(days=6), end, 'the past week'
+
+    match = re.search(r'\bthis\s+week\b', text)
+    if match:
+        return match.group(0), today - timedelta(days=today.weekday()), today, 'this week'
+
+    match = re.search(r'\blast\s+week\b', text)
+    if match:
+        start = today - timedelta(days=today.weekday() + 7)
+        return match.group(0), start, start + timedelta(days=6), 'last week'
+
+    match = re.search(r'\bthis\s+month\b', text)
+    if match:
+        return match.group(0), today.replace(day=1), today, 'this month'
+
+    match = re.search(r'\blast\s+month\b', text)
+    if match:
+        end = today.replace(day=1) - timedelta(days=1)
+        return match.group(0), end.replace(day=1), end, 'last month'
+
+    return None
+
+
+# ============= FORMATTERS =============
+
+def _fmt(value) -> str:
+    return f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+
+
+def _format_metric(label: str, start: date, end: date) -> Callable[[Dict], Optional[str]]:
+    def render(data: Dict) -> Optional[str]:
+        stats = data.get('stats', {})
+        if not stats.get('days'):
+            return None
+        event = data['event']
+
+        if start == end:
+            return f"**TL;DR** — {event} {label} ({start}) was **{_fmt(stats['total'])}**."
+
+        daily = data.get('data', {}) if data.get('granularity', 'day') == 'day' else {}
+        peak_day = max(daily, key=daily.get) if daily else None
+        low_day = min(daily, key=daily.get) if daily else None
+        lines = [
+            f"**TL;DR** — {event} over {label} ({start} to {end}) "
+            f"totalled **{_fmt(stats['total'])}**.",
+            "",
+            "**Key Numbers**",
+            f"- Total: {_fmt(stats['total'])}",
+            f"- Daily average: {_fmt(stats['average'])}",
+            f"- Peak: {_fmt(stats['max'])}" + (f" on {peak_day}" if peak_day else ""),
+            f"- Lowest: {_fmt(stats['min'])}" + (f" on {low_day}" if low_day else ""),
+            f"- Days with data: {stats['days']}",
+        ]
+        return "\n".join(lines)
+    return render
+
+
+def _format_conversion(data: Dict) -> Optional[str]:
+    start, end = data['start_event'], data['end_event']
+    if not start.get('total'):
+        return None
+    return "\n".join([
+        f"**TL;DR** — {data['conversion_rate']} conversion from {start['name']} "
+        f"to {end['name']}.",
+        "",
+        "**Key Numbers**",
+        f"- {start['name']}: {_fmt(start['total'])}",
+        f"- {end['name']}: {_fmt(end['total'])}",
+        f"- Conversion: {data['conversion_rate']} (drop-off {data['drop_off']})",
+    ])
+
+
+# ============= ROUTER =============
+
+def _resolve(snapshot, phrase: str) -> Optional[EventMatch]:
+    """Resolve a metric phrase, only accepting confident matches."""
+    words = [w for w in re.findall(r'[\w$:/]+', phrase) if w not in _STOPWORDS]
+    if not words or len(words) > MAX_METRIC_WORDS:
+        return None
+    match = get_event_index(snapshot).resolve(' '.join(words))
+    if match.key is None:
+        return None
+    if match.method == 'fuzzy' and match.score < MIN_MATCH_SCORE:
+        return None
+    return match
+
+
+def route_query(query: str, snapshot) -> Optional[Intent]:
+    """Plan a fast-path answer for a templated question, or None to use the LLM."""
+    if not snapshot.data.get('events'):
+        return None
+
+    text = ' '.join(query.lower().strip().rstrip('?!.').split())
+
+    conversion = _CONVERSION.match(text)
+    if conversion:
+        # The conversion tool works over all days; dated questions go to the LLM
+        if _time_window(text, reference_date(snapshot)):
+            return None
+        start = _resolve(snapshot, conversion.group('start'))
+        end = _resolve(snapshot, conversion.group('end'))
+        if start is None or end is None or start.key == end.key:
+            return None
+        return Intent(
+            name='conversion',
+            tool='calculate_conversion',
+            args={'start_event': start.key, 'end_event': end.key},
+            format=_format_conversion,
+        )
+
+    if _ANALYTICAL.search(text):
+        return None
+
+    window = _time_window(text, reference_date(snapshot))
+    if window is None:
+        return None
+    phrase, start, end, label = window
+
+    match = _resolve(snapshot, text.replace(phrase, ' '))
+    if match is None:
+        return None
+    return Intent(
+        name='metric_on_day' if start == end else 'metric_over_range',
+        tool='get_metric_data',
+        args={'event_name': match.key, 'start_date': start.isoformat(), 'end_date': end.isoformat()},
+        format=_format_metric(label, start, end),
+    )
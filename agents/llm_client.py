@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+LLM Client - pooled chat completions with deadlines, retries, hedging and a
+circuit breaker.
+
+One AsyncOpenAI client per event loop. Transient failures are retried with
+jittered backoff, slow attempts can be hedged past the recent p95, and
+repeated failures open the breaker. Streams are not retried once headers arrive.
+
+Usage:
+    python llm_client.py --calls 50 --concurrency 8        # probe the configured endpoint
+    python stub_llm.py --error-rate 0.2 --slow-rate 0.05 &  # or a faulty local stub
+    MULEROUTER_BASE_URL=http://127.0.0.1:8766/v1 LLM_HEDGE=1 python llm_client.py --calls 200
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:  # Newer openai releases are built on httpx2
+    import httpx2 as httpx
+from openai import (
+    APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, DefaultAsyncHttpxClient, Timeout,
+)
+
+import tracing
+
+
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '90'))  # Seconds per call, across retries
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))  # Seconds to open a connection
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '60'))  # Seconds without a byte from upstream
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '64'))  # Open connections per event loop
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_KEEPALIVE_CONNECTIONS', '32'))  # Idle connections kept
+LLM_KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', '60'))  # Seconds an idle connection is kept
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))  # Retries of a transient failure
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))  # Seconds; doubles per retry
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '8'))  # Seconds; cap of one backoff
+LLM_HEDGE = os.getenv('LLM_HEDGE', '0') != '0'  # Race a second request past the p95 latency
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))  # Answers seen before hedging
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))  # Consecutive failures that open it
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))  # Seconds it stays open
+
+LATENCY_WINDOW = 200  # Recent answer latencies behind the hedge delay
+TRANSIENT_STATUS = {408, 409, 429}  # Besides 5xx
+
+
+@dataclass
+class LLMConfig:
+    timeout: float = LLM_TIMEOUT
+    connect_timeout: float = LLM_CONNECT_TIMEOUT
+    read_timeout: float = LLM_READ_TIMEOUT
+    max_connections: int = LLM_MAX_CONNECTIONS
+    keepalive_connections: int = LLM_KEEPALIVE_CONNECTIONS
+    keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY
+    max_retries: int = LLM_MAX_RETRIES
+    backoff_base: float = LLM_BACKOFF_BASE
+    backoff_max: float = LLM_BACKOFF_MAX
+    hedge: bool = LLM_HEDGE
+    hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES
+    breaker_failures: int = LLM_BREAKER_FAILURES
+    breaker_cooldown: float = LLM_BREAKER_COOLDOWN
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call's overall deadline passed before an answer."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed attempt is worth retrying (and counts against the breaker)."""
+    if isinstance(error, (APITimeoutError, APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in TRANSIENT_STATUS or error.status_code >= 500
+    return False
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header on the error's response, if any."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# ============= CIRCUIT BREAKER =============
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive transient failures; one probe after `cooldown` decides."""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN,
+                 clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.consecutive = 0
+        self.opened = 0  # Times it has opened
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Admit an attempt; raises CircuitOpenError if it must fail fast. True for the probe."""
+        with self._lock:
+            if self.state == 'open':
+                wait = self.cooldown - (self._clock() - self._opened_at)
+                if wait > 0:
+                    raise CircuitOpenError(
+                        f"LLM upstream unavailable ({self.consecutive} consecutive failures); "
+                        f"retrying in {wait:.0f}s"
+                    )
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._probing:
+                    raise CircuitOpenError("LLM upstream recovering; a probe call is in flight")
+                self._probing = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.consecutive += 1
+            self._probing = False
+            if self.state == 'half_open' or (self.state == 'closed' and self.consecutive >= self.failures):
+                self.state = 'open'
+                self.opened += 1
+                self._opened_at = self._clock()
+
+    def release(self, probe: bool) -> None:
+        """An attempt ended without an outcome (cancelled); free the probe slot."""
+        if probe:
+            with self._lock:
+                self._probing = False
+
+
+class LatencyWindow:
+    """Recent answer latencies, for the hedge delay."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._values: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# ============= CLIENT =============
+
+class LLMClient:
+    """Chat completions through per-loop pooled clients, with the policies above."""
+
+    def __init__(self, api_key: str, base_url: str, config: Optional[LLMConfig] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.config = config or LLMConfig()
+        self.breaker = CircuitBreaker(self.config.breaker_failures, self.config.breaker_cooldown)
+        self.latency = LatencyWindow()
+        self.counts: Counter = Counter()
+        self._clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]' = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def client(self) -> AsyncOpenAI:
+        """The AsyncOpenAI client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            c = self.config
+            timeout = Timeout(c.read_timeout, connect=c.connect_timeout)
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,  # Retried here, under the call's deadline
+                timeout=timeout,
+                http_client=DefaultAsyncHttpxClient(
+                    timeout=timeout,
+                    limits=httpx.Limits(max_connections=c.max_connections,
+                                        max_keepalive_connections=c.keepalive_connections,
+                                        keepalive_expiry=c.keepalive_expiry),
+                ),
+            )
+            self._clients[loop] = client
+        return client
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds before a hedge request, or None when not hedging."""
+        c = self.config
+        if not c.hedge or self.breaker.state != 'closed' or len(self.latency) < c.hedge_min_samples:
+            return None
+        return self.latency.quantile(0.95)
+
+    def backoff(self, retry: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff, or the upstream's Retry-After."""
+        after = retry_after(error)
+        if after is not None:
+            return min(after, self.config.backoff_max)
+        return random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2 ** retry))
+
+    async def create(self, deadline: Optional[float] = None, **kwargs) -> Any:
+        """chat.completions.create(**kwargs) within `deadline` seconds (LLM_TIMEOUT at most)."""
+        timeout = self.config.timeout if deadline is None else min(deadline, self.config.timeout)
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        self.counts['calls'] += 1
+        retry = 0
+        while True:
+            remaining = end - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                return await self._hedged(kwargs, remaining)
+            except CircuitOpenError:
+                self.counts['rejected'] += 1
+                raise
+            except Exception as e:
+                delay = self.backoff(retry, e) if is_transient(e) else None
+                if delay is None or retry >= self.config.max_retries or loop.time() + delay >= end:
+                    self.counts['failed'] += 1
+                    if isinstance(e, asyncio.TimeoutError) and loop.time() >= end - 1e-3:
+                        raise DeadlineExceeded(f"LLM call exceeded its {timeout:g}s deadline") from e
+                    raise
+            self.counts['retries'] += 1
+            retry += 1
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, kwargs: Dict, timeout: float, kind: str = 'primary') -> Any:
+        """One request, feeding the breaker and the latency window."""
+        probe = self.breaker.allow()
+        started = time.perf_counter()
+        outcome = 'cancelled'
+        try:
+            response = await asyncio.wait_for(self.client().chat.completions.create(**kwargs), timeout)
+            outcome = 'ok'
+        except Exception as e:
+            if is_transient(e):
+                outcome = 'failed'
+                self.breaker.failure()
+            else:
+                # Upstream answered; the request itself was refused
+                outcome = 'rejected'
+                self.breaker.success()
+            raise
+        finally:
+            if outcome == 'cancelled':
+                self.breaker.release(probe)
+            tracing.record('llm_attempt', time.perf_counter() - started, started, kind=kind, outcome=outcome)
+        self.breaker.success()
+        self.latency.add(time.perf_counter() - started)
+        return response
+
+    async def _hedged(self, kwargs: Dict, timeout: float) -> Any:
+        """An attempt, raced by a second one if it is slower than the recent p95."""
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return await self._attempt(kwargs, timeout)
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        primary = asyncio.ensure_future(self._attempt(kwargs, timeout))
+        tasks = {primary}
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.counts['hedges'] += 1
+                tasks.add(asyncio.ensure_future(self._attempt(kwargs, end - loop.time(), 'hedge')))
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not primary:
+                            self.counts['hedge_wins'] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    # Both answered; close the losing stream's connection
+                    close = getattr(task.result(), 'close', None)
+                    if close is not None:
+                        await close()
+
+    def stats(self) -> Dict:
+        p50, p95 = self.latency.quantile(0.5), self.latency.quantile(0.95)
+        return {
+            **{k: self.counts.get(k, 0) for k in ('calls', 'retries', 'failed', 'rejected', 'hedges', 'hedge_wins')},
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "p50_seconds": round(p50, 4) if p50 is not None else None,
+            "p95_seconds": round(p95, 4) if p95 is not None else None,
+            "hedge_delay_seconds": self.hedge_delay(),
+        }
+
+
+# ============= CLI =============
+
+async def probe(llm: LLMClient, model: str, calls: int, concurrency: int, stream: bool) -> List[Dict]:
+    """Small completions through the client; one record per call."""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> Dict:
+        async with slots:
+            started = time.perf_counter()
+            try:
+                response = await llm.create(model=model, max_tokens=16, stream=stream,
+                                            messages=[{"role": "user", "content": f"Reply OK ({i})"}])
+                if stream:
+                    async for _ in response:
+                        pass
+                return {"ok": True, "seconds": time.perf_counter() - started}
+            except Exception as e:
+                return {"ok": False, "seconds": time.perf_counter() - started, "error": type(e).__name__}
+
+    return await asyncio.gather(*(one(i) for i in range(calls)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Probe the configured LLM endpoint through LLMClient")
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--stream', action='store_true')
+    args = parser.parse_args(argv)
+
+    from business_agent import LLM, MODEL_NAME
+    print(f"🔌 {args.calls} calls to {LLM.base_url} ({MODEL_NAME}), {args.concurrency} at a time")
+    results = asyncio.run(probe(LLM, MODEL_NAME, args.calls, args.concurrency, args.stream))
+
+    ok = [r["seconds"] for r in results if r["ok"]]
+    errors = Counter(r["error"] for r in results if not r["ok"])
+    if ok:
+        print(f"✅ {len(ok)} ok: p50 {statistics.median(ok):.3f}s, "
+              f"max {max(ok):.3f}s")
+    if errors:
+        print(f"❌ {sum(errors.values())} failed: " + ", ".join(f"{k} x{n}" for k, n in errors.most_common()))
+    print(f"📊 {LLM.stats()}")
+    return 0 if not errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Measure Prefetch - latency saved by the data summary in the system prompt.
+
+Runs the same questions through the agent with prompt prefetch off and on
+(fast path disabled, fresh conversation each run) against the configured
+LLM endpoint, and reports LLM round trips, tool calls and wall time per
+question, plus the p50 / mean saving.
+
+Usage:
+    python measure_prefetch.py                 # default questions, 3 runs each
+    python measure_prefetch.py --runs 5 "What were signups yesterday?"
+    python measure_prefetch.py --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from business_agent import SYSTEM_PROMPT, arun_agent, build_system_prompt
+from output_shaping import estimate_tokens
+
+
+DEFAULT_QUESTIONS = [
+    "What metrics do we track?",
+    "How are signups doing?",
+    "What were our signups yesterday?",
+    "Give me an overview of the business",
+    "How many subscription orders did we get in the last 30 days?",
+]
+
+
+@dataclass
+class Run:
+    """One agent run."""
+    question: str
+    prefetch: bool
+    seconds: float
+    llm_calls: int
+    tool_calls: int
+    summary_calls: int  # get_business_summary calls
+    error: Optional[str] = None
+
+
+async def measure(question: str, prefetch: bool) -> Run:
+    run = Run(question, prefetch, 0.0, 0, 0, 0)
+    started = time.perf_counter()
+    async for event in arun_agent(question, [], fast_path=False, prefetch=prefetch):
+        if event.type == 'thinking' and str(event.content).startswith('Iteration'):
+            run.llm_calls += 1
+        elif event.type == 'tool_call':
+            run.tool_calls += 1
+            if event.content['name'] == 'get_business_summary':
+                run.summary_calls += 1
+        elif event.type == 'error':
+            run.error = str(event.content)
+    run.seconds = time.perf_counter() - started
+    return run
+
+
+def summarize(runs: List[Run]) -> Dict:
+    """Per-mode medians and means over successful runs."""
+    report = {}
+    for prefetch in (False, True):
+        ok = [r for r in runs if r.prefetch == prefetch and r.error is None]
+        if not ok:
+            continue
+        report['on' if prefetch else 'off'] = {
+            "runs": len(ok),
+            "p50_seconds": round(statistics.median(r.seconds for r in ok), 3),
+            "mean_seconds": round(statistics.mean(r.seconds for r in ok), 3),
+            "mean_llm_calls": round(statistics.mean(r.llm_calls for r in ok), 2),
+            "mean_tool_calls": round(statistics.mean(r.tool_calls for r in ok), 2),
+            "summary_calls": sum(r.summary_calls for r in ok),
+        }
+    if 'on' in report and 'off' in report:
+        off, on = report['off'], report['on']
+        report["saved"] = {
+            "p50_seconds": round(off["p50_seconds"] - on["p50_seconds"], 3),
+            "mean_seconds": round(off["mean_seconds"] - on["mean_seconds"], 3),
+            "mean_llm_calls": round(off["mean_llm_calls"] - on["mean_llm_calls"], 2),
+        }
+    return report
+
+
+async def main_async(questions: List[str], runs: int) -> List[Run]:
+    results = []
+    for question in questions:
+        for i in range(runs):
+            # Alternate the order so drift in endpoint latency hits both modes
+            for prefetch in ((False, True) if i % 2 == 0 else (True, False)):
+                run = await measure(question, prefetch)
+                results.append(run)
+                flag = "on " if prefetch else "off"
+                status = f"❌ {run.error}" if run.error else f"{run.seconds:6.2f}s"
+                print(f"  prefetch {flag} | {status} | {run.llm_calls} LLM, "
+                      f"{run.tool_calls} tools | {question}")
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure latency saved by prompt prefetch")
+    parser.add_argument('questions', nargs='*', help="Questions to ask (default: a built-in set)")
+    parser.add_argument('--runs', type=int, default=3, help="Runs per question and mode")
+    parser.add_argument('--json', help="Also write runs and summary to this file")
+    args = parser.parse_args(argv)
+
+    questions = args.questions or DEFAULT_QUESTIONS
+    prompt = build_system_prompt(prefetch=True)
+    print(f"📏 System prompt: {estimate_tokens(SYSTEM_PROMPT)} tokens static, "
+          f"{estimate_tokens(prompt)} with the data summary")
+    print(f"🔁 {len(questions)} question(s) x {args.runs} run(s) x 2 modes\n")
+
+    runs = asyncio.run(main_async(questions, args.runs))
+    report = summarize(runs)
+    print()
+    for mode in ('off', 'on'):
+        if mode in report:
+            r = report[mode]
+            print(f"📊 prefetch {mode:3}: p50 {r['p50_seconds']:.2f}s, mean {r['mean_seconds']:.2f}s, "
+                  f"{r['mean_llm_calls']:.2f} LLM calls/run, {r['summary_calls']} summary calls")
+    if 'saved' in report:
+        saved = report['saved']
+        print(f"✅ Saved: p50 {saved['p50_seconds']:.2f}s, mean {saved['mean_seconds']:.2f}s, "
+              f"{saved['mean_llm_calls']:.2f} LLM calls per run")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"summary": report, "runs": [asdict(r) for r in runs]}, f, indent=2)
+        print(f"💾 Wrote {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Metric DB - compact SQLite store of per-event daily counts.
+
+Loaded into the same shape as mixpanel-data.json; property breakdowns appear
+as events named "<event> [<property>=<value>]".
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from hll import HyperLogLog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS event_daily (
+    event TEXT NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (event, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS event_property_daily (
+    event TEXT NOT NULL,
+    property TEXT NOT NULL,
+    value TEXT NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (event, property, value, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS event_daily_sketch (
+    event TEXT NOT NULL,
+    day TEXT NOT NULL,
+    precision INTEGER NOT NULL,
+    registers BLOB NOT NULL,
+    PRIMARY KEY (event, day)
+) WITHOUT ROWID;
+"""
+
+DB_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+
+def property_event_name(event: str, prop: str, value: str) -> str:
+    """Name under which a property breakdown is exposed to the tools."""
+    return f"{event} [{prop}={value}]"
+
+
+# ============= WRITER =============
+
+class MetricDB:
+    """Writer for the SQLite metric store."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> 'MetricDB':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def reset(self) -> None:
+        """Delete all counts (metadata is kept)."""
+        with self.conn:
+            self.conn.execute("DELETE FROM event_daily")
+            self.conn.execute("DELETE FROM event_property_daily")
+            self.conn.execute("DELETE FROM event_daily_sketch")
+
+    def add_counts(self, rows: Iterable[Tuple[str, str, int]]) -> None:
+        """Add (event, day, count) rows onto existing totals."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO event_daily (event, day, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (event, day) DO UPDATE SET count = count + excluded.count",
+                rows
+            )
+
+    def set_counts(self, rows: Iterable[Tuple[str, str, int]]) -> None:
+        """Write (event, day, count) rows, replacing existing values."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO event_daily (event, day, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (event, day) DO UPDATE SET count = excluded.count",
+                rows
+            )
+
+    def add_property_counts(self, rows: Iterable[Tuple[str, str, str, str, int]]) -> None:
+        """Add (event, property, value, day, count) rows onto existing totals."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO event_property_daily (event, property, value, day, count) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (event, property, value, day) DO UPDATE SET count = count + excluded.count",
+                rows
+            )
+
+    def merge_sketches(self, sketches: Iterable[Tuple[str, str, HyperLogLog]]) -> None:
+        """Merge (event, day, sketch) into the stored sketches."""
+        with self.conn:
+            for event, day, sketch in sketches:
+                row = self.conn.execute(
+                    "SELECT precision, registers FROM event_daily_sketch WHERE event = ? AND day = ?",
+                    (event, day)
+                ).fetchone()
+                if row is not None:
+                    sketch = HyperLogLog.from_bytes(row[1], row[0]).merge(sketch)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO event_daily_sketch (event, day, precision, registers) "
+                    "VALUES (?, ?, ?, ?)",
+                    (event, day, sketch.precision, sketch.to_bytes())
+                )
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """A stored metadata value, or None."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, **values) -> None:
+        """Store metadata; non-string values are saved as JSON."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                [(k, v if isinstance(v, str) else json.dumps(v)) for k, v in values.items()]
+            )
+
+
+# ============= LOADER =============
+
+def load_metric_db(path: Path) -> Dict:
+    """Load the store into the mixpanel-data.json shape."""
+    conn = sqlite3.connect(f"file:{Path(path)}?mode=ro", uri=True)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        events: Dict[str, Dict[str, int]] = {}
+        for event, day, count in conn.execute(
+                "SELECT event, day, count FROM event_daily ORDER BY event, day"):
+            events.setdefault(event, {})[day] = count
+        for event, prop, value, day, count in conn.execute(
+                "SELECT event, property, value, day, count FROM event_property_daily "
+                "ORDER BY event, property, value, day"):
+            events.setdefault(property_event_name(event, prop, value), {})[day] = count
+        first, last = conn.execute("SELECT MIN(day), MAX(day) FROM event_daily").fetchone()
+    finally:
+        conn.close()
+
+    try:
+        summary = json.loads(meta.get('summary') or '{}')
+    except json.JSONDecodeError:
+        summary = {}
+    return {
+        "project_id": meta.get('project_id'),
+        "scraped_at": meta.get('scraped_at') or last,
+        "date_range": f"{first} to {last}" if first else None,
+        "events": events,
+        "summary": summary,
+        "available_events": sorted(events),
+    }
+
+
+def union_sketches(path: Path, events: List[str], start: Optional[str] = None,
+                   end: Optional[str] = None) -> Tuple[Dict[str, HyperLogLog], int]:
+    """Merge each event's daily sketches over start..end: ({event: sketch}, event-days merged)."""
+    query = ("SELECT event, precision, registers FROM event_daily_sketch WHERE event IN (%s)"
+             % ','.join('?' * len(events)))
+    params: List = list(events)
+    if start:
+        query += " AND day >= ?"
+        params.append(start)
+    if end:
+        query += " AND day <= ?"
+        params.append(end)
+
+    sketches: Dict[str, HyperLogLog] = {}
+    merged = 0
+    conn = sqlite3.connect(f"file:{Path(path)}?mode=ro", uri=True)
+    try:
+        for event, precision, blob in conn.execute(query, params):
+            sketch = HyperLogLog.from_bytes(blob, precision)
+            if event in sketches:
+                sketches[event].merge(sketch)
+            else:
+                sketches[event] = sketch
+            merged += 1
+    except sqlite3.OperationalError:
+        # Store written before sketches existed
+        return {}, 0
+    finally:
+        conn.close()
+    return sketches, merged
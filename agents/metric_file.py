@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Metric File - versioned binary format for the event data, opened with mmap.
+
+Layout (little-endian, every section aligned to 64 bytes):
+    header         magic, format version, value kind, counts, section offsets
+    name table     uint32 offsets (n_events + 1) followed by UTF-8 names
+    metadata       JSON: project_id, scraped_at, date_range, summary, ...
+    date axis      int64 days since epoch (n_days)
+    values         int64 or float64, n_events x n_days, row per event
+    present        uint8 presence mask, n_events x n_days
+    value cumsum   n_events x (n_days + 1) prefix sums with a leading zero
+    count cumsum   int64, n_events x (n_days + 1)
+
+Sections are wrapped in read-only NumPy views, so nothing is parsed up front.
+
+Usage:
+    python metric_file.py ../data/mixpanel-data.json ../data/mixpanel-data.bmet
+"""
+
+import json
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from query_engine import EngineEvents, QueryEngine
+
+
+MAGIC = b'BOSMETRC'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+METRIC_FILE_SUFFIXES = ('.bmet',)
+
+# magic, format version, value kind, reserved, n_events, n_days, then
+# names offset/length, meta offset/length, days, values, present,
+# value cumsum and count cumsum offsets
+HEADER = struct.Struct('<8sHHIQQ9Q')
+
+VALUE_KINDS = {0: np.dtype('<i8'), 1: np.dtype('<f8')}
+
+
+class MetricFileError(ValueError):
+    """The file is not a metric file this version can read."""
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+# ============= WRITER =============
+
+def write_metric_file(path: Path, engine: QueryEngine, meta: Dict) -> None:
+    """Write an engine's columns and a metadata dict to path."""
+    names = [n.encode('utf-8') for n in engine.names]
+    name_offsets = np.zeros(len(names) + 1, dtype='<u4')
+    np.cumsum([len(n) for n in names], out=name_offsets[1:])
+    name_table = name_offsets.tobytes() + b''.join(names)
+    meta_blob = json.dumps(meta, default=str).encode('utf-8')
+
+    value_kind = 0 if engine.values.dtype.kind in 'iub' else 1
+    sections: List[bytes] = [
+        name_table,
+        meta_blob,
+        engine.days.astype('<i8').tobytes(),
+        np.ascontiguousarray(engine.values, dtype=VALUE_KINDS[value_kind]).tobytes(),
+        np.ascontiguousarray(engine.present, dtype=np.uint8).tobytes(),
+        np.ascontiguousarray(engine.value_cumsum, dtype=VALUE_KINDS[value_kind]).tobytes(),
+        np.ascontiguousarray(engine.count_cumsum, dtype='<i8').tobytes(),
+    ]
+
+    offsets = []
+    position = _align(HEADER.size)
+    for blob in sections:
+        offsets.append(position)
+        position = _align(position + len(blob))
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, value_kind, 0, len(engine.names), len(engine.days),
+        offsets[0], len(name_table), offsets[1], len(meta_blob), *offsets[2:]
+    )
+
+    # Write to a temp file and rename so readers never map a partial file
+    tmp = Path(str(path) + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        for offset, blob in zip(offsets, sections):
+            f.seek(offset)
+            f.write(blob)
+    tmp.replace(path)
+
+
+# ============= READER =============
+
+def open_metric_file(path: Path) -> Tuple[QueryEngine, Dict]:
+    """Map a metric file and return (engine over its columns, metadata)."""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise MetricFileError(f"{path} is too short to be a metric file")
+    (magic, version, value_kind, _, n_events, n_days,
+     names_off, names_len, meta_off, meta_len,
+     days_off, values_off, present_off, vcum_off, ccum_off) = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise MetricFileError(f"{path} is not a metric file")
+    if version != FORMAT_VERSION:
+        raise MetricFileError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+    if value_kind not in VALUE_KINDS:
+        raise MetricFileError(f"{path} has unknown value kind {value_kind}")
+
+    mm = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def section(offset: int, dtype, shape) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        return mm[offset:offset + count * dtype.itemsize].view(dtype).reshape(shape)
+
+    name_offsets = section(names_off, '<u4', (n_events + 1,))
+    name_blob = bytes(mm[names_off + name_offsets.nbytes:names_off + names_len])
+    names = [name_blob[name_offsets[i]:name_offsets[i + 1]].decode('utf-8') for i in range(n_events)]
+    meta = json.loads(bytes(mm[meta_off:meta_off + meta_len]))
+
+    dtype = VALUE_KINDS[value_kind]
+    engine = QueryEngine(
+        names,
+        section(days_off, '<i8', (n_days,)).view('datetime64[D]'),
+        section(values_off, dtype, (n_events, n_days)),
+        section(present_off, np.uint8, (n_events, n_days)).view(bool),
+        value_cumsum=section(vcum_off, dtype, (n_events, n_days + 1)),
+        count_cumsum=section(ccum_off, '<i8', (n_events, n_days + 1)),
+    )
+    return engine, meta
+
+
+def load_metric_file(path: Path) -> Dict:
+    """Load a metric file into the mixpanel-data.json shape, backed by the mapped columns."""
+    engine, meta = open_metric_file(path)
+    data = dict(meta)
+    data['events'] = EngineEvents(engine)
+    data.setdefault('available_events', list(engine.names))
+    return data
+
+
+# ============= CONVERTER =============
+
+def convert(source: Path, target: Path) -> Dict:
+    """Convert a JSON export (or any loadable data file) to a metric file."""
+    from metric_store import load_data_file
+
+    data = load_data_file(source)
+    events = data.get('events', {})
+    engine = events.engine if isinstance(events, EngineEvents) else QueryEngine.from_events(events)
+    meta = {key: value for key, value in data.items() if key != 'events'}
+    write_metric_file(target, engine, meta)
+    return {"events": len(engine.names), "days": len(engine.days), "bytes": Path(target).stat().st_size}
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) != 2:
+        print("Usage: python metric_file.py <source.json|.db> <target.bmet>")
+        return 1
+    source, target = Path(argv[0]), Path(argv[1])
+    info = convert(source, target)
+    print(f"✅ Wrote {target}: {info['events']} events x {info['days']} days, {info['bytes']:,} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Metric Store - process-wide, versioned view of the Mixpanel export.
+
+The data file is parsed once and re-read only when its mtime or size
+changes; each load is published as a new immutable MetricSnapshot.
+
+Daily refreshes go through apply_delta(), which appends to a delta log next
+to the data file; compact() folds the log back into the file.
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metric_db import DB_SUFFIXES, MetricDB, load_metric_db, property_event_name
+from metric_file import METRIC_FILE_SUFFIXES, load_metric_file, write_metric_file
+from query_engine import EngineEvents, QueryEngine, parse_day
+import tracing
+
+
+DELTA_LOG_SUFFIX = '.delta.ndjson'
+COMPACT_DELTA_BYTES = int(float(os.getenv('METRIC_DELTA_COMPACT_MB', '8')) * 2 ** 20)  # Delta log size that triggers compaction
+
+
+# ============= SNAPSHOTS =============
+
+@dataclass
+class MetricSnapshot:
+    """One immutable, versioned load of the data file."""
+    version: int
+    data: Dict
+    source: Optional[Path] = None
+    signature: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of the source
+    delta_offset: int = 0  # Bytes of the delta log merged into this snapshot
+    loaded_at: float = field(default_factory=time.time)
+    _derived: Dict[str, Any] = field(default_factory=dict, repr=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    def derive(self, key: str, factory: Callable[['MetricSnapshot'], Any]) -> Any:
+        """Return a structure derived from this snapshot, building it on first use."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._derived:
+                # Keys may carry a version suffix ('name:version'); label by name
+                with tracing.span('data_load', kind='derived', source=key.split(':')[0]):
+                    self._derived[key] = factory(self)
+            return self._derived[key]
+
+
+# ============= LOADERS =============
+
+def load_json_file(path: Path) -> Dict:
+    """Parse a JSON data file."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_data_file(path: Path) -> Dict:
+    """Load a JSON export, SQLite store or binary metric file, chosen by file suffix."""
+    suffix = Path(path).suffix.lower()
+    if suffix in DB_SUFFIXES:
+        return load_metric_db(path)
+    if suffix in METRIC_FILE_SUFFIXES:
+        return load_metric_file(path)
+    return load_json_file(path)
+
+
+# ============= WRITERS =============
+
+def write_json_file(path: Path, data: Dict) -> None:
+    """Write a JSON data file, via a temp file so readers never see a partial one."""
+    tmp = Path(str(path) + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    tmp.replace(path)
+
+
+def write_metric_db(path: Path, data: Dict, changed: Dict) -> None:
+    """Write changed days (and the metadata) into a SQLite store built by ingest.py."""
+    with MetricDB(path) as db:
+        breakdowns = {property_event_name(*row): row for row in db.conn.execute(
+            "SELECT DISTINCT event, property, value FROM event_property_daily")}
+        events = changed.get('events') or {}
+        db.set_counts((name, day, value) for name, series in events.items()
+                      if name not in breakdowns for day, value in series.items())
+        with db.conn:
+            db.conn.executemany(
+                "INSERT INTO event_property_daily (event, property, value, day, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (event, property, value, day) DO UPDATE SET count = excluded.count",
+                [(*breakdowns[name], day, value) for name, series in events.items()
+                 if name in breakdowns for day, value in series.items()]
+            )
+        db.set_meta(**{key: data[key] for key in ('scraped_at', 'summary') if data.get(key)})
+
+
+def write_data_file(path: Path, data: Dict, changed: Dict) -> None:
+    """Write data (with `changed` merged in) back to a data file of any supported format."""
+    suffix = Path(path).suffix.lower()
+    if suffix in DB_SUFFIXES:
+        write_metric_db(path, data, changed)
+        return
+    events = data.get('events', {})
+    if suffix in METRIC_FILE_SUFFIXES:
+        engine = events.engine if isinstance(events, EngineEvents) else QueryEngine.from_events(events)
+        write_metric_file(path, engine, {key: value for key, value in data.items() if key != 'events'})
+        return
+    if isinstance(events, EngineEvents):
+        data = {**data, 'events': {name: events[name] for name in events}}
+    write_json_file(path, data)
+
+
+# ============= DELTAS =============
+
+def validate_delta(delta: Dict) -> None:
+    """Check a delta's shape: {"events": {name: {YYYY-MM-DD: number}}, ...}. Raises ValueError."""
+    if not isinstance(delta, dict):
+        raise ValueError("Delta must be an object")
+    events = delta.get('events', {})
+    if not isinstance(events, dict):
+        raise ValueError("Delta 'events' must map event names to {date: value}")
+    for name, series in events.items():
+        if not isinstance(series, dict):
+            raise ValueError(f"Delta series for '{name}' must map dates to values")
+        for day, value in series.items():
+            parse_day(day)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"Delta value for '{name}' on {day} must be a number")
+    if not isinstance(delta.get('summary', {}), dict):
+        raise ValueError("Delta 'summary' must be an object")
+
+
+def combine_deltas(deltas: List[Dict]) -> Dict:
+    """Fold consecutive deltas into one; later values win."""
+    combined: Dict = {'events': {}}
+    for delta in deltas:
+        for name, series in (delta.get('events') or {}).items():
+            combined['events'].setdefault(name, {}).update(series)
+        if delta.get('scraped_at'):
+            combined['scraped_at'] = delta['scraped_at']
+        if delta.get('summary'):
+            combined.setdefault('summary', {}).update(delta['summary'])
+    return combined
+
+
+# Summary totals kept current as deltas land: key -> event summed over the
+# trailing SUMMARY_DAYS of the data (the scraped export's definitions)
+SUMMARY_DAYS = 30
+SUMMARY_TOTALS = {
+    'total_signups_30d': 'signup_completed',
+    'total_dashboard_views_30d': 'dashboard_viewed',
+    'total_chat_messages_30d': 'chat_messages',
+    'total_subscription_page_views_30d': 'subscription_page_viewed',
+    'total_subscription_orders_30d': 'subscription_order_initiated',
+}
+SUMMARY_AVERAGES = {'avg_daily_signups': 'total_signups_30d',
+                    'avg_daily_dashboard_views': 'total_dashboard_views_30d'}
+SUMMARY_PEAKS = {'peak_signup_day': ('signup_completed', 'signups'),
+                 'peak_subscription_day': ('subscription_page_viewed', 'page views')}
+
+
+def _plain_number(value: float):
+    return int(value) if float(value).is_integer() else value
+
+
+def _range_end(data: Dict) -> Optional[str]:
+    bounds = str(data.get('date_range') or '').split(' to ')
+    return bounds[1] if len(bounds) == 2 else None
+
+
+def _window(events, name: str, end: str) -> Dict[str, float]:
+    """One event's days within the SUMMARY_DAYS ending at `end`."""
+    start = str(parse_day(end) - (SUMMARY_DAYS - 1))
+    if isinstance(events, EngineEvents):
+        if name not in events.engine.rows:
+            return {}
+        return events.engine.series(name, start, end)
+    return {d: v for d, v in (events.get(name) or {}).items() if start <= d <= end}
+
+
+def update_summary(data: Dict, merged: Dict, changed: List[str]) -> Dict:
+    """The summary of `merged`, moved on from `data`'s by the days that changed."""
+    summary = dict(data.get('summary') or {})
+    old_end, new_end = _range_end(data), _range_end(merged)
+    if not summary or not old_end or not new_end:
+        return summary
+    slid = old_end != new_end
+    old_events, new_events = data.get('events', {}), merged.get('events', {})
+
+    for key, name in SUMMARY_TOTALS.items():
+        if key in summary and (slid or name in changed):
+            try:
+                total = float(summary[key])
+            except (TypeError, ValueError):
+                continue
+            total += (sum(_window(new_events, name, new_end).values())
+                      - sum(_window(old_events, name, old_end).values()))
+            summary[key] = _plain_number(total)
+    for key, total_key in SUMMARY_AVERAGES.items():
+        if key in summary and isinstance(summary.get(total_key), (int, float)):
+            summary[key] = round(summary[total_key] / SUMMARY_DAYS)
+    signups = summary.get('total_signups_30d')
+    orders = summary.get('total_subscription_orders_30d')
+    if 'conversion_rate_signup_to_subscription' in summary and signups and isinstance(orders, (int, float)):
+        summary['conversion_rate_signup_to_subscription'] = f"{round(orders / signups * 100)}%"
+    for key, (name, unit) in SUMMARY_PEAKS.items():
+        if key in summary and (slid or name in changed):
+            window = _window(new_events, name, new_end)
+            if window:
+                day = max(window, key=window.get)
+                summary[key] = f"{day} ({_plain_number(window[day])} {unit})"
+    return summary
+
+
+def merge_delta(data: Dict, delta: Dict) -> Dict:
+    """A new data dict with a delta merged in; `data` itself is not modified."""
+    updates = delta.get('events') or {}
+    merged = dict(data)
+
+    events = data.get('events', {})
+    if isinstance(events, EngineEvents):
+        merged['events'] = EngineEvents(events.engine.with_updates(updates))
+    else:
+        # Only the series that changed are copied
+        merged['events'] = dict(events)
+        for name, series in updates.items():
+            merged['events'][name] = dict(sorted({**events.get(name, {}), **series}.items()))
+
+    available = list(data.get('available_events') or [])
+    known = set(available)
+    merged['available_events'] = available + [n for n in updates if n not in known]
+
+    days = [d for series in updates.values() for d in series]
+    if days:
+        bounds = str(data.get('date_range') or '').split(' to ')
+        if len(bounds) == 2:
+            days += bounds
+        merged['date_range'] = f"{min(days)} to {max(days)}"
+    if delta.get('scraped_at'):
+        merged['scraped_at'] = delta['scraped_at']
+    if updates and data.get('summary'):
+        merged['summary'] = update_summary(data, merged, list(updates))
+    if delta.get('summary'):
+        # A fresh scrape's own summary values win
+        merged['summary'] = {**(merged.get('summary') or {}), **delta['summary']}
+    return merged
+
+
+# ============= STORE =============
+
+class MetricStore:
+    """Current snapshot of a data file, reloaded when the file changes. Thread-safe."""
+
+    def __init__(self, path: Path, loader: Callable[[Path], Dict] = load_data_file):
+        self.path = Path(path)
+        self.loader = loader
+        self.delta_path = Path(str(self.path) + DELTA_LOG_SUFFIX)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[MetricSnapshot] = None
+        self._version = 0
+        self._incremental: Dict[str, Callable[[Any, MetricSnapshot, Dict], Any]] = {}
+        self._listeners: List[Callable[[MetricSnapshot], None]] = []
+
+    def register_incremental(self, key: str,
+                             updater: Callable[[Any, MetricSnapshot, Dict], Any]) -> None:
+        """Carry a derived structure across deltas; updater returns None to rebuild it."""
+        self._incremental[key] = updater
+
+    def register_listener(self, callback: Callable[[MetricSnapshot], None]) -> None:
+        """Call callback(snapshot) each time a new data version is published."""
+        self._listeners.append(callback)
+
+    def _publish(self, snap: MetricSnapshot) -> MetricSnapshot:
+        previous, self._snapshot = self._snapshot, snap
+        if previous is None or previous.version != snap.version:
+            for callback in self._listeners:
+                callback(snap)
+        return snap
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _delta_size(self) -> int:
+        try:
+            return os.stat(self.delta_path).st_size
+        except OSError:
+            return 0
+
+    def _is_current(self, snap: Optional[MetricSnapshot],
+                    signature: Optional[Tuple[int, int]], delta_size: int) -> bool:
+        return snap is not None and snap.signature == signature and snap.delta_offset == delta_size
+
+    def snapshot(self) -> MetricSnapshot:
+        """Return the current snapshot, reloading first if the file changed."""
+        signature, delta_size = self._stat(), self._delta_size()
+        snap = self._snapshot
+        if self._is_current(snap, signature, delta_size):
+            return snap
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            return self._refresh_locked()
+
+    def current(self) -> Optional[MetricSnapshot]:
+        """The last published snapshot, without checking the file (None before the first load)."""
+        return self._snapshot
+
+    def reload(self) -> MetricSnapshot:
+        """Force a reload regardless of the file signature."""
+        with self._lock:
+            return self._publish(self._load(self._stat(), self._snapshot))
+
+    def apply_delta(self, delta: Dict) -> MetricSnapshot:
+        """Merge new or corrected days ({"events": {name: {date: value}}}) and publish them."""
+        validate_delta(delta)
+        with self._lock:
+            entry = {"base": list(self._stat() or []) or None, "delta": delta}
+            with open(self.delta_path, 'a') as f:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            snap = self._refresh_locked()
+            if self._delta_size() > COMPACT_DELTA_BYTES:
+                snap = self._compact_locked()
+            return snap
+
+    def compact(self) -> MetricSnapshot:
+        """Write the data with every logged delta merged back to the data file and empty the log."""
+        with self._lock:
+            return self._compact_locked()
+
+    def _compact_locked(self) -> MetricSnapshot:
+        snap = self._refresh_locked()
+        signature = self._stat()
+        if not snap.data or signature is None:
+            return snap
+        deltas, _ = self._read_deltas(0, signature)
+        if deltas:
+            with tracing.span('data_load', kind='compact', source=self.path.name):
+                write_data_file(self.path, snap.data, combine_deltas(deltas))
+        # Entries name the data file they apply to, so the rewrite retires them
+        self.delta_path.unlink(missing_ok=True)
+        # Same data, now all in the data file: keep the version and derived structures
+        return self._publish(replace(snap, signature=self._stat(), delta_offset=0))
+
+    def _refresh_locked(self) -> MetricSnapshot:
+        signature, delta_size = self._stat(), self._delta_size()
+        snap = self._snapshot
+        if self._is_current(snap, signature, delta_size):
+            return snap
+        if (snap is not None and snap.data and snap.signature == signature
+                and delta_size > snap.delta_offset):
+            snap = self._catch_up(snap)
+        else:
+            snap = self._load(signature, snap)
+        return self._publish(snap)
+
+    def _read_deltas(self, offset: int, signature: Optional[Tuple[int, int]]) -> Tuple[List[Dict], int]:
+        """Complete log entries after offset that apply to this data file. Returns (deltas, new offset)."""
+        try:
+            with open(self.delta_path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except OSError:
+            return [], offset
+        # A writer may be mid-line; stop at the last complete entry
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        base = list(signature) if signature else None
+        deltas = []
+        for line in complete.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and entry.get('base') == base:
+                deltas.append(entry.get('delta') or {})
+        return deltas, offset + len(complete)
+
+    def _catch_up(self, previous: MetricSnapshot) -> MetricSnapshot:
+        """Apply log entries written since `previous` without re-reading the data file."""
+        deltas, offset = self._read_deltas(previous.delta_offset, previous.signature)
+        if not deltas:
+            return replace(previous, delta_offset=offset)
+        delta = combine_deltas(deltas)
+
+        self._version += 1
+        snap = MetricSnapshot(
+            version=self._version,
+            data=merge_delta(previous.data, delta),
+            source=self.path,
+            signature=previous.signature,
+            delta_offset=offset,
+        )
+        for key, updater in self._incremental.items():
+            if key in previous._derived:
+                value = updater(previous._derived[key], snap, delta)
+                if value is not None:
+                    snap._derived[key] = value
+        return snap
+
+    def _load(self, signature: Optional[Tuple[int, int]],
+              previous: Optional[MetricSnapshot]) -> MetricSnapshot:
+        data: Dict = {}
+        if signature is not None:
+            try:
+                with tracing.span('data_load', kind='file', source=self.path.name):
+                    data = self.loader(self.path)
+            except Exception as e:
+                print(f"Error loading data from {self.path}: {e}")
+                if previous is not None and previous.data:
+                    # Keep serving the last good snapshot; retry on the next change
+                    return replace(previous, signature=signature, delta_offset=self._delta_size())
+
+        deltas, offset = self._read_deltas(0, signature)
+        if deltas:
+            data = merge_delta(data, combine_deltas(deltas))
+
+        self._version += 1
+        return MetricSnapshot(
+            version=self._version,
+            data=data,
+            source=self.path,
+            signature=signature,
+            delta_offset=offset,
+        )
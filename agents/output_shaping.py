@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Output Shaping - keeps every tool result inside a token budget.
+
+Series roll up to weeks or months when too long, name lists keep the
+closest matches, and fit() trims the largest collections as a last resort.
+"""
+
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from event_index import get_event_index
+from query_engine import QueryEngine
+
+
+DEFAULT_MAX_TOKENS = 1500  # Per tool result when the model gives no hint
+MIN_MAX_TOKENS = 200
+TOKENS_PER_POINT = 8  # '"2026-01-01":1234,' is about 8 tokens
+BASE_TOKENS = 150  # Room for everything in a result besides the series
+SUGGESTION_LIMIT = 10  # Closest matches listed when a name is not found
+DROPPED_LIMIT = 20  # Dropped keys named in a truncated result
+
+_DATED = re.compile(r'\d{4}-\d{2}')
+
+
+def dumps(result) -> str:
+    """Compact JSON, the wire format for every tool result."""
+    return json.dumps(result, separators=(',', ':'), default=str)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def max_tokens_hint(args: Dict) -> int:
+    """The tool's max_tokens argument, clamped to a sane range."""
+    try:
+        value = int(args.get('max_tokens') or DEFAULT_MAX_TOKENS)
+    except (TypeError, ValueError):
+        value = DEFAULT_MAX_TOKENS
+    return max(MIN_MAX_TOKENS, value)
+
+
+def point_budget(max_tokens: int) -> int:
+    """How many series points fit in a result of max_tokens."""
+    return max(7, (max_tokens - BASE_TOKENS) // TOKENS_PER_POINT)
+
+
+# ============= SERIES =============
+
+def partial_buckets(labels: List[str], covered: np.ndarray, length: np.ndarray) -> Dict[str, str]:
+    """Buckets holding fewer days than a full week or month, as {label: 'N of M days'}."""
+    return {labels[c]: f"{covered[c]} of {length[c]} days" for c in np.flatnonzero(covered < length)}
+
+
+def shape_series(engine: QueryEngine, name: str, start: Optional[str], end: Optional[str],
+                 max_tokens: int) -> Tuple[Dict[str, float], str, Dict[str, str]]:
+    """The event's series at the finest granularity that fits: (series, granularity, partial)."""
+    budget = point_budget(max_tokens)
+    series: Dict[str, float] = {}
+    for granularity in ('day', 'week', 'month'):
+        series = engine.rollup(name, start, end, granularity)
+        if len(series) <= budget:
+            break
+    else:
+        # Even monthly buckets overflow: keep the most recent ones
+        series = dict(list(series.items())[-budget:])
+    partial = partial_buckets(*engine.bucket_days(start, end, granularity))
+    return series, granularity, {label: days for label, days in partial.items() if label in series}
+
+
+# ============= NAME LISTS =============
+
+def closest_events(snapshot, query: str, k: int = SUGGESTION_LIMIT) -> List[str]:
+    """The k event names closest to a query."""
+    return [name for name, _ in get_event_index(snapshot).candidates(query, limit=k)]
+
+
+def not_found(snapshot, kind: str, name: str, k: int = SUGGESTION_LIMIT) -> Dict:
+    """Error result for an unknown event: top-k suggestions, not the whole list."""
+    events = snapshot.data.get('events', {})
+    result = {"error": f"{kind} '{name}' not found"}
+    if len(events) <= k:
+        result["available_events"] = list(events.keys())
+    else:
+        result["closest_matches"] = closest_events(snapshot, name, k)
+        result["available_event_count"] = len(events)
+    return result
+
+
+def top_events_by_volume(engine: QueryEngine, k: int) -> List[str]:
+    """The k events with the most activity overall."""
+    totals, _ = engine.range_totals()
+    order = np.argsort(-totals, kind='stable')[:k]
+    return [engine.names[i] for i in order]
+
+
+# ============= SIZE GUARD =============
+
+def _shrinkable(value) -> bool:
+    """A list or dict that _shrink can make smaller."""
+    if not isinstance(value, (list, dict)):
+        return False
+    if len(value) > 1:
+        return True
+    return isinstance(value, dict) and any(_shrinkable(v) for v in value.values())
+
+
+def _holds_series(value) -> bool:
+    """A record (dict) with at least one collection inside that can still shrink."""
+    return isinstance(value, dict) and any(_shrinkable(v) for v in value.values())
+
+
+def _shrink(value, dropped: List[str]):
+    """Roughly halve a collection, adding dropped dict keys to `dropped`."""
+    if isinstance(value, list):
+        return value[:len(value) // 2]
+    records = [k for k, v in value.items() if _holds_series(v)]
+    if records:
+        trimmed = dict(value)
+        for key in records:
+            trimmed[key] = {k: _shrink(v, []) if _shrinkable(v) else v for k, v in value[key].items()}
+        return trimmed
+    if len(value) <= 1:
+        # A single entry holding a series
+        return {k: _shrink(v, dropped) for k, v in value.items()}
+    keys = list(value)
+    keep = len(keys) // 2
+    if _DATED.match(str(keys[0])):
+        return {k: value[k] for k in keys[len(keys) - keep:]}
+    dropped.extend(str(k) for k in keys[keep:])
+    return {k: value[k] for k in keys[:keep]}
+
+
+def fit(result: Dict, max_tokens: int) -> str:
+    """Serialize a result within max_tokens, shrinking its largest collection until it fits."""
+    text = dumps(result)
+    dropped: Dict[str, List[str]] = {}
+    while estimate_tokens(text) > max_tokens:
+        sizes = {
+            key: len(dumps(value)) for key, value in result.items()
+            if key != 'dropped' and _shrinkable(value)
+        }
+        if not sizes:
+            break
+        key = max(sizes, key=sizes.get)
+        names = dropped.setdefault(key, [])
+        result[key] = _shrink(result[key], names)
+        result["truncated"] = True
+        if names:
+            result["dropped"] = {
+                k: v if len(v) <= DROPPED_LIMIT else v[:DROPPED_LIMIT] + [f"... {len(v) - DROPPED_LIMIT} more"]
+                for k, v in dropped.items() if v
+            }
+        text = dumps(result)
+    return text
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Prompt Prefetch - a compact data summary rendered into the system prompt.
+
+Lists the date range, headline totals and busiest metrics so runs can skip
+get_business_summary. The text depends only on the data, so conversations
+share a cacheable prompt prefix.
+"""
+
+from typing import List
+
+import numpy as np
+
+from query_engine import get_engine
+
+
+MAX_PROMPT_METRICS = 40  # Busiest metrics listed; the rest are counted
+MAX_SUMMARY_ITEMS = 12  # Headline totals shown
+
+
+def _format_number(value) -> str:
+    if isinstance(value, (int, np.integer)) or (isinstance(value, float) and value.is_integer()):
+        return f"{int(value):,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value)
+
+
+def render_data_summary(snapshot, max_metrics: int = MAX_PROMPT_METRICS) -> str:
+    """Markdown summary of the snapshot's data for the system prompt ('' without data)."""
+    data = snapshot.data
+    if not data:
+        return ''
+    engine = get_engine(snapshot)
+
+    lines: List[str] = [
+        "## Data Snapshot",
+        "Preloaded from the data: these figures are real and can be quoted without a tool call, "
+        "and there is no need to call get_business_summary to list metrics.",
+    ]
+    facts = []
+    if len(engine.days):
+        facts.append(f"Date range: {engine.day_strings[0]} to {engine.day_strings[-1]}")
+    elif data.get('date_range'):
+        facts.append(f"Date range: {data['date_range']}")
+    if data.get('scraped_at'):
+        facts.append(f"Last refreshed: {data['scraped_at']}")
+    if facts:
+        lines.append("- " + " | ".join(facts))
+
+    summary = data.get('summary') or {}
+    if isinstance(summary, dict) and summary:
+        items = [f"{key}={_format_number(value)}" for key, value in list(summary.items())[:MAX_SUMMARY_ITEMS]]
+        lines.append("- Headline: " + ", ".join(items))
+
+    if engine.names:
+        totals, _ = engine.range_totals()
+        order = np.argsort(-totals, kind='stable')[:max_metrics]
+        # Last day each event has data
+        has_data = engine.present.any(axis=1)
+        last = len(engine.days) - 1 - np.argmax(engine.present[:, ::-1], axis=1)
+        lines.append(f"- Metrics ({len(engine.names)}; total over the range, latest day with data):")
+        for row in order.tolist():
+            latest = (f"{_format_number(engine.values[row, last[row]].item())} on {engine.day_strings[last[row]]}"
+                      if has_data[row] else "no data")
+            lines.append(f"  - {engine.names[row]}: {_format_number(totals[row].item())} total, {latest}")
+        hidden = len(engine.names) - len(order)
+        if hidden > 0:
+            lines.append(f"  - ...and {hidden} more (get_business_summary lists them)")
+    return "\n".join(lines)
+
+
+def get_data_summary(snapshot) -> str:
+    """The prompt summary for a snapshot, rendered once per data version."""
+    return snapshot.derive('prompt_summary', render_data_summary)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Query Engine - columnar, date-indexed view of the Mixpanel events.
+
+Every event is a row on one shared, sorted date axis. Values live in a
+NumPy matrix next to a presence mask, with prefix sums of both, so range
+totals, counts and averages are a binary search plus O(1) arithmetic.
+Range min/max use per-event sparse tables built on first use.
+"""
+
+import re
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+# ============= DATES =============
+
+_DAY = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def parse_day(value: str) -> np.datetime64:
+    """Parse a YYYY-MM-DD string. Raises ValueError on malformed input."""
+    # numpy alone also takes '2026-01', 'NaT' and full timestamps
+    try:
+        if not _DAY.fullmatch(value):
+            raise ValueError(value)
+        return np.datetime64(date.fromisoformat(value), 'D')
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+# ============= RESULTS =============
+
+@dataclass
+class RangeStats:
+    """Aggregates of one event over a date range."""
+    total: float
+    average: float
+    max: float
+    min: float
+    days: int
+
+    def to_dict(self) -> Dict:
+        """Stats in the shape the tools return (average rounded, like before)."""
+        return {
+            "total": _plain(self.total),
+            "average": round(self.average) if self.days else 0,
+            "max": _plain(self.max) if self.days else 0,
+            "min": _plain(self.min) if self.days else 0,
+            "days": self.days,
+        }
+
+
+def _buckets(days: np.ndarray, granularity: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Bucket key of each day and the first column of each bucket."""
+    if granularity == 'week':
+        # Day 0 of the epoch was a Thursday, so this is days since Monday
+        keys = days - (days.astype(np.int64) + 3) % 7
+    else:
+        keys = days.astype('datetime64[M]')
+    # The axis is sorted, so each bucket is a contiguous run of columns
+    return keys, np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _plain(value):
+    """Convert a NumPy scalar to a JSON-serializable Python number."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+# ============= ENGINE =============
+
+class QueryEngine:
+    """Immutable columnar store of daily event values."""
+
+    def __init__(self, names: List[str], days: np.ndarray,
+                 values: np.ndarray, present: np.ndarray,
+                 value_cumsum: Optional[np.ndarray] = None,
+                 count_cumsum: Optional[np.ndarray] = None):
+        self.names = list(names)
+        self.rows = {name: i for i, name in enumerate(self.names)}
+        self.days = days.astype('datetime64[D]', copy=False)
+        self.values = values
+        self.present = present
+
+        # Prefix sums with a leading zero column: sum over [lo, hi) = c[hi] - c[lo]
+        # (precomputed ones, e.g. from a memory-mapped file, are used as is)
+        n_events = len(self.names)
+        if value_cumsum is None:
+            value_cumsum = np.zeros((n_events, len(self.days) + 1), dtype=values.dtype)
+            np.cumsum(values, axis=1, out=value_cumsum[:, 1:])
+        if count_cumsum is None:
+            count_cumsum = np.zeros((n_events, len(self.days) + 1), dtype=np.int64)
+            np.cumsum(present, axis=1, out=count_cumsum[:, 1:])
+        self.value_cumsum = value_cumsum
+        self.count_cumsum = count_cumsum
+
+        self._day_strings: Optional[List[str]] = None
+        self._sparse: Dict[int, Tuple[List[np.ndarray], List[np.ndarray]]] = {}
+
+    @classmethod
+    def from_events(cls, events: Dict[str, Dict[str, float]]) -> 'QueryEngine':
+        """Build from the JSON shape: {event: {YYYY-MM-DD: value}}."""
+        names = list(events.keys())
+        all_days = sorted({d for series in events.values() for d in series})
+        days = np.array(all_days, dtype='datetime64[D]')
+        column = {d: i for i, d in enumerate(all_days)}
+
+        is_int = all(
+            isinstance(v, int) for series in events.values() for v in series.values()
+        )
+        values = np.zeros((len(names), len(days)), dtype=np.int64 if is_int else np.float64)
+        present = np.zeros((len(names), len(days)), dtype=bool)
+        for row, name in enumerate(names):
+            series = events[name]
+            cols = [column[d] for d in series]
+            values[row, cols] = list(series.values())
+            present[row, cols] = True
+
+        return cls(names, days, values, present)
+
+    def with_updates(self, updates: Dict[str, Dict[str, float]]) -> 'QueryEngine':
+        """A new engine with new or corrected days merged in ({event: {date: value}})."""
+        names = self.names + [n for n in updates if n not in self.rows]
+        update_days = np.array(sorted({d for series in updates.values() for d in series}),
+                               dtype='datetime64[D]')
+        days = np.union1d(self.days, update_days) if len(update_days) else self.days
+
+        is_int = self.values.dtype.kind == 'i' and all(
+            isinstance(v, int) for series in updates.values() for v in series.values()
+        )
+        dtype = np.int64 if is_int else np.float64
+        values = np.zeros((len(names), len(days)), dtype=dtype)
+        present = np.zeros((len(names), len(days)), dtype=bool)
+        old_cols = np.searchsorted(days, self.days)
+        n_old = len(self.names)
+        values[:n_old, old_cols] = self.values
+        present[:n_old, old_cols] = self.present
+
+        rows = {name: i for i, name in enumerate(names)}
+        first = len(days)
+        for name, series in updates.items():
+            if not series:
+                continue
+            cols = np.searchsorted(days, np.array(list(series), dtype='datetime64[D]'))
+            values[rows[name], cols] = list(series.values())
+            present[rows[name], cols] = True
+            first = min(first, int(cols.min()))
+        # Every inserted day holds an update, so columns before `first` are unchanged
+        value_cumsum = np.zeros((len(names), len(days) + 1), dtype=dtype)
+        count_cumsum = np.zeros((len(names), len(days) + 1), dtype=np.int64)
+        value_cumsum[:n_old, :first + 1] = self.value_cumsum[:, :first + 1]
+        count_cumsum[:n_old, :first + 1] = self.count_cumsum[:, :first + 1]
+        np.cumsum(values[:, first:], axis=1, out=value_cumsum[:, first + 1:])
+        value_cumsum[:, first + 1:] += value_cumsum[:, first:first + 1]
+        np.cumsum(present[:, first:], axis=1, out=count_cumsum[:, first + 1:])
+        count_cumsum[:, first + 1:] += count_cumsum[:, first:first + 1]
+
+        return QueryEngine(names, days, values, present,
+                           value_cumsum=value_cumsum, count_cumsum=count_cumsum)
+
+    @property
+    def day_strings(self) -> List[str]:
+        """The date axis as YYYY-MM-DD strings."""
+        if self._day_strings is None:
+            self._day_strings = [str(d) for d in self.days]
+        return self._day_strings
+
+    def column_range(self, start: Optional[str] = None,
+                     end: Optional[str] = None) -> Tuple[int, int]:
+        """Half-open column range [lo, hi) covering start..end inclusive."""
+        lo = 0 if not start else int(np.searchsorted(self.days, parse_day(start), 'left'))
+        hi = len(self.days) if not end else int(np.searchsorted(self.days, parse_day(end), 'right'))
+        return lo, max(lo, hi)
+
+    def series(self, name: str, start: Optional[str] = None,
+               end: Optional[str] = None) -> Dict[str, float]:
+        """Daily values of one event as {date: value}, present days only."""
+        row = self.rows[name]
+        lo, hi = self.column_range(start, end)
+        cols = lo + np.flatnonzero(self.present[row, lo:hi])
+        day_strings = self.day_strings
+        return {day_strings[c]: _plain(self.values[row, c]) for c in cols}
+
+    def tail(self, name: str, n: int) -> Dict[str, float]:
+        """The last n present days of one event as {date: value}."""
+        row = self.rows[name]
+        cols = np.flatnonzero(self.present[row])[-n:] if n > 0 else []
+        day_strings = self.day_strings
+        return {day_strings[c]: _plain(self.values[row, c]) for c in cols}
+
+    def rollup(self, name: str, start: Optional[str] = None, end: Optional[str] = None,
+               granularity: str = 'week') -> Dict[str, float]:
+        """Sum one event into 'day', 'week' (by Monday) or 'month' buckets."""
+        if granularity == 'day':
+            return self.series(name, start, end)
+        labels, sums, present = self.bucket_matrix([self.rows[name]], start, end, granularity)
+        return {labels[c]: _plain(sums[0, c]) for c in np.flatnonzero(present[0])}
+
+    def bucket_matrix(self, rows: List[int], start: Optional[str] = None, end: Optional[str] = None,
+                      granularity: str = 'day') -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Sums of several events per bucket over a range: (labels, sums, present)."""
+        if granularity not in ('day', 'week', 'month'):
+            raise ValueError(f"Unknown granularity '{granularity}', expected day, week or month")
+        lo, hi = self.column_range(start, end)
+        values = self.values[rows, lo:hi]
+        present = self.present[rows, lo:hi]
+        if granularity == 'day' or hi == lo:
+            return self.day_strings[lo:hi], values, present
+
+        keys, starts = _buckets(self.days[lo:hi], granularity)
+        sums = np.add.reduceat(values, starts, axis=1)
+        has = np.logical_or.reduceat(present, starts, axis=1)
+        return [str(k) for k in keys[starts]], sums, has
+
+    def bucket_days(self, start: Optional[str] = None, end: Optional[str] = None,
+                    granularity: str = 'day') -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Per bucket_matrix bucket: (labels, days covered, full length in days)."""
+        lo, hi = self.column_range(start, end)
+        if granularity == 'day' or hi == lo:
+            ones = np.ones(hi - lo, dtype=np.int64)
+            return self.day_strings[lo:hi], ones, ones
+        keys, starts = _buckets(self.days[lo:hi], granularity)
+        if granularity == 'week':
+            first = keys[starts]
+            after = first + 7
+        else:
+            first = keys[starts].astype('datetime64[D]')
+            after = (keys[starts] + 1).astype('datetime64[D]')
+        covered = np.minimum(after, self.days[hi - 1] + 1) - np.maximum(first, self.days[lo])
+        return [str(k) for k in keys[starts]], covered.astype(np.int64), (after - first).astype(np.int64)
+
+    def total(self, name: str, start: Optional[str] = None,
+              end: Optional[str] = None) -> float:
+        """Sum of one event over a range in O(log days)."""
+        row = self.rows[name]
+        lo, hi = self.column_range(start, end)
+        return _plain(self.value_cumsum[row, hi] - self.value_cumsum[row, lo])
+
+    def range_stats(self, name: str, start: Optional[str] = None,
+                    end: Optional[str] = None) -> RangeStats:
+        """Total, average, min and max of one event over a range."""
+        row = self.rows[name]
+        lo, hi = self.column_range(start, end)
+        days = int(self.count_cumsum[row, hi] - self.count_cumsum[row, lo])
+        total = self.value_cumsum[row, hi] - self.value_cumsum[row, lo]
+        if days == 0:
+            return RangeStats(total=0, average=0, max=0, min=0, days=0)
+        lo_v, hi_v = self._range_min_max(row, lo, hi)
+        return RangeStats(total=total, average=total / days, max=hi_v, min=lo_v, days=days)
+
+    def _range_min_max(self, row: int, lo: int, hi: int) -> Tuple[float, float]:
+        mins, maxs = self._sparse_table(row)
+        level = int(hi - lo).bit_length() - 1
+        right = hi - (1 << level)
+        return (min(mins[level][lo], mins[level][right]),
+                max(maxs[level][lo], maxs[level][right]))
+
+    def _sparse_table(self, row: int) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Per-event sparse tables for O(1) range min/max, built on first use."""
+        table = self._sparse.get(row)
+        if table is not None:
+            return table
+
+        values = self.values[row].astype(np.float64)
+        present = self.present[row]
+        mins = [np.where(present, values, np.inf)]
+        maxs = [np.where(present, values, -np.inf)]
+        width = 1
+        while 2 * width <= len(values):
+            mins.append(np.minimum(mins[-1][:-width], mins[-1][width:]))
+            maxs.append(np.maximum(maxs[-1][:-width], maxs[-1][width:]))
+            width *= 2
+
+        table = (mins, maxs)
+        self._sparse[row] = table
+        return table
+
+    def range_totals(self, start: Optional[str] = None,
+                     end: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(totals, present-day counts) for every event over a range, one pass."""
+        lo, hi = self.column_range(start, end)
+        totals = self.value_cumsum[:, hi] - self.value_cumsum[:, lo]
+        counts = self.count_cumsum[:, hi] - self.count_cumsum[:, lo]
+        return totals, counts
+
+    def range_stats_all(self, start: Optional[str] = None,
+                        end: Optional[str] = None) -> Dict[str, RangeStats]:
+        """Stats for every event over a range as one vectorized pass."""
+        return self.range_stats_many(self.names, start, end)
+
+    def range_stats_many(self, names: List[str], start: Optional[str] = None,
+                         end: Optional[str] = None) -> Dict[str, RangeStats]:
+        """Stats for several events over a range as one vectorized pass."""
+        rows = [self.rows[name] for name in names]
+        lo, hi = self.column_range(start, end)
+        totals = self.value_cumsum[rows, hi] - self.value_cumsum[rows, lo]
+        counts = self.count_cumsum[rows, hi] - self.count_cumsum[rows, lo]
+        window = self.values[rows, lo:hi].astype(np.float64)
+        mask = self.present[rows, lo:hi]
+        maxs = np.where(mask, window, -np.inf).max(axis=1, initial=-np.inf)
+        mins = np.where(mask, window, np.inf).min(axis=1, initial=np.inf)
+        averages = np.divide(totals, counts, out=np.zeros(len(totals)), where=counts > 0)
+
+        return {
+            name: RangeStats(
+                total=totals[i],
+                average=averages[i],
+                max=maxs[i] if counts[i] else 0,
+                min=mins[i] if counts[i] else 0,
+                days=int(counts[i]),
+            )
+            for i, name in enumerate(names)
+        }
+
+
+class EngineEvents(Mapping):
+    """Read-only {event: {date: value}} view over an engine's columns."""
+
+    def __init__(self, engine: QueryEngine):
+        self.engine = engine
+
+    def __getitem__(self, name: str) -> Dict[str, float]:
+        if name not in self.engine.rows:
+            raise KeyError(name)
+        return self.engine.series(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.engine.names)
+
+    def __len__(self) -> int:
+        return len(self.engine.names)
+
+    def __contains__(self, name) -> bool:
+        return name in self.engine.rows
+
+
+def _build_engine(snapshot) -> QueryEngine:
+    events = snapshot.data.get('events', {})
+    if isinstance(events, EngineEvents):
+        return events.engine
+    return QueryEngine.from_events(events)
+
+
+def get_engine(snapshot) -> QueryEngine:
+    """The query engine for a MetricSnapshot, built once per data version."""
+    return snapshot.derive('engine', _build_engine)
+
+
+def update_engine(engine: QueryEngine, snapshot, delta: Dict) -> QueryEngine:
+    """Incremental hook for MetricStore.register_incremental('engine', ...)."""
+    events = snapshot.data.get('events')
+    if isinstance(events, EngineEvents):
+        return events.engine  # Already merged along with the data
+    return engine.with_updates(delta.get('events') or {})
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Refresh - merge a new Mixpanel scrape into the store as a delta.
+
+Appends only the new or changed days of a fresh scrape to the delta log.
+
+Usage:
+    python refresh.py new-mixpanel-data.json
+    python refresh.py delta.json --delta   # already {"events": {name: {date: value}}}
+    python refresh.py --compact            # fold the delta log into the data file
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metric_store import MetricStore
+
+DATA_PATH = Path(os.getenv(
+    'MIXPANEL_DATA_PATH',
+    str(Path(__file__).parent.parent / 'data' / 'mixpanel-data.json')
+))
+
+
+def diff_events(current, fresh: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Days in `fresh` that are new or differ from `current`, per event."""
+    changed = {}
+    for name, series in fresh.items():
+        old = current.get(name) or {}
+        days = {day: value for day, value in series.items() if old.get(day) != value}
+        if days:
+            changed[name] = days
+    return changed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Merge a new scrape into the metric store")
+    parser.add_argument('source', nargs='?', help="Fresh export (or a delta with --delta)")
+    parser.add_argument('--delta', action='store_true', help="Source is already a delta")
+    parser.add_argument('--compact', action='store_true', help="Write the delta log into the data file")
+    parser.add_argument('--data', type=Path, default=DATA_PATH, help="Data file the agent serves")
+    args = parser.parse_args(argv)
+    if not args.source and not args.compact:
+        parser.error("a source file or --compact is required")
+
+    store = MetricStore(args.data)
+    if args.source:
+        with open(args.source, 'r') as f:
+            fresh = json.load(f)
+
+        if args.delta:
+            delta = fresh
+        else:
+            snapshot = store.snapshot()
+            delta = {"events": diff_events(snapshot.data.get('events', {}), fresh.get('events', {}))}
+            for key in ('scraped_at', 'summary'):
+                if fresh.get(key) and fresh[key] != snapshot.data.get(key):
+                    delta[key] = fresh[key]
+
+        if not any(delta.get(key) for key in ('events', 'scraped_at', 'summary')):
+            print("✅ Already up to date")
+        else:
+            try:
+                snapshot = store.apply_delta(delta)
+            except ValueError as e:
+                print(f"❌ Invalid delta: {e}")
+                return 1
+            days = sum(len(series) for series in delta.get('events', {}).values())
+            print(f"✅ Merged {days} day(s) across {len(delta.get('events', {}))} event(s) "
+                  f"into {store.path.name} (data version {snapshot.version})")
+
+    if args.compact:
+        store.compact()
+        print(f"✅ Compacted {store.delta_path.name} into {store.path.name}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Agent Server - long-running HTTP server that streams agent runs as SSE.
+
+Keeps the data, derived indexes and LLM client warm between requests and
+runs at most AGENT_SERVER_WORKERS agents at a time (503 past the queue timeout).
+
+Endpoints:
+    POST   /chat                  {"message", "session_id"?, "timeout"?, "fast_path"?}
+                                  -> text/event-stream of {"type", "content"} frames
+    POST   /sessions/<id>/cancel  stop the session's in-flight run
+    DELETE /sessions/<id>         forget the session's conversation
+    GET    /sessions/<id>/metrics the session's timing aggregates (JSON lines)
+    GET    /metrics               process timing aggregates, Prometheus text
+                                  (?format=jsonl for JSON lines; see tracing.py)
+    GET    /health                data version, runs in flight, sessions, tool cache
+
+Data reloads and session writes run off the event loop. Frames match
+app/api/chat/route.ts: 'session', one per AgentEvent, then 'done'.
+
+Usage:
+    python server.py --port 8765
+    MULEROUTER_BASE_URL=http://127.0.0.1:8766/v1 python server.py   # against stub_llm.py
+    curl -N localhost:8765/chat -d '{"message": "How are signups doing?"}'
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import signal
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from business_agent import (
+    AGENT_TIMEOUT, FAST_PATH, LLM, MODEL_NAME, MULEROUTER_BASE_URL, STORE, TOOL_CACHE,
+    arun_agent, build_system_prompt, cancel_session, get_async_client, get_ugc_snapshot,
+)
+from event_index import get_event_index
+from http_util import EventStream, HttpError, Request, close_writer, read_request, send_json, send_text
+from query_engine import get_engine
+from session_store import Session, SessionBusy, SessionStore
+from ugc import get_ugc_index
+import tracing
+
+
+SERVER_HOST = os.getenv('AGENT_SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.getenv('AGENT_SERVER_PORT', '8765'))
+MAX_RUNS = int(os.getenv('AGENT_SERVER_WORKERS', '16'))  # Agent runs in flight
+QUEUE_TIMEOUT = float(os.getenv('AGENT_SERVER_QUEUE_TIMEOUT', '10'))  # Seconds to wait for a slot
+SWEEP_INTERVAL = float(os.getenv('AGENT_SESSION_FLUSH_INTERVAL', '30'))  # Seconds between session flushes
+DATA_POLL_INTERVAL = float(os.getenv('AGENT_SERVER_DATA_POLL', '2'))  # Seconds between data file checks
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9_.:-]{1,128}$')
+
+
+# ============= SERVER =============
+
+class AgentServer:
+    """HTTP front end for arun_agent."""
+
+    def __init__(self, max_runs: int = MAX_RUNS, queue_timeout: float = QUEUE_TIMEOUT,
+                 sessions: Optional[SessionStore] = None):
+        self.max_runs = max_runs
+        self.queue_timeout = queue_timeout
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self._slots = asyncio.Semaphore(max_runs)
+        self.active = 0
+        self.waiting = 0
+        self.served = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    def warm(self) -> Dict:
+        """Load the data and build its indexes and the LLM client before the first request."""
+        loaded = self.load_data()
+        get_async_client()
+        return loaded
+
+    def load_data(self) -> Dict:
+        """(Re)load changed data files and build what runs derive from them."""
+        snapshot = STORE.snapshot()
+        engine = get_engine(snapshot)
+        get_event_index(snapshot)
+        build_system_prompt(snapshot)
+        ugc_snapshot = get_ugc_snapshot()
+        if ugc_snapshot.data:
+            get_ugc_index(ugc_snapshot)
+        return {"data_version": snapshot.version, "events": len(engine.names), "days": len(engine.days)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve requests on one connection until it closes or a stream ends it."""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    await send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                if not await self.dispatch(request, reader, writer):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await close_writer(writer)
+
+    async def dispatch(self, request: Request, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> bool:
+        """Route one request. Returns whether the connection can serve another."""
+        parts = [p for p in request.path.split('/') if p]
+        if parts == ['chat']:
+            # Streams end the connection, and so do errors before one starts
+            try:
+                if request.method != 'POST':
+                    raise HttpError(405, "Use POST")
+                await self.chat(request, reader, writer)
+            except HttpError as e:
+                await send_json(writer, e.status, {"error": e.message}, keep_alive=False,
+                                headers={'Retry-After': '1'} if e.status == 503 else None)
+            return False
+        try:
+            if parts == ['health'] and request.method == 'GET':
+                await send_json(writer, 200, await asyncio.to_thread(self.health), request.keep_alive)
+            elif parts == ['metrics'] and request.method == 'GET':
+                await self.metrics(request, writer, tracing.METRICS)
+            elif len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'metrics' and request.method == 'GET':
+                metrics = tracing.session_metrics(parts[1])
+                if metrics is None:
+                    raise HttpError(404, f"No metrics for session {parts[1]}")
+                await self.metrics(request, writer, metrics, format='jsonl', session_id=parts[1])
+            elif len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'cancel' and request.method == 'POST':
+                await send_json(writer, 200, {"cancelled": cancel_session(parts[1])}, request.keep_alive)
+            elif len(parts) == 2 and parts[0] == 'sessions' and request.method == 'DELETE':
+                cancel_session(parts[1])
+                tracing.forget_session(parts[1])
+                deleted = await asyncio.to_thread(self.sessions.drop, parts[1])
+                await send_json(writer, 200, {"deleted": deleted}, request.keep_alive)
+            else:
+                raise HttpError(404, f"No route for {request.method} {request.path}")
+        except HttpError as e:
+            await send_json(writer, e.status, {"error": e.message}, request.keep_alive)
+        return request.keep_alive
+
+    async def metrics(self, request: Request, writer: asyncio.StreamWriter, metrics: tracing.Metrics,
+                      format: str = 'prometheus', **extra) -> None:
+        format = request.query.get('format', format)
+        if format == 'jsonl':
+            await send_text(writer, 200, metrics.to_jsonl(**extra), 'application/x-ndjson', request.keep_alive)
+        elif format == 'prometheus':
+            await send_text(writer, 200, metrics.to_prometheus(), 'text/plain; version=0.0.4', request.keep_alive)
+        else:
+            raise HttpError(400, "format must be 'prometheus' or 'jsonl'")
+
+    def health(self) -> Dict:
+        snapshot = STORE.current()
+        return {
+            "status": "ok",
+            "model": MODEL_NAME,
+            "llm_base_url": MULEROUTER_BASE_URL,
+            "llm": LLM.stats(),
+            "data_version": snapshot.version if snapshot is not None else None,
+            "runs_active": self.active,
+            "runs_waiting": self.waiting,
+            "max_runs": self.max_runs,
+            "runs_served": self.served,
+            "runs_rejected": self.rejected,
+            "sessions": self.sessions.stats(),
+            "tool_cache": TOOL_CACHE.stats(),
+            "uptime_seconds": round(time.time() - self.started, 1),
+        }
+
+    async def _acquire_slot(self) -> None:
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HttpError(503, f"Server busy: {self.max_runs} runs in flight")
+        finally:
+            self.waiting -= 1
+
+    async def chat(self, request: Request, reader: asyncio.StreamReader,
+                   writer: asyncio.StreamWriter) -> None:
+        body = request.json()
+        message = body.get('message')
+        if not isinstance(message, str) or not message.strip():
+            raise HttpError(400, "Missing required field: message")
+        session_id = body.get('session_id') or body.get('sessionId') or f"session_{uuid.uuid4().hex}"
+        if not isinstance(session_id, str) or not SESSION_ID.match(session_id):
+            raise HttpError(400, "Invalid session_id")
+        timeout = AGENT_TIMEOUT
+        if body.get('timeout') is not None:
+            try:
+                timeout = min(float(body['timeout']), AGENT_TIMEOUT or float('inf'))
+            except (TypeError, ValueError):
+                raise HttpError(400, "timeout must be a number of seconds")
+            if timeout <= 0:
+                raise HttpError(400, "timeout must be positive")
+
+        try:
+            async with self.sessions.use(session_id, wait=False) as session:
+                await self._acquire_slot()
+                self.active += 1
+                try:
+                    await self._stream_run(session_id, message, timeout, bool(body.get('fast_path', FAST_PATH)),
+                                           session, reader, writer)
+                finally:
+                    self.active -= 1
+                    self.served += 1
+                    self._slots.release()
+        except SessionBusy:
+            raise HttpError(409, f"Session {session_id} already has a run in flight")
+
+    async def _stream_run(self, session_id: str, message: str, timeout: float, fast_path: bool,
+                          session: Session, reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter) -> None:
+        stream = EventStream(writer)
+        await stream.start({'X-Session-Id': session_id})
+        await stream.send({"type": "session", "content": {"session_id": session_id}})
+
+        # The request body has been read, so EOF on the socket means the client left
+        disconnected = asyncio.ensure_future(reader.read(1))
+
+        def on_disconnect(task: asyncio.Future) -> None:
+            if not task.cancelled() and (task.exception() is not None or task.result() == b''):
+                cancel_session(session_id)
+
+        disconnected.add_done_callback(on_disconnect)
+
+        started = time.perf_counter()
+        events = arun_agent(message, session.messages, session_id=session_id, timeout=timeout,
+                            stream=True, fast_path=fast_path, snapshot=STORE.current())
+        try:
+            async for event in events:
+                await stream.send({"type": event.type, "content": event.content})
+            await stream.send({"type": "done", "content": {
+                "session_id": session_id,
+                "elapsed_seconds": round(time.perf_counter() - started, 3),
+            }})
+            await stream.end()
+        except (ConnectionError, OSError):
+            cancel_session(session_id)
+        finally:
+            await events.aclose()
+            disconnected.cancel()
+
+
+# ============= CLI =============
+
+async def sweep_sessions(sessions: SessionStore) -> None:
+    """Spill idle sessions and write changed ones periodically."""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            await asyncio.to_thread(sessions.evict)
+            await asyncio.to_thread(sessions.flush)
+        except Exception as e:
+            print(f"❌ Session sweep failed: {e}")
+
+
+async def refresh_data(server: AgentServer) -> None:
+    """Reload changed data files in a worker thread."""
+    while True:
+        await asyncio.sleep(DATA_POLL_INTERVAL)
+        try:
+            await asyncio.to_thread(server.load_data)
+        except Exception as e:
+            print(f"❌ Data refresh failed: {e}")
+
+
+async def serve(host: str, port: int, max_runs: int, queue_timeout: float) -> None:
+    server = AgentServer(max_runs, queue_timeout)
+    warm = server.warm()
+    listener = await asyncio.start_server(server.handle, host, port)
+    sweeper = asyncio.ensure_future(sweep_sessions(server.sessions))
+    refresher = asyncio.ensure_future(refresh_data(server))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    print(f"🚀 Agent server on http://{host}:{port} "
+          f"(data version {warm['data_version']}: {warm['events']} events x {warm['days']} days)")
+    print(f"🤖 Model {MODEL_NAME} via {MULEROUTER_BASE_URL}, up to {max_runs} runs in flight")
+    async with listener:
+        await stop.wait()
+    sweeper.cancel()
+    refresher.cancel()
+    server.sessions.close()
+    print("👋 Shutting down")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the business agent over HTTP (SSE)")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=MAX_RUNS, help="Agent runs in flight")
+    parser.add_argument('--queue-timeout', type=float, default=QUEUE_TIMEOUT,
+                        help="Seconds a request waits for a free run slot before a 503")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, args.workers, args.queue_timeout))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
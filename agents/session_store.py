@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Session Store - conversation histories by session id.
+
+Hot sessions stay in memory under a byte budget; idle or least recently used
+ones are spilled to SQLite and reloaded on their next message.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+
+SESSION_DB_PATH = Path(os.getenv(
+    'AGENT_SESSION_DB',
+    str(Path(__file__).parent.parent / 'data' / 'sessions.db')
+))
+SESSION_BUDGET_MB = float(os.getenv('AGENT_SESSION_BUDGET_MB', '256'))  # Hot session bytes kept in memory
+SESSION_TTL = float(os.getenv('AGENT_SESSION_TTL', '1800'))  # Idle seconds before a session is spilled
+SESSION_RETENTION_DAYS = float(os.getenv('AGENT_SESSION_RETENTION_DAYS', '30'))  # Cold sessions kept on disk
+
+COMPRESSION_LEVEL = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    messages BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+"""
+
+
+class SessionBusy(Exception):
+    """The session already has a request in flight."""
+
+
+@dataclass
+class Session:
+    """Message history of one session; hold `lock` while running on it."""
+    session_id: str
+    messages: List[Dict] = field(default_factory=list)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+    last_used: float = field(default_factory=time.monotonic)
+    size: int = 0  # JSON bytes of the messages when last measured
+    revision: int = 0  # Bumped whenever a request changes the messages
+    saved: int = 0  # Revision last written to disk
+    users: int = 0  # Requests holding or waiting for the lock; never spilled while > 0
+    dropped: bool = False  # Deleted; pending writes are skipped
+
+    @property
+    def dirty(self) -> bool:
+        """Changed since it was last written to disk."""
+        return self.revision != self.saved
+
+
+def encode_messages(messages: List[Dict]) -> bytes:
+    return json.dumps(messages, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def decode_messages(blob: bytes) -> List[Dict]:
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def _fingerprint(messages: List[Dict]) -> Tuple[int, int]:
+    # Every run appends at least the user message, so length and last message tell changes apart
+    return len(messages), id(messages[-1]) if messages else 0
+
+
+class SessionStore:
+    """Session id -> Session, hot under a byte budget and spilled to SQLite beyond it."""
+
+    def __init__(self, path: Optional[Path] = SESSION_DB_PATH, budget_mb: float = SESSION_BUDGET_MB,
+                 ttl: float = SESSION_TTL, retention_days: float = SESSION_RETENTION_DAYS):
+        self.budget = int(budget_mb * 2 ** 20)
+        self.ttl = ttl
+        self.retention = retention_days * 86400
+        self.hot_bytes = 0
+        self.spilled = 0
+        self.reloaded = 0
+        self._hot: 'OrderedDict[str, Session]' = OrderedDict()
+        self._spilling: Dict[str, Session] = {}  # Evicted, still being written
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix='session-store')
+        # Without a path sessions live only in memory and eviction discards them
+        self.conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            self.prune()
+
+    def _submit(self, fn, *args) -> None:
+        try:
+            self._disk.submit(fn, *args)
+        except RuntimeError:
+            pass  # Closed; close() has flushed already
+
+    def close(self) -> None:
+        self._disk.shutdown(wait=True)
+        if self.conn is not None:
+            self.flush()
+            with self._db_lock:
+                self.conn.close()
+                self.conn = None
+
+    def _take(self, session_id: str, claim: bool = False) -> Optional[Session]:
+        """The in-memory session, or None. Hold _lock."""
+        session = self._hot.get(session_id)
+        if session is None:
+            session = self._spilling.pop(session_id, None)
+            if session is not None:
+                self._hot[session_id] = session
+                self.hot_bytes += session.size
+        if session is not None:
+            self._hot.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            session.users += claim
+        return session
+
+    def _admit(self, session: Session, claim: bool = False) -> Session:
+        """Add a loaded session, unless another copy got in first."""
+        with self._lock:
+            current = self._take(session.session_id, claim)
+            if current is not None:
+                return current
+            self._hot[session.session_id] = session
+            self.hot_bytes += session.size
+            session.last_used = time.monotonic()
+            session.users += claim
+            return session
+
+    def get(self, session_id: str) -> Session:
+        """The session, reloaded from disk if it was spilled (a new one if unknown)."""
+        with self._lock:
+            session = self._take(session_id)
+        return session if session is not None else self._admit(self._load(session_id))
+
+    async def aget(self, session_id: str, claim: bool = False) -> Session:
+        """get() without blocking the event loop; concurrent loads are shared."""
+        with self._lock:
+            session = self._take(session_id, claim)
+        if session is not None:
+            return session
+        pending = self._loading.get(session_id)
+        if pending is None:
+            pending = asyncio.get_running_loop().run_in_executor(self._disk, self._load, session_id)
+            self._loading[session_id] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(session_id, None))
+        return self._admit(await asyncio.shield(pending), claim)
+
+    def _release(self, session: Session) -> None:
+        with self._lock:
+            session.users -= 1
+            session.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def use(self, session_id: str, wait: bool = True) -> AsyncIterator[Session]:
+        """Hold a session's lock for one request."""
+        session = await self.aget(session_id, claim=True)
+        try:
+            if not wait and session.users > 1:
+                raise SessionBusy(session_id)
+            async with session.lock:
+                before = _fingerprint(session.messages)
+                try:
+                    yield session
+                finally:
+                    if _fingerprint(session.messages) != before:
+                        session.revision += 1
+                        self._submit(self._measure, session, session.revision)
+        finally:
+            self._release(session)
+            self._submit(self.evict)
+
+    def drop(self, session_id: str) -> bool:
+        """Forget a session in memory and on disk."""
+        with self._lock:
+            session = self._hot.pop(session_id, None)
+            if session is not None:
+                self.hot_bytes -= session.size
+            else:
+                session = self._spilling.pop(session_id, None)
+            if session is not None:
+                session.dropped = True
+        deleted = 0
+        if self.conn is not None:
+            with self._db_lock, self.conn:
+                deleted = self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+        return session is not None or deleted > 0
+
+    def _measure(self, session: Session, revision: int) -> None:
+        """Account for a session's new size after a request."""
+        if session.revision != revision:
+            return  # A later request changed it again and queued its own measurement
+        size = len(encode_messages(session.messages))
+        with self._lock:
+            if self._hot.get(session.session_id) is session:
+                self.hot_bytes += size - session.size
+            session.size = size
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Spill expired sessions, then LRU ones while over budget."""
+        now = time.monotonic() if now is None else now
+        victims = []
+        with self._lock:
+            for session_id, session in list(self._hot.items()):
+                expired = now - session.last_used > self.ttl
+                if not expired and self.hot_bytes <= self.budget:
+                    break
+                if session.users:
+                    continue
+                del self._hot[session_id]
+                self.hot_bytes -= session.size
+                self._spilling[session_id] = session
+                victims.append(session)
+        spilled, error = 0, None
+        for session in victims:
+            try:
+                self._spill(session)
+            except Exception as e:
+                error = e
+            spilled += self._settle(session)
+        self.spilled += spilled
+        if error is not None:
+            raise error
+        return spilled
+
+    def _settle(self, session: Session) -> int:
+        """1 if a spilled session left memory, 0 if it was kept."""
+        with self._lock:
+            if self._spilling.get(session.session_id) is not session:
+                return 0  # Taken back or dropped meanwhile
+            del self._spilling[session.session_id]
+            if session.dirty and self.conn is not None:
+                self._hot[session.session_id] = session
+                self._hot.move_to_end(session.session_id, last=False)
+                self.hot_bytes += session.size
+                return 0
+            return 1
+
+    def flush(self) -> int:
+        """Write every changed idle session to disk."""
+        with self._lock:
+            sessions = [s for s in self._hot.values() if s.dirty and not s.users]
+        for session in sessions:
+            self._spill(session)
+        return len(sessions)
+
+    def prune(self) -> int:
+        """Delete cold sessions not updated within the retention period."""
+        if self.conn is None:
+            return 0
+        with self._db_lock, self.conn:
+            return self.conn.execute("DELETE FROM sessions WHERE updated_at < ?",
+                                     (time.time() - self.retention,)).rowcount
+
+    def _spill(self, session: Session) -> None:
+        if self.conn is None or not session.dirty:
+            return
+        revision = session.revision
+        blob = zlib.compress(encode_messages(session.messages), COMPRESSION_LEVEL)
+        with self._db_lock:
+            # Skip sessions a request took back meanwhile
+            if self.conn is None or session.dropped or session.users or session.revision != revision:
+                return
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, updated_at, messages) VALUES (?, ?, ?)",
+                    (session.session_id, time.time(), blob),
+                )
+        session.saved = max(session.saved, revision)
+
+    def _load(self, session_id: str) -> Session:
+        session = Session(session_id)
+        if self.conn is None:
+            return session
+        with self._db_lock:
+            row = self.conn.execute("SELECT messages FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is not None:
+            session.messages = decode_messages(row[0])
+            session.size = len(encode_messages(session.messages))
+            self.reloaded += 1
+        return session
+
+    def cold_count(self) -> int:
+        if self.conn is None:
+            return 0
+        with self._db_lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Counters for monitoring."""
+        return {
+            "hot": len(self._hot),
+            "hot_bytes": self.hot_bytes,
+            "budget_bytes": self.budget,
+            "on_disk": self.cold_count(),
+            "spilled": self.spilled,
+            "reloaded": self.reloaded,
+        }
+
+    def __len__(self) -> int:
+        return len(self._hot)
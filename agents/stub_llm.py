@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Stub LLM - local OpenAI-compatible chat completions endpoint for tests.
+
+Answers POST /v1/chat/completions (streaming or not) with a scripted turn:
+query_metrics for named metrics, else get_business_summary, then a short
+answer. Latency and faults (errors, drops, stalls, slow outliers) are
+configurable and POST /v1/faults changes them at runtime. --replay serves
+the turns recorded by benchmark.py --record.
+
+Usage:
+    python stub_llm.py --port 8766 --ttft 0.2 --chunk-delay 0.01
+    python stub_llm.py --replay bench_transcripts.json
+    python stub_llm.py --error-rate 0.2 --error-status 503 --slow-rate 0.05 --slow-seconds 2
+    MULEROUTER_BASE_URL=http://127.0.0.1:8766/v1 python server.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from http_util import EventStream, HttpError, close_writer, read_request, send_json
+
+
+STUB_HOST = '127.0.0.1'
+STUB_PORT = 8766
+ANSWER_CHUNK = 16  # Characters per streamed content chunk
+
+# Words in a question -> the metric the stub asks for
+KEYWORD_EVENTS = {
+    'signup': 'signup_completed',
+    'dashboard': 'dashboard_viewed',
+    'chat': 'chat_messages',
+    'subscription': 'subscription_order_initiated',
+    'order': 'subscription_order_initiated',
+    'welcome': 'welcome_screen_viewed',
+}
+
+
+@dataclass
+class StubConfig:
+    ttft: float = 0.0  # Seconds before the first chunk / the response
+    chunk_delay: float = 0.0  # Seconds between streamed chunks
+    model: str = 'stub-model'
+    transcripts: Dict[str, List[Dict]] = field(default_factory=dict)  # Question -> recorded turns
+    # Injected faults, drawn per completion request
+    fail_first: int = 0  # The first N requests get an error response
+    error_rate: float = 0.0  # Share answered with error_status
+    error_status: int = 503
+    drop_rate: float = 0.0  # Share whose connection is closed without a response
+    stall_rate: float = 0.0  # Share that wait stall_seconds before answering
+    stall_seconds: float = 30.0
+    slow_rate: float = 0.0  # Share that wait slow_seconds more before answering
+    slow_seconds: float = 1.0
+    seed: Optional[int] = None
+
+    def faults(self) -> Dict:
+        return {k: v for k, v in asdict(self).items()
+                if k not in ('ttft', 'chunk_delay', 'model', 'transcripts', 'seed')}
+
+
+def load_transcripts(path: str) -> Dict[str, List[Dict]]:
+    """Question -> turns from a transcript file."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return {t['question']: t['turns'] for t in data.get('transcripts', [])}
+
+
+# ============= SCRIPTED TURNS =============
+
+def _tool_names(body: Dict) -> List[str]:
+    return [t.get('function', {}).get('name') for t in body.get('tools') or []]
+
+
+def replay_turn(messages: List[Dict], transcripts: Dict[str, List[Dict]]) -> Optional[Dict]:
+    """The recorded turn for this point of a transcript's conversation, if any."""
+    for position in range(len(messages) - 1, -1, -1):
+        if messages[position].get('role') == 'user':
+            break
+    else:
+        return None
+    turns = transcripts.get(str(messages[position].get('content', '')))
+    if not turns:
+        return None
+    step = sum(1 for m in messages[position + 1:] if m.get('role') == 'assistant')
+    turn = turns[min(step, len(turns) - 1)]
+    if 'tool_calls' not in turn:
+        return {"content": turn.get('content', '')}
+    return {"tool_calls": [{
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {
+            "name": call['name'],
+            "arguments": call['arguments'] if isinstance(call['arguments'], str) else json.dumps(call['arguments']),
+        },
+    } for call in turn['tool_calls']]}
+
+
+def plan_turn(body: Dict, transcripts: Optional[Dict[str, List[Dict]]] = None) -> Dict:
+    """The assistant message for a request: {"content"} or {"tool_calls"}."""
+    messages = body.get('messages') or []
+    replayed = replay_turn(messages, transcripts) if transcripts else None
+    if replayed is not None:
+        return replayed
+    last = messages[-1] if messages else {}
+    tools = _tool_names(body)
+
+    if last.get('role') == 'tool':
+        # Answer from the results of the latest tool round
+        results = []
+        for message in reversed(messages):
+            if message.get('role') != 'tool':
+                break
+            results.append(str(message.get('content', ''))[:120])
+        return {"content": "TL;DR: here is what the data shows. " + " | ".join(reversed(results))}
+
+    question = str(last.get('content', '')).lower()
+    events = sorted({event for word, event in KEYWORD_EVENTS.items() if word in question})
+    if events and 'query_metrics' in tools:
+        call = ('query_metrics', {"events": events, "aggregations": ["total", "avg"]})
+    elif '## Data Snapshot' in str(messages[0].get('content', '') if messages else ''):
+        return {"content": "TL;DR: answered from the data summary in the system prompt."}
+    elif 'get_business_summary' in tools:
+        call = ('get_business_summary', {})
+    else:
+        return {"content": "TL;DR: no tools available."}
+
+    name, arguments = call
+    return {"tool_calls": [{
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }]}
+
+
+def _usage(body: Dict, reply: Dict) -> Dict:
+    prompt = sum(len(str(m.get('content') or '')) for m in body.get('messages') or []) // 4
+    completion = len(json.dumps(reply)) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion,
+            "total_tokens": prompt + completion}
+
+
+# ============= HTTP =============
+
+class _Dropped(Exception):
+    """The injected fault closed the connection."""
+
+
+class StubServer:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.requests = 0
+        self.injected: Dict[str, int] = {}
+        self._rng = random.Random(config.seed)
+
+    async def inject_fault(self, writer: asyncio.StreamWriter, keep_alive: bool) -> bool:
+        """Apply the configured faults to a request. Returns True if it was answered with an error."""
+        c = self.config
+        draw = self._rng.random()
+        fault = None
+        if self.requests <= c.fail_first or draw < c.error_rate:
+            fault = 'error'
+        elif draw < c.error_rate + c.drop_rate:
+            fault = 'drop'
+        elif draw < c.error_rate + c.drop_rate + c.stall_rate:
+            fault = 'stall'
+        elif draw < c.error_rate + c.drop_rate + c.stall_rate + c.slow_rate:
+            fault = 'slow'
+        if fault is None:
+            return False
+        self.injected[fault] = self.injected.get(fault, 0) + 1
+
+        if fault == 'error':
+            await send_json(writer, c.error_status, {"error": {
+                "message": f"Injected fault: HTTP {c.error_status}", "type": "stub_fault",
+            }}, keep_alive, headers={'Retry-After': '0'} if c.error_status == 429 else None)
+            return True
+        if fault == 'drop':
+            raise _Dropped()
+        await asyncio.sleep(c.stall_seconds if fault == 'stall' else c.slow_seconds)
+        return False
+
+    def update_faults(self, body: Dict) -> Dict:
+        """Set fault fields from a JSON body; returns the faults now in effect."""
+        for key, value in body.items():
+            if key not in self.config.faults():
+                raise HttpError(400, f"Unknown fault setting: {key}")
+            setattr(self.config, key, int(value) if key in ('fail_first', 'error_status') else float(value))
+        if 'fail_first' in body:
+            self.requests = 0
+        return {**self.config.faults(), "injected": self.injected}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, max_body=16 * 1024 * 1024)
+                except HttpError as e:
+                    await send_json(writer, e.status, {"error": {"message": e.message}}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                if request.method == 'POST' and request.path.rstrip('/').endswith('/chat/completions'):
+                    try:
+                        body = request.json()
+                    except HttpError as e:
+                        await send_json(writer, e.status, {"error": {"message": e.message}}, request.keep_alive)
+                        continue
+                    self.requests += 1
+                    if not await self.inject_fault(writer, request.keep_alive):
+                        await self.complete(body, writer, request.keep_alive)
+                elif request.method == 'POST' and request.path.rstrip('/').endswith('/faults'):
+                    try:
+                        await send_json(writer, 200, self.update_faults(request.json()), request.keep_alive)
+                    except (HttpError, TypeError, ValueError) as e:
+                        await send_json(writer, 400, {"error": {"message": str(e)}}, request.keep_alive)
+                elif request.method == 'GET' and request.path.rstrip('/').endswith('/models'):
+                    await send_json(writer, 200, {"object": "list", "data": [
+                        {"id": self.config.model, "object": "model", "owned_by": "stub"}
+                    ]}, request.keep_alive)
+                else:
+                    await send_json(writer, 404, {"error": {"message": "Not found"}}, request.keep_alive)
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, _Dropped):
+            pass
+        finally:
+            await close_writer(writer)
+
+    async def complete(self, body: Dict, writer: asyncio.StreamWriter, keep_alive: bool) -> None:
+        reply = plan_turn(body, self.config.transcripts)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        model = body.get('model') or self.config.model
+        finish = 'tool_calls' if 'tool_calls' in reply else 'stop'
+        await asyncio.sleep(self.config.ttft)
+
+        if not body.get('stream'):
+            await send_json(writer, 200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": finish, "message": {
+                    "role": "assistant", "content": reply.get('content'),
+                    **({"tool_calls": reply['tool_calls']} if 'tool_calls' in reply else {}),
+                }}],
+                "usage": _usage(body, reply),
+            }, keep_alive)
+            return
+
+        stream = EventStream(writer, keep_alive=keep_alive)
+        await stream.start()
+
+        async def chunk(delta: Dict, finish_reason: Optional[str] = None, **extra) -> None:
+            await stream.send({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra,
+            })
+
+        await chunk({"role": "assistant", "content": ""})
+        content = reply.get('content') or ''
+        for i in range(0, len(content), ANSWER_CHUNK):
+            await asyncio.sleep(self.config.chunk_delay)
+            await chunk({"content": content[i:i + ANSWER_CHUNK]})
+        for index, call in enumerate(reply.get('tool_calls') or []):
+            await chunk({"tool_calls": [{"index": index, "id": call['id'], "type": "function",
+                                         "function": {"name": call['function']['name'], "arguments": ""}}]})
+            arguments = call['function']['arguments']
+            for i in range(0, len(arguments), ANSWER_CHUNK):
+                await asyncio.sleep(self.config.chunk_delay)
+                await chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[i:i + ANSWER_CHUNK]}}]})
+        await chunk({}, finish)
+        if (body.get('stream_options') or {}).get('include_usage'):
+            await stream.send({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": [], "usage": _usage(body, reply)})
+        await stream.send('[DONE]')
+        await stream.end()
+
+
+async def serve(host: str, port: int, config: StubConfig) -> None:
+    stub = StubServer(config)
+    listener = await asyncio.start_server(stub.handle, host, port)
+    replay = f", replaying {len(config.transcripts)} transcripts" if config.transcripts else ""
+    faults = {k: v for k, v in config.faults().items() if v and not k.endswith(('_status', '_seconds'))}
+    replay += f", faults {faults}" if faults else ""
+    print(f"🧪 Stub LLM on http://{host}:{port}/v1 (ttft {config.ttft}s, chunk delay {config.chunk_delay}s{replay})",
+          flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub for agent tests")
+    parser.add_argument('--host', default=STUB_HOST)
+    parser.add_argument('--port', type=int, default=STUB_PORT)
+    parser.add_argument('--ttft', type=float, default=0.0, help="Seconds before the first chunk")
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument('--replay', help="Transcript file whose recorded turns are replayed")
+    faults = parser.add_argument_group('faults')
+    faults.add_argument('--fail-first', type=int, default=0, help="Error responses for the first N requests")
+    faults.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with an error")
+    faults.add_argument('--error-status', type=int, default=503)
+    faults.add_argument('--drop-rate', type=float, default=0.0, help="Share of connections closed without a response")
+    faults.add_argument('--stall-rate', type=float, default=0.0, help="Share of requests that stall")
+    faults.add_argument('--stall-seconds', type=float, default=30.0)
+    faults.add_argument('--slow-rate', type=float, default=0.0, help="Share of requests with extra latency")
+    faults.add_argument('--slow-seconds', type=float, default=1.0)
+    faults.add_argument('--seed', type=int, help="Seed for fault draws")
+    args = parser.parse_args(argv)
+    config = StubConfig(args.ttft, args.chunk_delay,
+                        transcripts=load_transcripts(args.replay) if args.replay else {},
+                        fail_first=args.fail_first, error_rate=args.error_rate, error_status=args.error_status,
+                        drop_rate=args.drop_rate, stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+                        slow_rate=args.slow_rate, slow_seconds=args.slow_seconds, seed=args.seed)
+    try:
+        asyncio.run(serve(args.host, args.port, config))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data - Mixpanel- and UGC-shaped datasets at benchmark scales.
+
+Scales multiply the real export (1x: 10 events x 32 days, 30 videos); the
+real key event names come first so recorded transcripts work at every scale.
+
+Usage:
+    python synthetic_data.py --scale 100x --out ../data/synthetic/100x
+"""
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from hll import HyperLogLog
+from metric_db import MetricDB
+from metric_file import write_metric_file
+from query_engine import QueryEngine
+
+
+@dataclass(frozen=True)
+class Scale:
+    events: int
+    days: int
+    videos: int
+
+    @property
+    def cells(self) -> int:
+        return self.events * self.days
+
+
+SCALES = {
+    '1x': Scale(10, 32, 30),
+    '100x': Scale(100, 320, 3_000),
+    '10000x': Scale(1_000, 3_200, 50_000),
+}
+
+# Event names of the real export, used first so transcripts resolve at every scale
+KEY_EVENTS = [
+    'signup_completed', 'dashboard_viewed', 'chat_screen_viewed', 'subscription_page_viewed',
+    'subscription_order_initiated', 'chat_messages', 'successful_registration',
+    'welcome_screen_viewed', 'signup_start', 'open_app_within_1_week',
+]
+END_DAY = '2026-01-30'
+JSON_MAX_CELLS = 1_000_000  # Larger datasets are written as .bmet
+SKETCH_EVENTS = 4  # Events that get distinct-user sketches
+SPIKE_RATE = 0.002  # Share of event/days multiplied by 2-5x
+MISSING_RATE = 0.02  # Share of event/days with no data
+
+
+def event_names(n: int) -> List[str]:
+    return KEY_EVENTS[:n] + [f"synthetic_event_{i:05d}" for i in range(max(0, n - len(KEY_EVENTS)))]
+
+
+def generate_engine(scale: Scale, seed: int = 0, end: str = END_DAY) -> QueryEngine:
+    """Daily values for scale.events events over scale.days days ending at `end`."""
+    rng = np.random.default_rng(seed)
+    last = np.datetime64(end, 'D')
+    days = np.arange(last - scale.days + 1, last + 1)
+    weekday = (days.astype(np.int64) + 3) % 7
+
+    level = np.exp(rng.uniform(np.log(5), np.log(5000), (scale.events, 1)))
+    weekly = 1 + rng.uniform(-0.3, 0.3, (scale.events, 1)) * (weekday >= 5)
+    trend = np.exp(rng.normal(0, 0.3, (scale.events, 1)) * np.linspace(0, 1, scale.days))
+    rate = level * weekly * trend
+    rate *= np.where(rng.random(rate.shape) < SPIKE_RATE, rng.uniform(2, 5, rate.shape), 1)
+    values = rng.poisson(rate).astype(np.int64)
+    present = rng.random(values.shape) >= MISSING_RATE
+    values[~present] = 0
+    return QueryEngine(event_names(scale.events), days, values, present)
+
+
+def mixpanel_meta(engine: QueryEngine) -> Dict:
+    """The export's metadata fields for an engine."""
+    totals, _ = engine.range_totals()
+    return {
+        "project_id": "synthetic",
+        "scraped_at": engine.day_strings[-1],
+        "date_range": f"{engine.day_strings[0]} to {engine.day_strings[-1]}",
+        "summary": {f"total_{name}": int(total) for name, total in zip(engine.names[:5], totals[:5].tolist())},
+    }
+
+
+def generate_ugc(scale: Scale, seed: int = 0, end: str = END_DAY, window_days: int = 90) -> Dict:
+    """A ugc-data.json-shaped export with scale.videos videos."""
+    rng = np.random.default_rng(seed + 1)
+    n = scale.videos
+    n_creators = max(5, n // 20)
+    creators = rng.zipf(1.5, n) % n_creators
+    views = (rng.pareto(1.2, n) * 500).astype(np.int64) + 50
+    last = np.datetime64(end, 'D')
+    posted = last - rng.integers(0, min(window_days, scale.days), n)
+    platforms = np.array(['tiktok', 'instagram', 'youtube'])[rng.choice(3, n, p=[0.7, 0.2, 0.1])]
+    order = np.argsort(-views, kind='stable')
+
+    videos = []
+    for rank, i in enumerate(order.tolist(), 1):
+        day = date.fromisoformat(str(posted[i]))
+        videos.append({
+            "rank": rank,
+            "views": int(views[i]),
+            "viewsFormatted": f"{views[i]:,}",
+            "creatorHandle": f"@creator{creators[i]:05d}",
+            "creatorName": f"Creator {creators[i]}",
+            "postedAt": f"{day:%b} {day.day}, {day.year}",
+            "platform": str(platforms[i]),
+        })
+    per_creator: Dict[str, Dict] = {}
+    for v in videos:
+        c = per_creator.setdefault(v["creatorHandle"], {
+            "handle": v["creatorHandle"], "name": v["creatorName"], "postCount": 0, "totalViews": 0,
+        })
+        c["postCount"] += 1
+        c["totalViews"] += v["views"]
+    return {
+        "shareId": "synthetic",
+        "scrapedAt": f"{end}T00:00:00.000Z",
+        "summary": {"totalViews": int(views.sum()), "totalPosts": n},
+        "videos": videos,
+        "creators": sorted(per_creator.values(), key=lambda c: -c["totalViews"]),
+    }
+
+
+def write_sketches(path: Path, engine: QueryEngine, seed: int = 0, events: int = SKETCH_EVENTS) -> None:
+    """Distinct-user sketches for the first events; users repeat across days."""
+    rng = np.random.default_rng(seed + 2)
+    rows = []
+    for row in range(min(events, len(engine.names))):
+        pool = rng.integers(0, 2 ** 63, int(engine.values[row].max()) * 5 + 1, dtype=np.uint64)
+        for col in np.flatnonzero(engine.present[row]).tolist():
+            sketch = HyperLogLog()
+            sketch.add_hashes(pool[rng.integers(0, len(pool), int(engine.values[row, col]))])
+            rows.append((engine.names[row], engine.day_strings[col], sketch))
+    with MetricDB(path) as db:
+        db.reset()
+        db.merge_sketches(rows)
+
+
+def write_dataset(directory: Path, scale: Scale, seed: int = 0, sketches: bool = True) -> Dict[str, str]:
+    """Write all files of one dataset. Returns their paths by role."""
+    directory.mkdir(parents=True, exist_ok=True)
+    engine = generate_engine(scale, seed)
+    meta = mixpanel_meta(engine)
+
+    if scale.cells <= JSON_MAX_CELLS:
+        mixpanel_path = directory / 'mixpanel-data.json'
+        with open(mixpanel_path, 'w') as f:
+            json.dump({**meta, "events": {
+                name: {day: int(v) for day, v, p in zip(engine.day_strings, engine.values[row].tolist(),
+                                                         engine.present[row].tolist()) if p}
+                for row, name in enumerate(engine.names)
+            }}, f)
+    else:
+        mixpanel_path = directory / 'metrics.bmet'
+        write_metric_file(mixpanel_path, engine, meta)
+
+    ugc_path = directory / 'ugc-data.json'
+    with open(ugc_path, 'w') as f:
+        json.dump(generate_ugc(scale, seed), f)
+
+    paths = {"mixpanel": str(mixpanel_path), "ugc": str(ugc_path)}
+    if sketches:
+        sketch_path = directory / 'sketches.db'
+        write_sketches(sketch_path, engine, seed)
+        paths["sketches"] = str(sketch_path)
+    return paths
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark dataset")
+    parser.add_argument('--scale', choices=list(SCALES), default='1x')
+    parser.add_argument('--out', required=True, help="Directory to write into")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-sketches', action='store_true', help="Skip the distinct-user sketch store")
+    args = parser.parse_args(argv)
+
+    scale = SCALES[args.scale]
+    paths = write_dataset(Path(args.out), scale, args.seed, not args.no_sketches)
+    print(f"✅ {args.scale}: {scale.events:,} events x {scale.days:,} days, {scale.videos:,} videos")
+    for role, path in paths.items():
+        print(f"   {role}: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,10 +12,25 @@ def test_query(query: str):
     print("=" * 60)
 
     messages = []
-    for event in run_agent(query, messages):
-        if event.type == 'thinking':
+    streamed = False
+    for event in run_agent(query, messages, stream=True):
+        if event.type == 'route':
+            print(f"🧭 Route: {event.content['path']}"
+                  + (f" ({event.content['intent']})" if 'intent' in event.content else ""))
+
+        elif event.type == 'thinking':
+            if streamed:
+                print()
+                streamed = False
             print(f"💭 {event.content}")
 
+        elif event.type == 'response_delta':
+            if not streamed:
+                print(f"\n{'='*60}")
+                print("🤖 Response:")
+                streamed = True
+            print(event.content, end="", flush=True)
+
         elif event.type == 'tool_call':
             print(f"\n🔧 Tool: {event.content['name']}")
             print(f"   Args: {json.dumps(event.content['args'])}")
@@ -27,8 +42,11 @@ def test_query(query: str):
             print(f"   📊 Result: {result}")
 
         elif event.type == 'response':
-            print(f"\n{'='*60}")
-            print(f"🤖 Response:\n{event.content}")
+            if streamed:
+                print()
+            else:
+                print(f"\n{'='*60}")
+                print(f"🤖 Response:\n{event.content}")
 
         elif event.type == 'error':
             print(f"\n❌ Error: {event.content}")
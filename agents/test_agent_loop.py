@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Tests for the tool entry points of the async agent loop."""
+
+import asyncio
+import json
+
+import pytest
+
+import business_agent
+from business_agent import aexecute_tool, execute_tool
+
+
+@pytest.fixture
+def async_tool(monkeypatch):
+    calls = []
+
+    async def tool_echo(args):
+        calls.append(args)
+        await asyncio.sleep(0)
+        return json.dumps({"echo": args.get("text")})
+
+    monkeypatch.setitem(business_agent.TOOL_FUNCTIONS, 'echo', tool_echo)
+    return calls
+
+
+def test_sync_entry_point_runs_async_tool_without_a_loop(async_tool, pin_data):
+    pin_data({"signup_completed": {"2026-01-01": 1}})
+    assert json.loads(execute_tool('echo', {"text": "hi"})) == {"echo": "hi"}
+
+
+def test_sync_entry_point_refuses_inside_a_loop(async_tool, pin_data):
+    pin_data({"signup_completed": {"2026-01-01": 1}})
+
+    async def call():
+        return execute_tool('echo', {"text": "hi"})
+
+    with pytest.raises(RuntimeError, match='aexecute_tool'):
+        asyncio.run(call())
+    assert async_tool == []
+
+
+def test_async_entry_point_runs_both_kinds(async_tool, pin_data):
+    pin_data({"signup_completed": {"2026-01-01": 3, "2026-01-02": 4}})
+
+    async def call():
+        return await asyncio.gather(
+            aexecute_tool('echo', {"text": "hi"}),
+            aexecute_tool('get_metric_data', {"event_name": "signup_completed"}),
+        )
+
+    echo, metric = asyncio.run(call())
+    assert json.loads(echo) == {"echo": "hi"}
+    assert json.loads(metric)["stats"]["total"] == 7
+
+
+def test_unknown_tool():
+    assert "Unknown tool" in execute_tool('nope', {})
+    assert "Unknown tool" in asyncio.run(aexecute_tool('nope', {}))
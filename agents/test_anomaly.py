@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Tests for the anomaly model: resuming from a checkpoint must match a full rebuild."""
+
+import numpy as np
+import pytest
+
+from anomaly import CHECKPOINT_EVERY, CHECKPOINT_SPAN, AnomalyModel
+from query_engine import QueryEngine
+
+
+def make_events(n_events: int = 5, n_days: int = 120, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    days = [str(np.datetime64('2026-01-01') + i) for i in range(n_days)]
+    events = {}
+    for e in range(n_events):
+        weekly = 1 + 0.3 * np.sin(np.arange(n_days) * 2 * np.pi / 7)
+        counts = rng.poisson(200 * weekly)
+        events[f'event_{e}'] = {d: int(c) for d, c in zip(days, counts) if rng.random() > 0.05}
+    return events
+
+
+def assert_same(a: AnomalyModel, b: AnomalyModel) -> None:
+    assert a.names == b.names
+    assert np.array_equal(a.days, b.days)
+    assert np.allclose(a.z, b.z, equal_nan=True, atol=1e-4)
+    assert np.allclose(a.expected, b.expected, equal_nan=True, rtol=1e-5)
+
+
+@pytest.mark.parametrize('updates', [
+    {'event_2': {'2026-04-28': 5000}},  # a spike near the end
+    {'event_0': {'2026-04-20': 0}, 'event_4': {'2026-04-25': 150}},  # corrections inside the window
+    {'event_1': {'2026-05-01': 230, '2026-05-02': 240}},  # new days
+    {'event_new': {'2026-04-29': 10, '2026-04-30': 12}},  # a new event
+])
+def test_resume_matches_rebuild(updates):
+    engine = QueryEngine.from_events(make_events())
+    model = AnomalyModel.build(engine)
+    updated = engine.with_updates(updates)
+    first = int(np.searchsorted(updated.days, np.datetime64(min(d for s in updates.values() for d in s))))
+    resumed = model.resume(updated, first)
+    assert resumed is not None
+    assert_same(resumed, AnomalyModel.build(updated))
+
+
+def test_resume_keeps_checkpoints_bounded():
+    engine = QueryEngine.from_events(make_events())
+    model = AnomalyModel.build(engine)
+    for day in ('2026-05-01', '2026-05-02', '2026-05-03'):
+        engine = engine.with_updates({'event_0': {day: 100}})
+        model = model.resume(engine, len(engine.days) - 1)
+        assert model is not None
+    # Weekly checkpoints over the trailing span, plus the last column
+    last = len(engine.days) - 1
+    oldest = len(engine.days) - CHECKPOINT_SPAN
+    assert last in model.checkpoints
+    assert all(oldest <= col < last and (col + 1) % CHECKPOINT_EVERY == 0
+               for col in model.checkpoints if col != last)
+    assert_same(model, AnomalyModel.build(engine))
+
+
+def test_resume_declines_changes_before_checkpoints():
+    engine = QueryEngine.from_events(make_events())
+    model = AnomalyModel.build(engine)
+    updated = engine.with_updates({'event_0': {'2026-01-03': 999}})
+    assert model.resume(updated, 2) is None
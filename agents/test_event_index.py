@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Tests for event name resolution: exact, alias, fuzzy and not found."""
+
+from event_index import EventIndex, normalize, update_event_index
+
+NAMES = ["signup_completed", "signup_start", "dashboard_viewed", "chat_messages",
+         "subscription_page_viewed", "Welcome Screen Viewed"]
+
+
+def test_normalize():
+    assert normalize("  Dashboard-Viewed ") == "dashboard_viewed"
+    assert normalize("Welcome Screen Viewed") == "welcome_screen_viewed"
+
+
+def test_exact_and_normalized_names():
+    index = EventIndex(NAMES)
+    match = index.resolve("chat_messages")
+    assert (match.key, match.method, match.score) == ("chat_messages", 'exact', 1.0)
+    assert index.resolve("welcome screen viewed").key == "Welcome Screen Viewed"
+    assert index.resolve("Dashboard Viewed").method == 'exact'
+
+
+def test_aliases_and_plurals():
+    index = EventIndex(NAMES)
+    match = index.resolve("signups")
+    assert (match.key, match.method) == ("signup_completed", 'alias')
+    assert index.resolve("paywall views").key == "subscription_page_viewed"
+    assert index.resolve("signup_starts").key == "signup_start"
+    # Aliases pointing at missing events are dropped
+    assert "orders" not in index.aliases
+
+
+def test_custom_aliases_replace_the_defaults():
+    index = EventIndex(NAMES, aliases={"talks": "chat_messages"})
+    assert index.resolve("talks").key == "chat_messages"
+    assert index.resolve("signups").method != 'alias'
+
+
+def test_fuzzy_match_ranks_candidates():
+    index = EventIndex(NAMES)
+    match = index.resolve("dashbord view")
+    assert (match.key, match.method) == ("dashboard_viewed", 'fuzzy')
+    scores = [score for _, score in match.candidates]
+    assert scores == sorted(scores, reverse=True)
+    assert 0 < match.score < 1
+
+
+def test_unknown_name_is_not_found():
+    index = EventIndex(NAMES)
+    match = index.resolve("xyzzy")
+    assert match.key is None and match.method == 'none'
+    assert match.to_dict()["confidence"] == 'low'
+    assert EventIndex([]).resolve("signup").key is None
+
+
+def test_incremental_update_keeps_index_for_known_names():
+    index = EventIndex(NAMES)
+    assert update_event_index(index, None, {"events": {"chat_messages": {}}}) is index
+    assert update_event_index(index, None, {"events": {"new_event": {}}}) is None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Tests for the funnel engine: totals, per-bucket conversion series and partial buckets."""
+
+import json
+
+import numpy as np
+import pytest
+
+from business_agent import tool_analyze_funnel, tool_calculate_conversion
+from funnel import compute_funnel, format_rate
+from query_engine import QueryEngine
+
+
+def daily(first: str, last: str, value) -> dict:
+    days = np.arange(np.datetime64(first), np.datetime64(last) + 1)
+    return {str(d): value(i) if callable(value) else value for i, d in enumerate(days)}
+
+
+EVENTS = {
+    "visit": daily('2026-01-01', '2026-01-31', lambda i: 100 + i),
+    "signup": daily('2026-01-01', '2026-01-31', lambda i: 10 + i % 3),
+    "order": {**daily('2026-01-01', '2026-01-10', 2), **daily('2026-01-20', '2026-01-31', 3)},
+}
+
+
+def test_totals_and_step_conversion():
+    engine = QueryEngine.from_events(EVENTS)
+    funnel = compute_funnel(engine, ["visit", "signup", "order"], '2026-01-01', '2026-01-07')
+    assert funnel.totals.tolist() == [721, 76, 14]
+    assert np.allclose(funnel.step_conversion, [76 / 721, 14 / 76])
+    assert np.isclose(funnel.overall, 14 / 721)
+
+
+def test_daily_series_matches_the_ratios():
+    engine = QueryEngine.from_events(EVENTS)
+    funnel = compute_funnel(engine, ["visit", "signup", "order"])
+    for c, day in enumerate(funnel.labels):
+        assert np.isclose(funnel.series[0, c], EVENTS["signup"][day] / EVENTS["visit"][day])
+        if day in EVENTS["order"]:
+            assert np.isclose(funnel.overall_series[c], EVENTS["order"][day] / EVENTS["visit"][day])
+        else:
+            # No order data that day: undefined, not 0%
+            assert np.isnan(funnel.series[1, c]) and np.isnan(funnel.overall_series[c])
+    assert "2026-01-15" not in funnel.series_dict(1)
+    assert funnel.series_dict()["2026-01-01"] == format_rate(2 / 100)
+
+
+def test_weekly_series_covers_partial_weeks():
+    engine = QueryEngine.from_events(EVENTS)
+    funnel = compute_funnel(engine, ["visit", "signup"], granularity='week')
+    # 2026-01-01 is a Thursday; the 31st a Saturday
+    assert funnel.labels[0] == '2025-12-29' and funnel.labels[-1] == '2026-01-26'
+    assert funnel.covered.tolist() == [4, 7, 7, 7, 6]
+    assert funnel.length.tolist() == [7] * 5
+
+
+def test_needs_two_steps():
+    engine = QueryEngine.from_events(EVENTS)
+    with pytest.raises(ValueError):
+        compute_funnel(engine, ["visit"])
+
+
+def test_tools_label_partial_buckets(pin_data):
+    pin_data(EVENTS)
+    result = json.loads(tool_analyze_funnel({"steps": ["visit", "signup", "order"], "granularity": "month",
+                                             "start_date": "2026-01-05"}))
+    assert result["partial_buckets"] == {"2026-01": "27 of 31 days"}
+    assert set(result["step_series"]) == {"visit -> signup", "signup -> order"}
+
+    # A tight budget rolls the series up; the trailing bucket stops on the 31st either way
+    result = json.loads(tool_calculate_conversion({"start_event": "visit", "end_event": "signup",
+                                                   "start_date": "2026-01-05", "max_tokens": 150}))
+    assert result["granularity"] != 'day'
+    assert result["partial_buckets"]
+    full = json.loads(tool_analyze_funnel({"steps": ["visit", "signup"], "granularity": "day"}))
+    assert "partial_buckets" not in full
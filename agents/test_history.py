@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Tests for history compaction: the token budget and tool call / result pairing."""
+
+import copy
+import json
+
+import pytest
+
+from history import COMPACTED_KEY, SUMMARY_HEADER, HistoryManager, count_tokens
+
+
+def turn(i: int, calls: int = 2, series_days: int = 60) -> list:
+    ids = [f"call_{i}_{c}" for c in range(calls)]
+    series = {f"2026-01-{d % 28 + 1:02d}#{d}": d * 10 for d in range(series_days)}
+    return [
+        {"role": "user", "content": f"Question {i} about signups"},
+        {"role": "assistant", "content": "", "tool_calls": [
+            {"id": call_id, "type": "function",
+             "function": {"name": "get_metric_data", "arguments": json.dumps({"event_name": f"e{c}"})}}
+            for c, call_id in enumerate(ids)]},
+        *({"role": "tool", "tool_call_id": call_id,
+           "content": json.dumps({"event": f"e{c}", "total": 123, "data": series})}
+          for c, call_id in enumerate(ids)),
+        {"role": "assistant", "content": f"Answer {i}: signups rose."},
+    ]
+
+
+def conversation(turns: int, **options) -> list:
+    messages = [{"role": "system", "content": "You are a business analyst."}]
+    for i in range(turns):
+        messages += turn(i, **options)
+    return messages
+
+
+def assert_paired(messages: list) -> None:
+    """Every tool_calls message is followed by exactly its tool results, and no tool result is orphaned."""
+    i = 0
+    while i < len(messages):
+        message = messages[i]
+        assert message["role"] != "tool", f"orphaned tool result at {i}"
+        if message.get("tool_calls"):
+            expected = [call["id"] for call in message["tool_calls"]]
+            replies = [m.get("tool_call_id") for m in messages[i + 1:i + 1 + len(expected)]]
+            assert replies == expected
+            i += len(expected)
+        i += 1
+
+
+def test_under_budget_is_untouched():
+    messages = conversation(2)
+    original = copy.deepcopy(messages)
+    manager = HistoryManager(budget=manager_total(messages) + 1)
+    assert manager.compact(messages) is None
+    assert messages == original
+
+
+def manager_total(messages: list) -> int:
+    return HistoryManager().total_tokens(messages)
+
+
+def test_tool_results_are_summarized_before_turns_are_folded():
+    messages = conversation(4)
+    total = manager_total(messages)
+    manager = HistoryManager(budget=int(total * 0.7))
+    report = manager.compact(messages)
+    assert report["after"] <= manager.budget
+    assert report["after"] == manager.total_tokens(messages)
+    # Every turn is still there, only earlier tool results got shorter
+    assert sum(m["role"] == "user" for m in messages) == 4
+    compacted = [m for m in messages if m["role"] == "tool" and COMPACTED_KEY in m["content"]]
+    assert compacted and all(json.loads(m["content"])["total"] == 123 for m in compacted)
+    assert_paired(messages)
+
+
+@pytest.mark.parametrize('turns,calls', [(6, 1), (8, 3), (12, 2)])
+def test_folding_keeps_pairs_and_fits(turns, calls):
+    messages = conversation(turns, calls=calls)
+    current = copy.deepcopy(turn(turns - 1, calls=calls))
+    manager = HistoryManager(budget=manager_total(current) + 250, keep_recent_turns=1,
+                             max_summary_lines=2)
+    report = manager.compact(messages)
+    assert report["after"] == manager.total_tokens(messages) <= manager.budget
+    assert_paired(messages)
+    assert messages[0]["content"] == "You are a business analyst."
+    assert messages[1]["content"].startswith(SUMMARY_HEADER)
+    assert "get_metric_data" in messages[1]["content"]
+    # The current turn is never touched
+    assert messages[-len(current):] == current
+
+
+def test_recent_turns_are_kept_even_over_budget():
+    messages = conversation(5)
+    manager = HistoryManager(budget=10, keep_recent_turns=2)
+    manager.compact(messages)
+    assert [m["content"] for m in messages if m["role"] == "user"] == ["Question 3 about signups",
+                                                                       "Question 4 about signups"]
+    assert_paired(messages)
+
+
+def test_summary_is_bounded():
+    messages = conversation(10, series_days=5)
+    manager = HistoryManager(budget=1, keep_recent_turns=1, max_summary_lines=3)
+    manager.compact(messages)
+    summary = messages[1]["content"].split("\n")
+    assert summary[0] == SUMMARY_HEADER and len(summary) == 4
+    assert "Question 8" in summary[-1]
+
+
+def test_count_tokens():
+    assert count_tokens('') == 0
+    assert count_tokens('signups rose') > 0
+    assert count_tokens('signups rose') == count_tokens('signups rose')
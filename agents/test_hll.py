@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Tests for the HyperLogLog sketch: estimate error, merging and serialization."""
+
+import numpy as np
+import pytest
+
+from hll import HyperLogLog, hash_id, standard_error
+
+
+def sketch(ids, precision: int = 14) -> HyperLogLog:
+    hll = HyperLogLog(precision)
+    hll.update(ids)
+    return hll
+
+
+@pytest.mark.parametrize('n', [10, 1_000, 100_000])
+def test_estimate_within_error(n):
+    estimate = sketch(f'user-{i}' for i in range(n)).estimate()
+    # 4 standard errors: a deterministic hash, so this never flakes
+    assert abs(estimate - n) <= max(4 * standard_error() * n, 1)
+
+
+def test_duplicates_do_not_count():
+    once = sketch(range(5_000))
+    twice = sketch(list(range(5_000)) * 2)
+    assert np.array_equal(once.registers, twice.registers)
+
+
+def test_merge_estimates_union():
+    a = sketch(f'user-{i}' for i in range(0, 60_000))
+    b = sketch(f'user-{i}' for i in range(40_000, 100_000))
+    union = sketch(f'user-{i}' for i in range(100_000))
+    merged = a.copy().merge(b)
+    assert np.array_equal(merged.registers, union.registers)
+    assert abs(merged.estimate() - 100_000) <= 4 * standard_error() * 100_000
+    # merge works in place on the receiver only
+    assert not np.array_equal(a.registers, merged.registers)
+
+
+def test_merge_rejects_precision_mismatch():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(14))
+
+
+def test_add_hashes_matches_add():
+    ids = [f'user-{i}' for i in range(2_000)]
+    one_by_one = sketch(ids)
+    batched = HyperLogLog()
+    batched.add_hashes(np.array([hash_id(i) for i in ids], dtype=np.uint64))
+    assert np.array_equal(one_by_one.registers, batched.registers)
+
+
+def test_bytes_roundtrip():
+    hll = sketch(range(10_000), precision=12)
+    restored = HyperLogLog.from_bytes(hll.to_bytes(), precision=12)
+    assert np.array_equal(restored.registers, hll.registers)
+    assert restored.estimate() == hll.estimate()
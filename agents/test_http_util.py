@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Tests for the HTTP plumbing: request parsing and chunked SSE framing."""
+
+import asyncio
+import json
+
+import pytest
+
+from http_util import EventStream, HttpError, read_request
+
+
+class Writer:
+    """Collects what would go over the socket."""
+
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    async def drain(self) -> None:
+        pass
+
+
+def unchunk(body: bytes) -> bytes:
+    """Decode a chunked body, checking each chunk's size and the terminator."""
+    out = b''
+    while True:
+        size, _, rest = body.partition(b'\r\n')
+        size = int(size, 16)
+        if size == 0:
+            assert rest == b'\r\n'
+            return out
+        assert rest[size:size + 2] == b'\r\n'
+        out, body = out + rest[:size], rest[size + 2:]
+
+
+def stream(*frames, keep_alive=False):
+    writer = Writer()
+
+    async def go():
+        sse = EventStream(writer, keep_alive=keep_alive)
+        await sse.start({'X-Session-Id': 's1'})
+        for data, event in frames:
+            await sse.send(data, event)
+        await sse.end()
+
+    asyncio.run(go())
+    head, _, body = writer.data.partition(b'\r\n\r\n')
+    return head.decode('latin-1'), unchunk(body).decode('utf-8')
+
+
+def test_headers():
+    head, _ = stream()
+    assert head.startswith('HTTP/1.1 200 OK\r\n')
+    for line in ('Content-Type: text/event-stream', 'Transfer-Encoding: chunked',
+                 'Connection: close', 'X-Session-Id: s1'):
+        assert line in head.split('\r\n')
+    assert 'Connection: keep-alive' in stream(keep_alive=True)[0]
+
+
+def test_frames():
+    _, body = stream(({"type": "response_delta", "content": "héllo"}, None), ('[DONE]', 'end'))
+    frames = body.split('\n\n')
+    assert frames[-1] == ''
+    assert json.loads(frames[0].removeprefix('data: ')) == {"type": "response_delta", "content": "héllo"}
+    assert frames[1] == 'event: end\ndata: [DONE]'
+
+
+def test_multiline_data_stays_in_one_frame():
+    _, body = stream(('line one\nline two', None))
+    assert body == 'data: line one\ndata: line two\n\n'
+
+
+def read(raw: bytes, **kwargs):
+    async def go():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader, **kwargs)
+    return asyncio.run(go())
+
+
+def test_read_request():
+    body = b'{"message": "hi"}'
+    request = read(b'POST /chat/stream?session=a HTTP/1.1\r\nContent-Length: %d\r\n'
+                   b'Connection: close\r\n\r\n%s' % (len(body), body))
+    assert (request.method, request.path, request.query) == ('POST', '/chat/stream', {'session': 'a'})
+    assert request.json() == {"message": "hi"}
+    assert not request.keep_alive
+    assert read(b'') is None
+
+
+@pytest.mark.parametrize('raw, status', [
+    (b'GARBAGE\r\n\r\n', 400),
+    (b'POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n', 400),
+    (b'POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n', 413),
+])
+def test_bad_requests(raw, status):
+    with pytest.raises(HttpError) as e:
+        read(raw, max_body=10)
+    assert e.value.status == status
+
+
+def test_json_body_must_be_an_object():
+    request = read(b'POST / HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]')
+    with pytest.raises(HttpError, match='JSON object'):
+        request.json()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Tests for NDJSON ingest: parsing, day bucketing, batching and scraped_at."""
+
+import gzip
+import json
+
+import pytest
+
+from ingest import ingest_ndjson, main
+from metric_db import MetricDB, load_metric_db, union_sketches
+
+DAY = 1769731200  # 2026-01-30T00:00:00Z
+
+
+def record(event, ts, user=None, **props):
+    properties = {"time": ts, **props}
+    if user is not None:
+        properties["distinct_id"] = user
+    return json.dumps({"event": event, "properties": properties})
+
+
+@pytest.fixture
+def export(tmp_path):
+    lines = [
+        record("signup_completed", DAY + 10, "u1", platform="ios"),
+        record("signup_completed", (DAY + 20) * 1000, "u2", platform="android"),  # Milliseconds
+        record("signup_completed", DAY - 10, "u1", platform="ios"),  # Previous day
+        "",
+        "{not json",
+        json.dumps([1, 2]),
+        json.dumps({"event": "no_time", "properties": {}}),
+        json.dumps({"properties": {"time": DAY}}),
+        record("dashboard_viewed", DAY + 30, "u1"),
+    ]
+    path = tmp_path / 'export.ndjson'
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+
+def test_counts_days_and_skips(tmp_path, export):
+    db_path = tmp_path / 'metrics.db'
+    with MetricDB(db_path) as db:
+        stats = ingest_ndjson(db, [str(export)], properties=['platform'], batch_keys=2)
+    assert (stats.events, stats.skipped, stats.lines) == (4, 4, 9)
+    assert stats.flushes > 1
+
+    data = load_metric_db(db_path)
+    assert data["events"]["signup_completed"] == {"2026-01-29": 1, "2026-01-30": 2}
+    assert data["events"]["dashboard_viewed"] == {"2026-01-30": 1}
+    assert data["events"]["signup_completed [platform=ios]"] == {"2026-01-29": 1, "2026-01-30": 1}
+    assert data["scraped_at"] == "2026-01-30"
+
+
+def test_batches_add_up(tmp_path, export):
+    db_path = tmp_path / 'metrics.db'
+    with MetricDB(db_path) as db:
+        ingest_ndjson(db, [str(export)])
+        ingest_ndjson(db, [str(export)])
+    assert load_metric_db(db_path)["events"]["signup_completed"]["2026-01-30"] == 4
+
+
+def test_utc_offset_moves_days(tmp_path, export):
+    db_path = tmp_path / 'metrics.db'
+    with MetricDB(db_path) as db:
+        ingest_ndjson(db, [str(export)], utc_offset_hours=1)
+    assert load_metric_db(db_path)["events"]["signup_completed"] == {"2026-01-30": 3}
+
+
+def test_sketches_count_distinct_users(tmp_path, export):
+    db_path = tmp_path / 'metrics.db'
+    with MetricDB(db_path) as db:
+        ingest_ndjson(db, [str(export)])
+    sketches, merged = union_sketches(db_path, ["signup_completed"])
+    assert merged == 2
+    assert round(sketches["signup_completed"].estimate()) == 2
+
+
+def test_scraped_at_does_not_move_back(tmp_path, export):
+    db_path = tmp_path / 'metrics.db'
+    older = tmp_path / 'older.ndjson.gz'
+    with gzip.open(older, 'wt') as f:
+        f.write(record("signup_completed", DAY - 5 * 86400, "u3") + '\n')
+    with MetricDB(db_path) as db:
+        ingest_ndjson(db, [str(export)])
+        ingest_ndjson(db, [str(older)])
+        assert db.get_meta('scraped_at') == "2026-01-30"
+        ingest_ndjson(db, [str(older)], scraped_at="2026-01-26")
+        assert db.get_meta('scraped_at') == "2026-01-26"
+
+
+def test_cli(tmp_path, export, capsys):
+    db_path = tmp_path / 'metrics.db'
+    assert main([str(export), '--db', str(db_path), '--no-sketches', '--scraped-at', '2026-02-01']) == 0
+    data = load_metric_db(db_path)
+    assert data["scraped_at"] == "2026-02-01"
+    assert union_sketches(db_path, ["signup_completed"]) == ({}, 0)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Tests for the fast-path router: which questions it answers and which it leaves to the LLM."""
+
+import json
+
+import pytest
+
+from intent_router import Intent, route_query
+from metric_store import MetricSnapshot
+
+EVENTS = {
+    "signup_completed": {"2026-01-27": 40, "2026-01-28": 52, "2026-01-29": 47},
+    "signup_start": {"2026-01-27": 90, "2026-01-28": 101, "2026-01-29": 95},
+    "dashboard_viewed": {"2026-01-27": 300, "2026-01-28": 310, "2026-01-29": 290},
+}
+
+
+@pytest.fixture
+def snapshot():
+    return MetricSnapshot(version=-1, data={"events": EVENTS, "scraped_at": "2026-01-30T08:00:00"})
+
+
+def test_metric_yesterday(snapshot):
+    intent = route_query("How many signups yesterday?", snapshot)
+    assert (intent.name, intent.tool) == ('metric_on_day', 'get_metric_data')
+    assert intent.args == {'event_name': 'signup_completed', 'start_date': '2026-01-29', 'end_date': '2026-01-29'}
+
+
+def test_metric_over_last_days(snapshot):
+    intent = route_query("dashboard views last 3 days", snapshot)
+    assert intent.name == 'metric_over_range'
+    assert intent.args == {'event_name': 'dashboard_viewed', 'start_date': '2026-01-27', 'end_date': '2026-01-29'}
+
+
+def test_conversion(snapshot):
+    intent = route_query("What is the conversion from signup start to signups?", snapshot)
+    assert intent.tool == 'calculate_conversion'
+    assert intent.args == {'start_event': 'signup_start', 'end_event': 'signup_completed'}
+
+
+@pytest.mark.parametrize('query', [
+    "Why did signups drop yesterday?",           # Needs reasoning
+    "Compare signups last week and this week",
+    "signups",                                    # No period
+    "How many frobnications yesterday?",         # Unknown metric
+    "conversion from signups to signups",         # Same event twice
+    "conversion from signup start to signups last week",  # Dated conversion
+])
+def test_declines(snapshot, query):
+    assert route_query(query, snapshot) is None
+
+
+def test_declines_without_data():
+    assert route_query("signups yesterday", MetricSnapshot(version=-1, data={})) is None
+
+
+def test_render_declines_errors_and_empty_results(snapshot):
+    intent = route_query("signups last 3 days", snapshot)
+    assert intent.render(json.dumps({"error": "No data"})) is None
+    assert intent.render("not json") is None
+    assert intent.render(json.dumps({"event": "signup_completed", "stats": {"days": 0}})) is None
+
+    answer = intent.render(json.dumps({
+        "event": "signup_completed", "granularity": "day",
+        "stats": {"total": 139, "average": 46.33, "max": 52, "min": 40, "days": 3},
+        "data": {"2026-01-27": 40, "2026-01-28": 52, "2026-01-29": 47},
+    }))
+    assert "**139**" in answer and "Peak: 52 on 2026-01-28" in answer
+
+
+def test_intent_render_uses_format():
+    intent = Intent('x', 'get_metric_data', {}, format=lambda data: f"{data['n']} rows")
+    assert intent.render('{"n": 3}') == "3 rows"
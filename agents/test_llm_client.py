@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Tests for the LLM client's circuit breaker state transitions."""
+
+import pytest
+
+from llm_client import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def open_breaker(failures: int = 3, cooldown: float = 30.0):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failures, cooldown, clock)
+    for _ in range(failures):
+        assert breaker.allow() is False
+        breaker.failure()
+    return breaker, clock
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(3, 30.0, FakeClock())
+    for _ in range(2):
+        breaker.allow()
+        breaker.failure()
+    assert breaker.state == 'closed'
+    breaker.allow()
+    breaker.success()  # A success resets the streak
+    for _ in range(2):
+        breaker.allow()
+        breaker.failure()
+    assert breaker.state == 'closed'
+    breaker.failure()
+    assert breaker.state == 'open'
+    assert breaker.opened == 1
+
+
+def test_open_fails_fast_until_cooldown():
+    breaker, clock = open_breaker()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now += 1
+    assert breaker.allow() is True  # The probe
+    assert breaker.state == 'half_open'
+
+
+def test_single_probe_in_half_open():
+    breaker, clock = open_breaker()
+    clock.now += 30
+    assert breaker.allow() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_probe_success_closes():
+    breaker, clock = open_breaker()
+    clock.now += 30
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert breaker.consecutive == 0
+    assert breaker.allow() is False
+
+
+def test_probe_failure_reopens():
+    breaker, clock = open_breaker()
+    clock.now += 30
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == 'open'
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # A fresh cooldown from the probe's failure
+    clock.now += 30
+    assert breaker.allow() is True
+
+
+def test_release_frees_probe_slot():
+    breaker, clock = open_breaker()
+    clock.now += 30
+    probe = breaker.allow()
+    breaker.release(probe)  # Cancelled without an outcome
+    assert breaker.state == 'half_open'
+    assert breaker.allow() is True
+
+
+def test_release_of_non_probe_keeps_probe():
+    breaker, clock = open_breaker()
+    clock.now += 30
+    breaker.allow()
+    breaker.release(False)
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
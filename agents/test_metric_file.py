@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Tests for the .bmet metric file: round-trip, metadata and header checks."""
+
+import json
+
+import numpy as np
+import pytest
+
+from metric_file import MetricFileError, convert, load_metric_file, open_metric_file, write_metric_file
+from query_engine import QueryEngine
+
+EVENTS = {
+    "signup_completed": {"2026-01-01": 3, "2026-01-02": 5, "2026-01-04": 2},
+    "dashboard_viewed": {"2026-01-02": 10, "2026-01-03": 12},
+    "événement ✓": {"2026-01-03": 1},
+}
+META = {"project_id": "123", "scraped_at": "2026-01-05", "summary": {"note": "x"}}
+
+
+def same_engine(a: QueryEngine, b: QueryEngine) -> None:
+    assert list(a.names) == list(b.names)
+    assert np.array_equal(a.days, b.days)
+    assert np.array_equal(a.values, b.values) and a.values.dtype == b.values.dtype
+    assert np.array_equal(a.present, b.present)
+    assert np.array_equal(a.value_cumsum, b.value_cumsum)
+    assert np.array_equal(a.count_cumsum, b.count_cumsum)
+
+
+@pytest.mark.parametrize('scale', [1, 0.5])
+def test_round_trip(tmp_path, scale):
+    events = {name: {day: value * scale for day, value in series.items()} for name, series in EVENTS.items()}
+    engine = QueryEngine.from_events(events)
+    path = tmp_path / 'data.bmet'
+    write_metric_file(path, engine, META)
+
+    opened, meta = open_metric_file(path)
+    same_engine(engine, opened)
+    assert meta == META
+    assert opened.total("signup_completed") == 10 * scale
+    assert opened.range_stats("dashboard_viewed", '2026-01-03') == engine.range_stats("dashboard_viewed", '2026-01-03')
+
+
+def test_load_matches_the_json_shape(tmp_path):
+    path = tmp_path / 'data.bmet'
+    write_metric_file(path, QueryEngine.from_events(EVENTS), META)
+    data = load_metric_file(path)
+    assert data["scraped_at"] == "2026-01-05"
+    assert {name: dict(series) for name, series in data["events"].items()} == EVENTS
+    assert sorted(data["available_events"]) == sorted(EVENTS)
+
+
+def test_convert_from_json(tmp_path):
+    source = tmp_path / 'data.json'
+    source.write_text(json.dumps({"events": EVENTS, **META}))
+    info = convert(source, tmp_path / 'data.bmet')
+    assert (info["events"], info["days"]) == (3, 4)
+    assert not (tmp_path / 'data.bmet.tmp').exists()
+    same_engine(QueryEngine.from_events(EVENTS), open_metric_file(tmp_path / 'data.bmet')[0])
+
+
+def test_rejects_other_files(tmp_path):
+    short = tmp_path / 'short.bmet'
+    short.write_bytes(b'BOSMETRC')
+    with pytest.raises(MetricFileError, match='too short'):
+        open_metric_file(short)
+
+    other = tmp_path / 'other.bmet'
+    other.write_bytes(b'\0' * 256)
+    with pytest.raises(MetricFileError, match='not a metric file'):
+        open_metric_file(other)
+
+    path = tmp_path / 'data.bmet'
+    write_metric_file(path, QueryEngine.from_events(EVENTS), META)
+    raw = bytearray(path.read_bytes())
+    raw[8] = 99  # Format version
+    path.write_bytes(bytes(raw))
+    with pytest.raises(MetricFileError, match='format version 99'):
+        open_metric_file(path)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Tests for the metric store's delta log: applying, reloading, summaries and compaction."""
+
+import json
+
+import pytest
+
+import metric_store
+import refresh
+from metric_db import MetricDB
+from metric_file import convert
+from metric_store import MetricStore
+
+
+def export(path, events, **extra):
+    days = sorted(d for series in events.values() for d in series)
+    data = {"project_id": "1", "scraped_at": days[-1], "date_range": f"{days[0]} to {days[-1]}",
+            "events": events, "summary": {}, "available_events": sorted(events), **extra}
+    path.write_text(json.dumps(data))
+    return path
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    return export(tmp_path / 'mixpanel-data.json', {
+        "signup_completed": {"2026-01-01": 10, "2026-01-02": 20},
+        "dashboard_viewed": {"2026-01-01": 5},
+    })
+
+
+def events_of(store: MetricStore) -> dict:
+    events = store.snapshot().data['events']
+    return {name: dict(events[name]) for name in events}
+
+
+def test_delta_is_served_and_survives_a_cold_start(data_file):
+    store = MetricStore(data_file)
+    before = store.snapshot()
+    after = store.apply_delta({"events": {"signup_completed": {"2026-01-02": 25, "2026-01-03": 30}}})
+    assert after.version > before.version
+    assert before.data['events']['signup_completed'] == {"2026-01-01": 10, "2026-01-02": 20}
+    assert after.data['events']['signup_completed'] == {"2026-01-01": 10, "2026-01-02": 25, "2026-01-03": 30}
+    assert after.data['date_range'] == "2026-01-01 to 2026-01-03"
+    assert events_of(MetricStore(data_file)) == events_of(store)
+
+
+def test_invalid_delta_is_rejected(data_file):
+    store = MetricStore(data_file)
+    with pytest.raises(ValueError):
+        store.apply_delta({"events": {"signup_completed": {"2026-1-2": 1}}})
+    assert not store.delta_path.exists()
+
+
+def test_summary_totals_follow_the_delta(tmp_path):
+    days = [f"2026-01-{d:02d}" for d in range(1, 31)]
+    path = export(tmp_path / 'data.json', {"signup_completed": {d: 10 for d in days}},
+                  summary={"total_signups_30d": 300, "avg_daily_signups": 10})
+    store = MetricStore(path)
+    snapshot = store.apply_delta({"events": {"signup_completed": {"2026-01-31": 40}}})
+    # The window slides a day: 2026-01-01 (10) leaves, 2026-01-31 (40) joins
+    assert snapshot.data['summary'] == {"total_signups_30d": 330, "avg_daily_signups": 11}
+
+
+def test_rewriting_the_data_file_retires_old_deltas(data_file):
+    store = MetricStore(data_file)
+    store.apply_delta({"events": {"dashboard_viewed": {"2026-01-01": 99}}})
+    export(data_file, {"dashboard_viewed": {"2026-01-01": 7}})
+    assert events_of(MetricStore(data_file)) == {"dashboard_viewed": {"2026-01-01": 7}}
+
+
+@pytest.mark.parametrize('suffix', ['.json', '.bmet'])
+def test_compact_writes_the_log_into_the_data_file(data_file, suffix):
+    path = data_file
+    if suffix == '.bmet':
+        path = data_file.with_suffix('.bmet')
+        convert(data_file, path)
+    store = MetricStore(path)
+    store.apply_delta({"events": {"signup_completed": {"2026-01-03": 30}, "new_event": {"2026-01-02": 1}}})
+    served = events_of(store)
+    version = store.snapshot().version
+
+    snapshot = store.compact()
+    assert not store.delta_path.exists()
+    assert snapshot.version == version  # Same data, so caches keyed on the version stay valid
+    assert store.snapshot() is snapshot
+    cold = MetricStore(path)
+    assert events_of(cold) == served
+    assert cold.snapshot().data['date_range'] == "2026-01-01 to 2026-01-03"
+
+
+def test_compact_sqlite_store(tmp_path):
+    path = tmp_path / 'metrics.db'
+    with MetricDB(path) as db:
+        db.set_counts([("signup_completed", "2026-01-01", 10)])
+        db.add_property_counts([("signup_completed", "plan", "pro", "2026-01-01", 4)])
+    store = MetricStore(path)
+    store.apply_delta({"events": {"signup_completed": {"2026-01-02": 20},
+                                  "signup_completed [plan=pro]": {"2026-01-01": 5}}})
+    served = events_of(store)
+    store.compact()
+    assert events_of(MetricStore(path)) == served
+    with MetricDB(path) as db:
+        assert db.conn.execute("SELECT COUNT(*) FROM event_daily").fetchone()[0] == 2
+
+
+def test_log_is_compacted_past_the_threshold(data_file, monkeypatch):
+    monkeypatch.setattr(metric_store, 'COMPACT_DELTA_BYTES', 200)
+    store = MetricStore(data_file)
+    for day in range(3, 13):
+        store.apply_delta({"events": {"signup_completed": {f"2026-01-{day:02d}": day}}})
+        assert store._delta_size() <= 200
+    assert events_of(MetricStore(data_file))["signup_completed"]["2026-01-12"] == 12
+
+
+def test_refresh_cli_diffs_and_compacts(data_file, tmp_path):
+    fresh = export(tmp_path / 'fresh.json', {
+        "signup_completed": {"2026-01-01": 10, "2026-01-02": 21},
+        "dashboard_viewed": {"2026-01-01": 5},
+    })
+    assert refresh.main([str(fresh), '--data', str(data_file)]) == 0
+    log = [json.loads(line) for line in (tmp_path / 'mixpanel-data.json.delta.ndjson').read_text().splitlines()]
+    assert log[0]["delta"]["events"] == {"signup_completed": {"2026-01-02": 21}}
+    assert refresh.main(['--compact', '--data', str(data_file)]) == 0
+    assert json.loads(data_file.read_text())["events"]["signup_completed"]["2026-01-02"] == 21
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Tests for output shaping: series rollups to the point budget and fit() trimming."""
+
+import json
+
+import numpy as np
+
+from output_shaping import estimate_tokens, fit, partial_buckets, point_budget, shape_series
+from query_engine import QueryEngine
+
+
+def daily(first: str, last: str, value: int = 10) -> dict:
+    return {str(d): value for d in np.arange(np.datetime64(first), np.datetime64(last) + 1)}
+
+
+def test_series_fits_at_the_finest_granularity():
+    engine = QueryEngine.from_events({"signup": daily('2026-01-01', '2026-01-20')})
+    series, granularity, partial = shape_series(engine, "signup", None, None, 2000)
+    assert granularity == 'day' and len(series) == 20 and partial == {}
+
+
+def test_long_series_rolls_up_and_flags_partial_buckets():
+    engine = QueryEngine.from_events({"signup": daily('2025-01-15', '2025-12-10')})
+    # Too many days and weeks for the budget, so months
+    series, granularity, partial = shape_series(engine, "signup", None, None, 400)
+    assert granularity == 'month'
+    assert len(series) <= point_budget(400)
+    assert series["2025-03"] == 310
+    assert partial == {"2025-01": "17 of 31 days", "2025-12": "10 of 31 days"}
+
+
+def test_weekly_rollup_partial_edges():
+    engine = QueryEngine.from_events({"signup": daily('2026-01-01', '2026-03-31')})
+    # 2026-01-07 is a Wednesday
+    series, granularity, partial = shape_series(engine, "signup", '2026-01-07', '2026-03-31', 300)
+    assert granularity == 'week'
+    assert partial == {"2026-01-05": "5 of 7 days", "2026-03-30": "2 of 7 days"}
+    assert series["2026-01-05"] == 50 and series["2026-01-12"] == 70
+
+
+def test_overflowing_months_keep_the_most_recent():
+    engine = QueryEngine.from_events({"signup": daily('2018-01-10', '2025-12-31')})
+    series, granularity, partial = shape_series(engine, "signup", None, None, 200)
+    assert granularity == 'month'
+    assert list(series)[-1] == '2025-12' and len(series) == point_budget(200)
+    assert partial == {}  # The cut-short first month was trimmed away
+
+
+def test_partial_buckets():
+    assert partial_buckets(['a', 'b'], np.array([3, 7]), np.array([7, 7])) == {'a': '3 of 7 days'}
+
+
+def test_fit_leaves_small_results_alone():
+    result = {"event": "signup", "data": {"2026-01-01": 1}}
+    assert json.loads(fit(dict(result), 1000)) == result
+
+
+def test_fit_keeps_recent_days_and_top_ranked_items():
+    result = {
+        "event": "signup",
+        "data": daily('2025-01-01', '2025-12-31'),
+        "top": [{"rank": i, "title": f"video {i}"} for i in range(200)],
+    }
+    shaped = json.loads(fit(result, 500))
+    assert estimate_tokens(json.dumps(shaped, separators=(',', ':'))) <= 500
+    assert shaped["truncated"] is True
+    assert shaped["event"] == "signup"
+    if shaped["data"]:
+        assert max(shaped["data"]) == "2025-12-31"
+    assert [item["rank"] for item in shaped["top"]] == list(range(len(shaped["top"])))
+
+
+def test_fit_trims_inside_records_and_keeps_requested_keys():
+    metrics = {f"event_{i}": {"total": i, "daily": daily('2025-06-01', '2025-12-31', i)} for i in range(5)}
+    shaped = json.loads(fit({"metrics": metrics}, 600))
+    assert list(shaped["metrics"]) == list(metrics)
+    for name, entry in shaped["metrics"].items():
+        assert entry["total"] == metrics[name]["total"]
+        assert max(entry["daily"]) == "2025-12-31"
+    assert "dropped" not in shaped
+
+
+def test_fit_names_dropped_keys():
+    result = {"by_creator": {f"@creator{i}": f"{'x' * 40}" for i in range(100)}}
+    shaped = json.loads(fit(result, 300))
+    kept = list(shaped["by_creator"])
+    assert kept == [f"@creator{i}" for i in range(len(kept))]
+    names = shaped["dropped"]["by_creator"]
+    assert len(names) == 21 and names[-1] == f"... {100 - len(kept) - 20} more"
+    assert not set(names[:-1]) & set(kept)
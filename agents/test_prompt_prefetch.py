@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Tests for the data summary prefetched into the system prompt."""
+
+from business_agent import SYSTEM_PROMPT, build_system_prompt
+from metric_store import MetricSnapshot
+from prompt_prefetch import get_data_summary, render_data_summary
+
+EVENTS = {
+    "signup_completed": {"2026-01-01": 3, "2026-01-02": 5},
+    "dashboard_viewed": {"2026-01-01": 100, "2026-01-03": 120},
+    "chat_messages": {"2026-01-02": 40},
+}
+
+
+def snapshot(events=EVENTS, version=-1, **data):
+    return MetricSnapshot(version=version, data={"events": events, "scraped_at": "2026-01-04", **data})
+
+
+def test_lists_metrics_busiest_first():
+    text = render_data_summary(snapshot(summary={"total_signups": 8, "rate": 0.125}))
+    assert "Date range: 2026-01-01 to 2026-01-03 | Last refreshed: 2026-01-04" in text
+    assert "- Headline: total_signups=8, rate=0.12" in text
+    metrics = [line for line in text.splitlines() if line.startswith("  - ")]
+    assert metrics == [
+        "  - dashboard_viewed: 220 total, 120 on 2026-01-03",
+        "  - chat_messages: 40 total, 40 on 2026-01-02",
+        "  - signup_completed: 8 total, 5 on 2026-01-02",
+    ]
+
+
+def test_caps_the_metric_list():
+    text = render_data_summary(snapshot(), max_metrics=1)
+    assert "dashboard_viewed" in text and "signup_completed" not in text
+    assert "...and 2 more" in text
+
+
+def test_no_data():
+    assert render_data_summary(MetricSnapshot(version=-1, data={})) == ''
+    assert build_system_prompt(MetricSnapshot(version=-1, data={})) == SYSTEM_PROMPT
+
+
+def test_same_data_same_text():
+    # Byte-identical across versions so the prompt prefix stays cacheable
+    assert get_data_summary(snapshot(version=-1)) == get_data_summary(snapshot(version=-2))
+
+
+def test_rendered_once_per_snapshot(monkeypatch):
+    import prompt_prefetch
+    calls = []
+    render = prompt_prefetch.render_data_summary
+    monkeypatch.setattr(prompt_prefetch, 'render_data_summary', lambda s: calls.append(s) or render(s))
+    pinned = snapshot()
+    assert get_data_summary(pinned) == get_data_summary(pinned)
+    assert len(calls) == 1
+
+
+def test_system_prompt_keeps_the_static_prefix():
+    prompt = build_system_prompt(snapshot(), prefetch=True)
+    assert prompt.startswith(SYSTEM_PROMPT)
+    assert "## Data Snapshot" in prompt
+    assert build_system_prompt(snapshot(), prefetch=False) == SYSTEM_PROMPT
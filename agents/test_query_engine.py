@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Tests for the columnar query engine: incremental updates against a full rebuild."""
+
+import numpy as np
+import pytest
+
+from query_engine import QueryEngine, parse_day
+
+
+def make_events(n_events: int = 4, n_days: int = 40, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    days = [str(np.datetime64('2026-01-01') + i) for i in range(n_days)]
+    events = {}
+    for e in range(n_events):
+        # Leave gaps so presence matters
+        events[f'event_{e}'] = {d: int(rng.integers(0, 500)) for d in days if rng.random() > 0.1}
+    return events
+
+
+def merged(events: dict, updates: dict) -> dict:
+    result = {name: dict(series) for name, series in events.items()}
+    for name, series in updates.items():
+        result.setdefault(name, {}).update(series)
+    return result
+
+
+def assert_same(a: QueryEngine, b: QueryEngine) -> None:
+    """Same matrices row by row (new events may be ordered differently)."""
+    assert sorted(a.names) == sorted(b.names)
+    assert np.array_equal(a.days, b.days)
+    order = [a.rows[name] for name in b.names]
+    assert np.array_equal(a.present[order], b.present)
+    assert np.array_equal(a.values[order], b.values)
+    assert np.array_equal(a.value_cumsum[order], b.value_cumsum)
+    assert np.array_equal(a.count_cumsum[order], b.count_cumsum)
+
+
+@pytest.mark.parametrize('updates', [
+    {'event_1': {'2026-01-20': 7, '2026-01-21': 0}},  # corrections in the middle
+    {'event_0': {'2026-02-10': 11}, 'event_3': {'2026-02-11': 12}},  # new days at the end
+    {'event_2': {'2025-12-25': 3}},  # a new first day shifts every column
+    {'event_new': {'2026-01-05': 5, '2026-02-12': 6}},  # a new event
+    {'event_0': {'2026-01-03': 1.5}},  # a float turns the matrix to float
+])
+def test_with_updates_matches_rebuild(updates):
+    events = make_events()
+    engine = QueryEngine.from_events(events)
+    updated = engine.with_updates(updates)
+    rebuilt = QueryEngine.from_events(merged(events, updates))
+    assert_same(updated, rebuilt)
+    for name in updated.names:
+        assert updated.total(name, '2026-01-05', '2026-01-25') == rebuilt.total(name, '2026-01-05', '2026-01-25')
+        assert updated.range_stats(name).to_dict() == rebuilt.range_stats(name).to_dict()
+
+
+def test_with_updates_leaves_original_untouched():
+    events = make_events()
+    engine = QueryEngine.from_events(events)
+    before = engine.total('event_1')
+    engine.with_updates({'event_1': {'2026-01-10': 10_000}})
+    assert engine.total('event_1') == before
+    assert engine.series('event_1') == QueryEngine.from_events(events).series('event_1')
+
+
+def test_chained_updates_match_rebuild():
+    events = make_events(seed=1)
+    engine = QueryEngine.from_events(events)
+    all_updates = {}
+    for updates in ({'event_0': {'2026-02-10': 1}},
+                    {'event_1': {'2026-01-02': 2}},
+                    {'event_0': {'2026-02-10': 3, '2026-02-11': 4}}):
+        engine = engine.with_updates(updates)
+        for name, series in updates.items():
+            all_updates.setdefault(name, {}).update(series)
+    assert_same(engine, QueryEngine.from_events(merged(events, all_updates)))
+
+
+@pytest.mark.parametrize('value', ['2026-01', 'NaT', '2026-02-30', '20260101', '2026-01-05T00:00', '', None])
+def test_parse_day_rejects_malformed(value):
+    with pytest.raises(ValueError):
+        parse_day(value)
+
+
+def test_parse_day_accepts_iso_date():
+    assert parse_day('2026-01-05') == np.datetime64('2026-01-05')
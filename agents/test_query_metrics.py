@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Tests for the batch query_metrics tool: aggregations and partial week/month buckets."""
+
+import json
+
+import numpy as np
+
+from business_agent import tool_query_metrics
+from query_engine import QueryEngine
+
+
+def daily(first: str, last: str, value: int = 100) -> dict:
+    days = np.arange(np.datetime64(first), np.datetime64(last) + 1)
+    return {str(d): value for d in days}
+
+
+def query(**args) -> dict:
+    return json.loads(tool_query_metrics(args))
+
+
+def test_totals_for_several_events(pin_data):
+    pin_data({"signup": daily('2026-01-01', '2026-01-10'), "order": daily('2026-01-01', '2026-01-10', 7)})
+    result = query(events=["signup", "order"], aggregations=["total", "avg", "max"],
+                   start_date='2026-01-03', end_date='2026-01-04')
+    assert result["metrics"]["signup"] == {"days": 2, "total": 200, "average": 100, "max": 100}
+    assert result["metrics"]["order"]["total"] == 14
+
+
+def test_partial_months_are_flagged_and_not_compared(pin_data):
+    pin_data({"signup": daily('2025-11-15', '2026-02-10')})
+    result = query(events=["signup"], aggregations=["daily", "dod_change"], granularity='month')
+    metrics = result["metrics"]["signup"]
+    assert metrics["daily"] == {"2025-11": 1600, "2025-12": 3100, "2026-01": 3100, "2026-02": 1000}
+    # Only full months are compared: November's 16 days against December's 31 would read +94%
+    assert metrics["change"] == {"2026-01": 0}
+    assert metrics["change_percent"] == {"2026-01": "+0.0%"}
+    assert result["partial_buckets"] == {"2025-11": "16 of 30 days", "2026-02": "10 of 28 days"}
+
+
+def test_range_cut_weeks_are_partial(pin_data):
+    pin_data({"signup": daily('2026-01-01', '2026-01-31')})
+    # 2026-01-07 is a Wednesday, 2026-01-27 a Tuesday
+    result = query(events=["signup"], aggregations=["daily", "dod_change"], granularity='week',
+                   start_date='2026-01-07', end_date='2026-01-27')
+    assert result["partial_buckets"] == {"2026-01-05": "5 of 7 days", "2026-01-26": "2 of 7 days"}
+    assert result["metrics"]["signup"]["change"] == {"2026-01-19": 0}
+
+
+def test_full_buckets_have_no_flag(pin_data):
+    pin_data({"signup": daily('2026-01-05', '2026-01-18')})
+    result = query(events=["signup"], aggregations=["daily"], granularity='week')
+    assert "partial_buckets" not in result
+    assert result["metrics"]["signup"]["daily"] == {"2026-01-05": 700, "2026-01-12": 700}
+
+
+def test_bucket_days():
+    engine = QueryEngine.from_events({"signup": daily('2025-12-30', '2026-02-01')})
+    labels, covered, length = engine.bucket_days(granularity='month')
+    assert labels == ['2025-12', '2026-01', '2026-02']
+    assert covered.tolist() == [2, 31, 1]
+    assert length.tolist() == [31, 31, 28]
+    labels, covered, length = engine.bucket_days('2026-01-01', '2026-01-01', 'day')
+    assert labels == ['2026-01-01'] and covered.tolist() == length.tolist() == [1]
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Tests for the session store: eviction, reload, flushing and per-session locking."""
+
+import asyncio
+import time
+
+import pytest
+
+from session_store import SessionBusy, SessionStore
+
+
+def settle(store: SessionStore) -> None:
+    """Wait for the measurements and evictions use() queued on the disk thread."""
+    store._disk.submit(lambda: None).result()
+
+
+async def chat(store: SessionStore, session_id: str, text: str) -> None:
+    async with store.use(session_id) as session:
+        session.messages.append({"role": "user", "content": text})
+        session.messages.append({"role": "assistant", "content": text.upper()})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(tmp_path / 'sessions.db', budget_mb=1, ttl=60)
+    yield store
+    store.close()
+
+
+def test_flush_survives_restart(tmp_path):
+    store = SessionStore(tmp_path / 'sessions.db')
+    asyncio.run(chat(store, 'a', 'hello'))
+    settle(store)
+    assert store.get('a').dirty
+    assert store.flush() == 1
+    assert not store.get('a').dirty
+    assert store.flush() == 0  # Nothing changed since
+    # No close(): a crash after a flush keeps what was flushed
+    restarted = SessionStore(tmp_path / 'sessions.db')
+    assert [m["content"] for m in restarted.get('a').messages] == ['hello', 'HELLO']
+    assert restarted.reloaded == 1
+    restarted.close()
+    store.close()
+
+
+def test_unchanged_request_is_not_dirty(store):
+    async def peek():
+        async with store.use('a') as session:
+            return len(session.messages)
+
+    asyncio.run(chat(store, 'a', 'hello'))
+    store.flush()
+    revision = store.get('a').revision
+    asyncio.run(peek())
+    session = store.get('a')
+    assert session.revision == revision
+    assert not session.dirty
+
+
+def test_budget_evicts_least_recently_used(store):
+    store.budget = 0
+    text = 'x' * 1000
+
+    async def run():
+        for session_id in ('a', 'b', 'c'):
+            await chat(store, session_id, text)
+            settle(store)
+
+    asyncio.run(run())
+    # Each finished request spilled what went over the (empty) budget
+    assert len(store) == 0
+    assert store.hot_bytes == 0
+    assert store.cold_count() == 3
+    assert store.spilled == 3
+    assert store.get('b').messages[0]["content"] == text
+    assert store.reloaded == 1
+
+
+def test_budget_spills_oldest_first(store):
+    async def run():
+        for session_id in ('a', 'b', 'c'):
+            await chat(store, session_id, 'x' * 1000)
+        settle(store)
+
+    asyncio.run(run())
+    store.get('a')  # Most recently used now
+    store.budget = store.get('a').size + 1
+    assert store.evict() == 2
+    assert list(store._hot) == ['a']
+    assert store.hot_bytes == store.get('a').size
+
+
+def test_ttl_spills_idle_sessions(store):
+    asyncio.run(chat(store, 'a', 'hello'))
+    settle(store)
+    assert store.evict() == 0
+    assert store.evict(time.monotonic() + store.ttl + 1) == 1
+    assert len(store) == 0
+    assert store.get('a').messages[1]["content"] == 'HELLO'
+
+
+def test_busy_session_is_not_spilled(store):
+    async def run():
+        async with store.use('a') as session:
+            session.messages.append({"role": "user", "content": "hi"})
+            with pytest.raises(SessionBusy):
+                async with store.use('a', wait=False):
+                    pass
+            assert store.evict(time.monotonic() + store.ttl + 1) == 0
+            assert store.flush() == 0
+        settle(store)
+
+    asyncio.run(run())
+    assert store.flush() == 1
+
+
+def test_requests_on_one_session_run_one_at_a_time(store):
+    order = []
+
+    async def request(name):
+        async with store.use('a') as session:
+            order.append(f'{name} start')
+            await asyncio.sleep(0.01)
+            session.messages.append({"role": "user", "content": name})
+            order.append(f'{name} end')
+
+    async def run():
+        await asyncio.gather(request('first'), request('second'))
+
+    asyncio.run(run())
+    assert order == ['first start', 'first end', 'second start', 'second end']
+    assert store.get('a').revision == 2
+
+
+def test_concurrent_loads_share_one_session(store):
+    asyncio.run(chat(store, 'a', 'hello'))
+    store.evict(time.monotonic() + store.ttl + 1)
+
+    async def run():
+        return await asyncio.gather(store.aget('a'), store.aget('a'))
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert store.reloaded == 1
+
+
+def test_drop_forgets_memory_and_disk(store):
+    asyncio.run(chat(store, 'a', 'hello'))
+    store.flush()
+    assert store.drop('a') is True
+    assert len(store) == 0
+    assert store.cold_count() == 0
+    assert store.get('a').messages == []
+    assert store.drop('unknown') is False
+
+
+def test_memory_only_store_discards_on_evict():
+    store = SessionStore(None)
+    asyncio.run(chat(store, 'a', 'hello'))
+    settle(store)
+    assert store.evict(time.monotonic() + store.ttl + 1) == 1
+    assert store.get('a').messages == []
+    store.close()
+
+
+def test_claimed_session_is_not_spilled(store):
+    async def run():
+        session = await store.aget('a', claim=True)
+        # evict() on another thread between the lookup and the request's lock
+        assert store.evict(time.monotonic() + store.ttl + 1) == 0
+        store._release(session)
+
+    asyncio.run(chat(store, 'a', 'hello'))
+    asyncio.run(run())
+    assert len(store) == 1
+
+
+def test_failed_spill_keeps_session_hot(store, monkeypatch):
+    asyncio.run(chat(store, 'a', 'hello'))
+    asyncio.run(chat(store, 'b', 'hello'))
+    settle(store)
+
+    def fail(session):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(store, '_spill', fail)
+    with pytest.raises(RuntimeError):
+        store.evict(time.monotonic() + store.ttl + 1)
+    assert not store._spilling
+    assert sorted(store._hot) == ['a', 'b']
+    assert store.hot_bytes == sum(s.size for s in store._hot.values())
+    monkeypatch.undo()
+    assert store.flush() == 2
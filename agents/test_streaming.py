@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Tests for assembling a streamed completion: content deltas and tool call fragments."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import business_agent
+from business_agent import AgentSession, _stream_turn, _Turn
+
+
+def fragment(index, id=None, name=None, arguments=None):
+    function = SimpleNamespace(name=name, arguments=arguments) if name or arguments else None
+    return SimpleNamespace(index=index, id=id, function=function)
+
+
+def chunk(content=None, tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))],
+                           usage=None)
+
+
+@pytest.fixture
+def stream_of(monkeypatch, pin_data):
+    """Replay chunks as the LLM stream and record the tool calls started, in order."""
+    pin_data({"signup_completed": {"2026-01-01": 1}})
+    started = []
+
+    async def run_tool(name, args):
+        started.append((name, args))
+        return json.dumps({"ok": name})
+
+    monkeypatch.setattr(business_agent, '_run_tool', run_tool)
+
+    def run(chunks, when_started=None):
+        async def replay():
+            for item in chunks:
+                await asyncio.sleep(0)
+                yield item
+
+        async def call_llm(messages, stream=False):
+            return replay()
+
+        monkeypatch.setattr(business_agent, '_call_llm', call_llm)
+
+        async def go():
+            session = AgentSession('test', timeout=5)
+            turn = _Turn()
+            events = [event async for event in _stream_turn(session, [], turn)]
+            await asyncio.gather(*(call.task for call in turn.tool_calls if call.task))
+            return turn, events
+
+        return asyncio.run(go())
+
+    run.started = started
+    return run
+
+
+def test_content_deltas(stream_of):
+    turn, events = stream_of([chunk('Sign'), chunk('ups '), chunk(None), chunk('rose.')])
+    assert [e.content for e in events if e.type == 'response_delta'] == ['Sign', 'ups ', 'rose.']
+    assert turn.content == 'Signups rose.'
+    assert turn.tool_calls == []
+
+
+def test_split_arguments_start_once_complete(stream_of):
+    turn, events = stream_of([
+        chunk(tool_calls=[fragment(0, id='call_a', name='get_metric_data', arguments='{"event_')]),
+        chunk(tool_calls=[fragment(0, arguments='name": "sig')]),
+        chunk(tool_calls=[fragment(0, arguments='nup_completed"}')]),
+    ])
+    [call] = turn.tool_calls
+    assert (call.id, call.name) == ('call_a', 'get_metric_data')
+    assert json.loads(call.arguments) == {"event_name": "signup_completed"}
+    assert stream_of.started == [('get_metric_data', {"event_name": "signup_completed"})]
+    assert [e.content['id'] for e in events if e.type == 'tool_call'] == ['call_a']
+
+
+def test_interleaved_indexes(stream_of):
+    turn, events = stream_of([
+        chunk(tool_calls=[fragment(0, id='call_a', name='get_metric_data', arguments='{"event_name": ')]),
+        chunk(tool_calls=[fragment(1, id='call_b', name='compare_periods', arguments='{"event_name": ')]),
+        chunk(tool_calls=[fragment(0, arguments='"a"}')]),
+        chunk(tool_calls=[fragment(1, arguments='"b"}')]),
+    ])
+    assert [(c.id, json.loads(c.arguments)) for c in turn.tool_calls] == [
+        ('call_a', {"event_name": "a"}), ('call_b', {"event_name": "b"})]
+    # A new index does not start the earlier call with half of its arguments
+    assert stream_of.started == [('get_metric_data', {"event_name": "a"}),
+                                 ('compare_periods', {"event_name": "b"})]
+
+
+def test_id_only_on_first_fragment(stream_of):
+    turn, _ = stream_of([
+        chunk(tool_calls=[fragment(0, id='call_a', name='get_daily_trend')]),
+        chunk(tool_calls=[fragment(0, id='', arguments='{"days"')]),
+        chunk(tool_calls=[fragment(0, arguments=': 7}')]),
+    ])
+    [call] = turn.tool_calls
+    assert call.id == 'call_a'
+    assert stream_of.started == [('get_daily_trend', {"days": 7})]
+
+
+def test_missing_ids_stay_distinct(stream_of):
+    turn, _ = stream_of([
+        chunk(tool_calls=[fragment(0, name='get_business_summary', arguments='{}'),
+                          fragment(1, name='detect_anomalies', arguments='{}')]),
+    ])
+    assert len({call.id for call in turn.tool_calls}) == 2
+
+
+def test_incomplete_arguments_wait_for_the_end(stream_of):
+    turn, events = stream_of([
+        chunk(tool_calls=[fragment(0, id='call_a', name='get_business_summary', arguments='')]),
+        chunk('Checking.'),
+    ])
+    [call] = turn.tool_calls
+    assert call.task is None  # Started by the agent loop after the stream
+    assert [e.type for e in events] == ['response_delta']
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Tests for running a turn's tool calls concurrently on the shared pool."""
+
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import business_agent
+from business_agent import arun_agent
+
+
+def completion(content='', tool_calls=()):
+    calls = [SimpleNamespace(id=id, function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+             for id, name, args in tool_calls]
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content,
+                                                                            tool_calls=calls or None))])
+
+
+@pytest.fixture
+def run(monkeypatch, pin_data):
+    """Run one question against scripted completions; returns (events, messages)."""
+    snapshot = pin_data({"signup_completed": {"2026-01-01": 1}})
+
+    def go(*completions):
+        replies = iter(completions)
+
+        async def call_llm(messages, stream=False):
+            return next(replies)
+
+        monkeypatch.setattr(business_agent, '_call_llm', call_llm)
+
+        async def collect():
+            messages = []
+            events = [e async for e in arun_agent('q', messages, timeout=10, fast_path=False,
+                                                  prefetch=False, snapshot=snapshot)]
+            return events, messages
+
+        return asyncio.run(collect())
+
+    return go
+
+
+@pytest.fixture
+def sleepy(monkeypatch):
+    """A sync tool that waits for all its siblings to be running, then sleeps."""
+    barrier = threading.Barrier(3, timeout=5)
+
+    def tool_sleepy(args):
+        barrier.wait()
+        time.sleep(args["seconds"])
+        if args.get("fail"):
+            raise ValueError("boom")
+        return json.dumps({"slept": args["seconds"]})
+
+    monkeypatch.setitem(business_agent.TOOL_FUNCTIONS, 'sleepy', tool_sleepy)
+
+
+def test_calls_run_together_and_keep_the_model_order(run, sleepy):
+    events, messages = run(
+        completion(tool_calls=[('call_a', 'sleepy', {"seconds": 0.3}),
+                               ('call_b', 'sleepy', {"seconds": 0.0}),
+                               ('call_c', 'sleepy', {"seconds": 0.15})]),
+        completion('Done.'),
+    )
+    # The barrier only opens when all three run at once
+    assert [e.content['id'] for e in events if e.type == 'tool_call'] == ['call_a', 'call_b', 'call_c']
+    assert [e.content['id'] for e in events if e.type == 'tool_result'] == ['call_b', 'call_c', 'call_a']
+
+    assistant = next(m for m in messages if m.get('tool_calls'))
+    tool_messages = messages[messages.index(assistant) + 1:][:3]
+    assert [m['tool_call_id'] for m in tool_messages] == ['call_a', 'call_b', 'call_c']
+    assert [json.loads(m['content'])["slept"] for m in tool_messages] == [0.3, 0.0, 0.15]
+    assert messages[-1] == {"role": "assistant", "content": "Done."}
+
+
+def test_failing_call_does_not_abort_the_turn(run, sleepy):
+    events, messages = run(
+        completion(tool_calls=[('call_a', 'sleepy', {"seconds": 0.0}),
+                               ('call_b', 'sleepy', {"seconds": 0.0, "fail": True}),
+                               ('call_c', 'sleepy', {"seconds": 0.01})]),
+        completion('Done.'),
+    )
+    results = {m['tool_call_id']: json.loads(m['content']) for m in messages if m['role'] == 'tool'}
+    assert "boom" in results['call_b']["error"]
+    assert results['call_a'] == {"slept": 0.0} and results['call_c'] == {"slept": 0.01}
+    assert [e.type for e in events if e.type == 'error'] == []
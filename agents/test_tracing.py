@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Tests for span aggregation: histograms, counters, exports and per-run traces."""
+
+import pytest
+
+import tracing
+from tracing import LATENCY_BUCKETS, Histogram, Metrics, Span, Trace
+
+
+def test_histogram_quantiles():
+    h = Histogram()
+    for value in [0.002] * 90 + [0.3] * 10:
+        h.observe(value)
+    assert h.count == 100 and h.sum == pytest.approx(3.18)
+    assert 0.001 <= h.quantile(0.5) <= 0.0025
+    assert 0.25 <= h.quantile(0.95) <= 0.5
+    assert Histogram().quantile(0.5) is None
+
+    slow = Histogram()
+    slow.observe(1000.0)  # Beyond the last bound
+    assert slow.counts[-1] == 1 and slow.quantile(0.99) == LATENCY_BUCKETS[-1]
+
+
+def test_spans_feed_counters_and_histograms():
+    metrics = Metrics()
+    for seconds in (0.01, 0.02):
+        metrics.add_span(Span('llm', seconds, 0.0, {'outcome': 'ok', 'iteration': 1, 'stream': True,
+                                                    'ttft_seconds': seconds / 2, 'prompt_tokens': 100,
+                                                    'completion_tokens': None}))
+    labels = (('outcome', 'ok'),)
+    assert metrics.counters[('agent_llm_total', labels)] == 2
+    assert metrics.counters[('agent_llm_prompt_tokens_total', labels)] == 200
+    assert metrics.histograms[('agent_llm_seconds', labels)].count == 2
+    assert metrics.histograms[('agent_llm_ttft_seconds', labels)].sum == pytest.approx(0.015)
+    # Only the label attributes become labels; flags and other numbers do not
+    assert {name for name, _ in metrics.counters} == {'agent_llm_total', 'agent_llm_prompt_tokens_total'}
+
+
+def test_prometheus_export():
+    metrics = Metrics()
+    metrics.add_span(Span('tool', 0.003, 0.0, {'tool': 'get "x"', 'outcome': 'ok'}))
+    metrics.add_span(Span('tool', 0.2, 0.0, {'tool': 'get "x"', 'outcome': 'ok'}))
+    text = metrics.to_prometheus()
+    labels = 'tool="get \\"x\\"",outcome="ok"'
+    assert '# TYPE agent_tool_total counter' in text
+    assert f'agent_tool_total{{{labels}}} 2' in text
+    assert f'agent_tool_seconds_bucket{{{labels},le="0.0025"}} 0' in text
+    assert f'agent_tool_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'agent_tool_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f'agent_tool_seconds_count{{{labels}}} 2' in text
+
+
+def test_records():
+    metrics = Metrics()
+    metrics.add_span(Span('data_load', 0.5, 0.0, {'source': 'json'}))
+    records = {r["metric"]: r for r in metrics.to_records()}
+    assert records['agent_data_load_total']["value"] == 1
+    assert records['agent_data_load_seconds']["labels"] == {'source': 'json'}
+    assert set(records['agent_data_load_seconds']) >= {'p50', 'p95', 'p99', 'count', 'sum'}
+    assert metrics.to_jsonl(host='a').count('"host": "a"') == 2
+
+
+def test_trace_drain_and_summary():
+    trace = Trace('test-trace')
+    trace.add('llm', 0.5, prompt_tokens=10, completion_tokens=5)
+    trace.add('tool', 0.25, tool='x', outcome='ok')
+    assert [s["name"] for s in trace.drain()] == ['llm', 'tool']
+    assert trace.drain() == []
+    trace.add('llm', 0.5, prompt_tokens=20)
+    trace.add('run', 2.0)
+    summary = trace.summary()
+    assert (summary["llm_calls"], summary["llm_seconds"], summary["tool_calls"]) == (2, 1.0, 1)
+    assert (summary["prompt_tokens"], summary["completion_tokens"]) == (30, 5)
+    assert 'run_calls' not in summary
+    assert tracing.session_metrics('test-trace').counters[('agent_llm_total', ())] == 2
+    tracing.forget_session('test-trace')
+    assert tracing.session_metrics('test-trace') is None
+
+
+def test_spans_go_to_the_bound_trace(monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACING', True)
+    trace = Trace('test-bound')
+    with tracing.bound(trace):
+        with pytest.raises(ValueError):
+            with tracing.span('tool', tool='x', outcome='ok'):
+                raise ValueError
+    with tracing.span('tool', tool='y', outcome='ok'):
+        pass  # Outside the run: process aggregates only
+    assert [(s["tool"], s["outcome"]) for s in trace.drain()] == [('x', 'error')]
+    tracing.forget_session('test-bound')
+
+
+def test_session_limit(monkeypatch):
+    monkeypatch.setattr(tracing, 'MAX_TRACED_SESSIONS', 2)
+    for name in ('test-a', 'test-b', 'test-c'):
+        tracing.session_metrics(name, create=True)
+    assert tracing.session_metrics('test-a') is None
+    assert tracing.session_metrics('test-c') is not None
+    for name in ('test-b', 'test-c'):
+        tracing.forget_session(name)
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACING', False)
+    assert tracing.start_trace('off') is None
+    with tracing.span('tool', tool='x') as s:
+        s.set(outcome='ok')
+    assert s is tracing._NOOP
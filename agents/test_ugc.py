@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Tests for UGC correlation: lag overlap, significance of the best lag and result caching."""
+
+import numpy as np
+
+from query_engine import QueryEngine
+from ugc import (
+    MIN_BEST_LAG_DAYS, CorrelationCache, UgcIndex, event_axis, event_on_axis, lagged_correlation,
+    views_vs_events
+)
+
+
+def noise(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(100, 20, n)
+
+
+def test_lag_aligns_x_with_later_y():
+    x = noise(40)
+    y = np.r_[np.zeros(3), x[:-3] * 2 + 5]  # y follows x three days later
+    result = lagged_correlation(x[None, :], y, np.ones(40, dtype=bool), 7)
+    assert np.isclose(result.r[0, 3], 1.0)
+    assert result.days.tolist() == [40 - lag for lag in range(8)]
+    assert result.best(0) == (3, result.r[0, 3])
+
+
+def test_best_lag_needs_enough_overlap():
+    x = noise(40)
+    y = noise(40, seed=1)
+    present = np.zeros(40, dtype=bool)
+    present[-8:] = True  # Only 8 days of the event
+    y[-4:] = x[-8:-4]  # A perfect fit at lag 4, but over 4..8 days
+    result = lagged_correlation(x[None, :], y, present, 7)
+    assert (result.days < MIN_BEST_LAG_DAYS).all()
+    assert not result.significant().any()
+    assert result.best(0) == (None, None)
+
+
+def test_weak_correlation_is_not_significant():
+    x = noise(20)
+    y = x + noise(20, seed=2) * 3  # r around 0.3 over 20 days
+    result = lagged_correlation(x[None, :], y, np.ones(20, dtype=bool), 0)
+    assert 0 < result.r[0, 0] < 0.44
+    assert result.best(0) == (None, None)
+
+
+def test_views_vs_events_matches_per_event():
+    days = [str(np.datetime64('2026-01-01') + i) for i in range(30)]
+    rng = np.random.default_rng(3)
+    engine = QueryEngine.from_events({
+        name: {d: int(v) for d, v in zip(days, rng.integers(0, 100, 30)) if rng.random() > 0.2}
+        for name in ('signup', 'order', 'visit')
+    })
+    videos = [{"views": int(rng.integers(1, 10_000)), "postedAt": days[i % 25 + 2],
+               "creatorHandle": f"@c{i % 4}", "platform": "tiktok"} for i in range(60)]
+    index = UgcIndex({"videos": videos, "scrapedAt": "2026-01-30T00:00:00Z"})
+    batched = views_vs_events(index, engine, 5)
+    axis = event_axis(engine)
+    for name in engine.names:
+        single = lagged_correlation(index.daily_views(axis), *event_on_axis(engine, name, axis),
+                                    5, index.covers(axis))
+        assert np.allclose(batched[name].r, single.r, equal_nan=True)
+        assert np.array_equal(batched[name].days, single.days)
+
+
+def test_correlation_cache_keeps_newest_version_only():
+    cache = CorrelationCache(max_entries=2)
+    builds = []
+
+    def build(value):
+        builds.append(value)
+        return value
+
+    assert cache.get(1, 'a', lambda: build('a1')) == 'a1'
+    assert cache.get(1, 'a', lambda: build('again')) == 'a1'
+    cache.get(1, 'b', lambda: build('b1'))
+    cache.get(1, 'c', lambda: build('c1'))
+    assert cache.get(1, 'a', lambda: build('a1 rebuilt')) == 'a1 rebuilt'  # Evicted as least recent
+    assert cache.get(2, 'b', lambda: build('b2')) == 'b2'
+    assert list(cache._entries) == ['b']
+    # A run pinned to older UGC data gets a fresh result that is not cached
+    assert cache.get(1, 'b', lambda: build('b1 old')) == 'b1 old'
+    assert cache.version == 2 and list(cache._entries) == ['b']
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tool Cache - bounded LRU/TTL cache of serialized tool results.
+
+Keys include the data snapshot version; retain_version() drops entries of
+older versions when a new snapshot is published.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Tuple
+
+
+@dataclass
+class _Entry:
+    value: str
+    version: int
+    expires_at: float
+
+
+class ToolResultCache:
+    """Thread-safe LRU cache with a TTL, bounded by entry count and bytes."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0,
+                 max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple[str, str, int]) -> Optional[str]:
+        """Return a cached result, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Tuple[str, str, int], value: str) -> None:
+        """Store a result, evicting least recently used entries to stay in bounds."""
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        version = key[2]
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return  # computed against a snapshot that is already stale
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, version, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def retain_version(self, version: int) -> None:
+        """Drop entries computed against data versions older than `version`."""
+        with self._lock:
+            if self._version is not None and version <= self._version:
+                return
+            self._version = version
+            for key in [k for k, e in self._entries.items() if e.version < version]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """Counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "data_version": self._version,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.value)
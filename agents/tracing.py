@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Tracing - timing spans for agent runs, aggregated per session and process.
+
+Spans (llm, llm_attempt, tool, data_load, run) go to the trace bound to the
+current context and feed histograms exported as Prometheus text or JSON
+lines. AGENT_TRACING=0 turns it all off.
+"""
+
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+TRACING = os.getenv('AGENT_TRACING', '1') != '0'  # Spans, metrics events and aggregates
+MAX_TRACED_SESSIONS = int(os.getenv('AGENT_TRACED_SESSIONS', '1000'))  # Sessions with their own aggregates
+
+# Upper bounds in seconds of the latency histogram buckets (plus +Inf)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Span attributes that become metric labels; the rest only appear on spans
+LABELS = ('tool', 'source', 'kind', 'outcome')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+# ============= SPANS =============
+
+@dataclass
+class Span:
+    """One timed step of a run."""
+    name: str
+    seconds: float
+    start: float  # Seconds since the trace started
+    attrs: Dict = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "start": round(self.start, 6), "seconds": round(self.seconds, 6),
+                **{k: round(v, 6) if isinstance(v, float) else v
+                   for k, v in self.attrs.items() if v is not None}}
+
+
+# ============= AGGREGATES =============
+
+class Histogram:
+    """Latency counts per bucket, with their sum."""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated quantile, interpolated within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                high = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return low + (high - low) * max(0.0, rank - seen) / n
+            seen += n
+        return LATENCY_BUCKETS[-1]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels] + ([extra] if extra else [])
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Metrics:
+    """Histograms and counters by (metric name, labels). Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+
+    def add_span(self, span: Span) -> None:
+        """Count a span and observe its durations; *_tokens attributes are summed."""
+        labels = tuple((k, str(span.attrs[k])) for k in LABELS if span.attrs.get(k) is not None)
+        with self._lock:
+            self._observe(f'agent_{span.name}_seconds', span.seconds, labels)
+            self._inc(f'agent_{span.name}_total', 1, labels)
+            for key, value in span.attrs.items():
+                if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key.endswith('_seconds'):
+                    self._observe(f'agent_{span.name}_{key}', value, labels)
+                elif key.endswith('_tokens'):
+                    self._inc(f'agent_{span.name}_{key}_total', value, labels)
+
+    def _observe(self, name: str, value: float, labels: Labels) -> None:
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram()
+        histogram.observe(value)
+
+    def _inc(self, name: str, value: float, labels: Labels) -> None:
+        self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f'# TYPE {name} counter')
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f'{name}{_label_text(labels)} {value:g}')
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f'# TYPE {name} histogram')
+                for (n, labels), h in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), h.counts):
+                        cumulative += count
+                        le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                        lines.append(f'{name}_bucket{_label_text(labels, le)} {cumulative}')
+                    lines.append(f'{name}_sum{_label_text(labels)} {h.sum:.6f}')
+                    lines.append(f'{name}_count{_label_text(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_records(self) -> List[Dict]:
+        """One dict per series: counters with their value, histograms with count, sum and p50/p95/p99."""
+        records = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                records.append({"metric": name, "type": "counter", "labels": dict(labels), "value": value})
+            for (name, labels), h in sorted(self.histograms.items()):
+                records.append({
+                    "metric": name, "type": "histogram", "labels": dict(labels),
+                    "count": h.count, "sum": round(h.sum, 6),
+                    **{f"p{int(q * 100)}": round(h.quantile(q), 6) for q in (0.5, 0.95, 0.99)},
+                })
+        return records
+
+    def to_jsonl(self, **extra) -> str:
+        """JSON lines of to_records(), each with a timestamp and the extra fields."""
+        stamp = {"timestamp": round(time.time(), 3), **extra}
+        return ''.join(json.dumps({**stamp, **r}) + '\n' for r in self.to_records())
+
+
+# Process-wide aggregates, and per-session ones for the most recent sessions
+METRICS = Metrics()
+_session_metrics: 'OrderedDict[str, Metrics]' = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def session_metrics(session_id: str, create: bool = False) -> Optional[Metrics]:
+    """A session's aggregates (created on request; oldest sessions dropped beyond the limit)."""
+    with _sessions_lock:
+        metrics = _session_metrics.get(session_id)
+        if metrics is None and create:
+            metrics = _session_metrics[session_id] = Metrics()
+            while len(_session_metrics) > MAX_TRACED_SESSIONS:
+                _session_metrics.popitem(last=False)
+        if metrics is not None:
+            _session_metrics.move_to_end(session_id)
+        return metrics
+
+
+def forget_session(session_id: str) -> None:
+    with _sessions_lock:
+        _session_metrics.pop(session_id, None)
+
+
+# ============= TRACES =============
+
+class Trace:
+    """Spans of one agent run, added from any thread."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self._reported = 0
+        self._lock = threading.Lock()
+        self._metrics = session_metrics(session_id, create=True)
+
+    def add(self, name: str, seconds: float, started: Optional[float] = None, **attrs) -> Span:
+        """Record a span that took `seconds` (and began at perf_counter() `started`)."""
+        if started is None:
+            started = time.perf_counter() - seconds
+        span = Span(name, seconds, started - self.started, attrs)
+        with self._lock:
+            self.spans.append(span)
+        METRICS.add_span(span)
+        self._metrics.add_span(span)
+        return span
+
+    def drain(self) -> List[Dict]:
+        """Spans added since the last drain."""
+        with self._lock:
+            spans, self._reported = self.spans[self._reported:], len(self.spans)
+        return [s.to_dict() for s in spans]
+
+    def summary(self) -> Dict:
+        """Time, calls and tokens of the run so far, by span name."""
+        with self._lock:
+            spans = list(self.spans)
+        summary: Dict = {"seconds": round(time.perf_counter() - self.started, 6)}
+        for span in spans:
+            if span.name == 'run':
+                continue
+            summary[f"{span.name}_calls"] = summary.get(f"{span.name}_calls", 0) + 1
+            summary[f"{span.name}_seconds"] = round(summary.get(f"{span.name}_seconds", 0.0) + span.seconds, 6)
+            for key, value in span.attrs.items():
+                if key.endswith('_tokens') and isinstance(value, int):
+                    summary[key] = summary.get(key, 0) + value
+        return summary
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('trace', default=None)
+
+
+def start_trace(session_id: str) -> Optional[Trace]:
+    """A new trace for a run, or None with tracing off."""
+    return Trace(session_id) if TRACING else None
+
+
+def bind(trace: Optional[Trace]) -> None:
+    """Make `trace` current in this context (e.g. a run's task context)."""
+    _current.set(trace)
+
+
+@contextmanager
+def bound(trace: Optional[Trace]) -> Iterator[None]:
+    """Make `trace` current for the duration of the block."""
+    token = _current.set(trace)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def record(name: str, seconds: float, started: Optional[float] = None, **attrs) -> None:
+    """Record a span in the current trace (or only the process aggregates outside a run)."""
+    if not TRACING:
+        return
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds, started, **attrs)
+    else:
+        METRICS.add_span(Span(name, seconds, 0.0, attrs))
+
+
+class _Timer:
+    """Context manager behind span(); set() adds attributes before it ends."""
+    __slots__ = ('name', 'attrs', 'started')
+
+    def __init__(self, name: str, attrs: Dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> '_Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None and 'outcome' in self.attrs:
+            self.attrs['outcome'] = 'error'
+        record(self.name, time.perf_counter() - self.started, self.started, **self.attrs)
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopTimer':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopTimer()
+
+
+def span(name: str, **attrs):
+    """Time a block as a span: `with span('tool', tool=name, outcome='ok') as s: ... s.set(...)`."""
+    return _Timer(name, attrs) if TRACING else _NOOP
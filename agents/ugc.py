@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+UGC Index - indexed view of the creator video export (ugc-data.json).
+
+Built once per data version: videos are ranked by views and posting days
+parsed up front. Daily views can be correlated with Mixpanel events at
+several lags; a best lag is only reported where it is significant.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import tracing
+from query_engine import QueryEngine, get_engine
+
+
+POSTED_FORMATS = ('%b %d, %Y', '%B %d, %Y', '%Y-%m-%d', '%b %d %Y')
+NAT = np.datetime64('NaT', 'D')
+MIN_CORRELATION_DAYS = 5  # Fewer overlapping days give no correlation
+MIN_BEST_LAG_DAYS = 14  # Overlapping days a lag needs to be picked as the best
+SIGNIFICANCE_Z = 1.96  # Fisher z a best lag's correlation must exceed (p < 0.05)
+MAX_LAG = 14  # Lags precomputed per data version; requests slice this
+CORRELATIONS_KEPT = 64  # Cached correlation results per Mixpanel snapshot
+
+
+# ============= PARSING =============
+
+def parse_posted(value) -> np.datetime64:
+    """Parse a postedAt / date argument ("Jan 25, 2026" or YYYY-MM-DD); NaT if unparseable."""
+    text = str(value or '').strip()
+    for fmt in POSTED_FORMATS:
+        try:
+            return np.datetime64(datetime.strptime(text, fmt).date(), 'D')
+        except ValueError:
+            continue
+    return NAT
+
+
+def normalize_handle(handle: Optional[str]) -> str:
+    """Creator handles compare case-insensitively, with the leading @."""
+    handle = (handle or '').strip().lower()
+    if handle and not handle.startswith('@'):
+        handle = '@' + handle
+    return handle
+
+
+def _group(codes: np.ndarray, order: np.ndarray, n_groups: int) -> List[np.ndarray]:
+    """Split `order` into one index array per code, keeping order within groups."""
+    grouped = order[np.argsort(codes[order], kind='stable')]
+    bounds = np.searchsorted(codes[grouped], np.arange(n_groups + 1))
+    return [grouped[bounds[g]:bounds[g + 1]] for g in range(n_groups)]
+
+
+# ============= INDEX =============
+
+class UgcIndex:
+    """Columnar video table with rank, creator, platform and date indexes."""
+
+    def __init__(self, data: Dict):
+        self.data = data
+        self.videos: List[Dict] = data.get('videos') or []
+        videos = self.videos
+
+        self.views = np.array([int(v.get('views') or 0) for v in videos], dtype=np.int64)
+        parsed: Dict[str, np.datetime64] = {}  # Many videos share a posting day
+        for v in videos:
+            text = v.get('postedAt')
+            if text not in parsed:
+                parsed[text] = parse_posted(text)
+        self.posted = np.array([parsed[v.get('postedAt')] for v in videos], dtype='datetime64[D]')
+
+        handles = [normalize_handle(v.get('creatorHandle')) for v in videos]
+        self.creators, creator_codes = np.unique(np.array(handles, dtype=object), return_inverse=True)
+        self.creators = [str(c) for c in self.creators]
+        self.creator_codes = creator_codes.astype(np.int64)
+        self.creator_rows = {handle: i for i, handle in enumerate(self.creators)}
+
+        platforms = [str(v.get('platform') or 'unknown').lower() for v in videos]
+        self.platforms, platform_codes = np.unique(np.array(platforms, dtype=object), return_inverse=True)
+        self.platforms = [str(p) for p in self.platforms]
+        self.platform_codes = platform_codes.astype(np.int64)
+        self.platform_rows = {platform: i for i, platform in enumerate(self.platforms)}
+
+        # Rank order, and per-creator / per-platform lists in rank order
+        self.by_views = np.argsort(-self.views, kind='stable')
+        self.by_creator = _group(self.creator_codes, self.by_views, len(self.creators))
+        self.by_platform = _group(self.platform_codes, self.by_views, len(self.platforms))
+
+        # Date index: dated videos sorted by posting day
+        dated = np.flatnonzero(~np.isnat(self.posted))
+        self.by_date = dated[np.argsort(self.posted[dated], kind='stable')]
+        self.sorted_days = self.posted[self.by_date]
+
+        # Days the export covers: first post to the scrape (or last post)
+        self.covered_from, self.covered_to = NAT, NAT
+        if len(self.sorted_days):
+            scraped = parse_posted(str(data.get('scrapedAt') or '')[:10])
+            self.covered_from = self.sorted_days[0]
+            self.covered_to = self.sorted_days[-1] if np.isnat(scraped) else max(scraped, self.sorted_days[-1])
+
+        # Display handle and name per creator, as first seen in rank order
+        self.creator_labels = [videos[rows[0]].get('creatorHandle') for rows in self.by_creator]
+        self.creator_names = [videos[rows[0]].get('creatorName') for rows in self.by_creator]
+
+        # Per-creator aggregates in one pass
+        n = len(self.creators)
+        self.creator_posts = np.bincount(self.creator_codes, minlength=n)
+        self.creator_views = np.bincount(self.creator_codes, weights=self.views, minlength=n).astype(np.int64)
+        day_numbers = np.where(np.isnat(self.posted), np.iinfo(np.int64).max,
+                               self.posted.astype(np.int64))
+        self.creator_first = np.full(n, np.iinfo(np.int64).max)
+        np.minimum.at(self.creator_first, self.creator_codes, day_numbers)
+        self.creator_last = np.full(n, np.iinfo(np.int64).min)
+        np.maximum.at(self.creator_last, self.creator_codes,
+                      np.where(np.isnat(self.posted), np.iinfo(np.int64).min, day_numbers))
+
+    def __len__(self) -> int:
+        return len(self.videos)
+
+    def date_range(self, start: Optional[str] = None, end: Optional[str] = None) -> np.ndarray:
+        """Videos posted between start and end (inclusive), in posting order."""
+        lo = 0 if not start else int(np.searchsorted(self.sorted_days, parse_posted(start), 'left'))
+        hi = len(self.sorted_days) if not end else int(np.searchsorted(self.sorted_days, parse_posted(end), 'right'))
+        return self.by_date[lo:max(lo, hi)]
+
+    def select(self, creator: Optional[str] = None, platform: Optional[str] = None,
+               start: Optional[str] = None, end: Optional[str] = None) -> np.ndarray:
+        """Indices of matching videos, most viewed first."""
+        if creator:
+            row = self.creator_rows.get(normalize_handle(creator))
+            candidates = self.by_creator[row] if row is not None else np.array([], dtype=np.int64)
+        elif platform:
+            row = self.platform_rows.get(platform.lower())
+            candidates = self.by_platform[row] if row is not None else np.array([], dtype=np.int64)
+        elif start or end:
+            candidates = self.date_range(start, end)
+            return candidates[np.argsort(-self.views[candidates], kind='stable')]
+        else:
+            candidates = self.by_views
+
+        if creator and platform:
+            row = self.platform_rows.get(platform.lower(), -1)
+            candidates = candidates[self.platform_codes[candidates] == row]
+        if start or end:
+            days = self.posted[candidates]
+            keep = ~np.isnat(days)
+            if start:
+                keep &= days >= parse_posted(start)
+            if end:
+                keep &= days <= parse_posted(end)
+            candidates = candidates[keep]
+        return candidates
+
+    def video(self, i: int) -> Dict:
+        """One video in the shape the tools return."""
+        v = self.videos[i]
+        return {
+            "rank": v.get('rank'),
+            "views": v.get('viewsFormatted') or f"{int(self.views[i]):,}",
+            "views_raw": int(self.views[i]),
+            "creator": v.get('creatorHandle'),
+            "creator_name": v.get('creatorName'),
+            "platform": self.platforms[self.platform_codes[i]],
+            "posted": v.get('postedAt'),
+        }
+
+    def creator_stats(self, row: int) -> Dict:
+        """Aggregates for one creator (index row)."""
+        posts, views = int(self.creator_posts[row]), int(self.creator_views[row])
+        first, last = self.creator_first[row], self.creator_last[row]
+        stats = {
+            "handle": self.creator_labels[row],
+            "name": self.creator_names[row],
+            "post_count": posts,
+            "total_views": views,
+            "avg_views_per_post": round(views / posts),
+            "views_formatted": format_views(views),
+            "top_video_views": int(self.views[self.by_creator[row][0]]),
+        }
+        if first <= last:
+            stats["first_post"] = str(np.datetime64(int(first), 'D'))
+            stats["last_post"] = str(np.datetime64(int(last), 'D'))
+        return stats
+
+    def covers(self, days: np.ndarray) -> np.ndarray:
+        """Which of the given days fall inside the export's coverage."""
+        if np.isnat(self.covered_from):
+            return np.zeros(len(days), dtype=bool)
+        return (days >= self.covered_from) & (days <= self.covered_to)
+
+    def daily_views(self, days: np.ndarray, creators: bool = False) -> np.ndarray:
+        """Views per posting day on a date axis, in total or one row per creator."""
+        rows = len(self.creators) if creators else 1
+        matrix = np.zeros((rows, len(days)), dtype=np.float64)
+        if not len(days):
+            return matrix
+        cols = (self.posted - days[0]).astype(np.int64)
+        inside = ~np.isnat(self.posted) & (cols >= 0) & (cols < len(days))
+        row_codes = self.creator_codes[inside] if creators else np.zeros(int(inside.sum()), dtype=np.int64)
+        np.add.at(matrix, (row_codes, cols[inside]), self.views[inside])
+        return matrix
+
+
+def format_views(views: int) -> str:
+    """1.2M / 3.4K style view counts."""
+    if views >= 1_000_000:
+        return f"{views / 1_000_000:.1f}M"
+    if views >= 1_000:
+        return f"{views / 1_000:.1f}K"
+    return str(views)
+
+
+def get_ugc_index(snapshot) -> UgcIndex:
+    """The UGC index for a snapshot of ugc-data.json, built once per data version."""
+    return snapshot.derive('ugc_index', lambda s: UgcIndex(s.data))
+
+
+# ============= CORRELATION =============
+
+def masked_pearson(a: np.ndarray, b: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Row-wise Pearson correlation of a and b over masked columns (NaN if undefined)."""
+    a, b, mask = np.broadcast_arrays(a, b, mask)
+    n = mask.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+    mean_a = np.where(mask, a, 0).sum(axis=1) / safe_n
+    mean_b = np.where(mask, b, 0).sum(axis=1) / safe_n
+    da = np.where(mask, a - mean_a[:, None], 0)
+    db = np.where(mask, b - mean_b[:, None], 0)
+    denominator = np.sqrt((da * da).sum(axis=1) * (db * db).sum(axis=1))
+    valid = (denominator > 0) & (n >= MIN_CORRELATION_DAYS)
+    return np.divide((da * db).sum(axis=1), denominator,
+                     out=np.full(len(n), np.nan), where=valid)
+
+
+@dataclass
+class LaggedCorrelation:
+    """Correlation of rows of x with series y, y shifted 0..max_lag days later."""
+    r: np.ndarray  # Rows x (max_lag + 1)
+    days: np.ndarray  # Overlapping days per lag
+
+    def significant(self) -> np.ndarray:
+        """Mask of positive correlations over at least MIN_BEST_LAG_DAYS days with p < 0.05."""
+        n = np.broadcast_to(self.days, self.r.shape)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = np.arctanh(np.clip(self.r, -0.999999, 0.999999)) * np.sqrt(np.maximum(n - 3, 0))
+        return (n >= MIN_BEST_LAG_DAYS) & (z > SIGNIFICANCE_Z)
+
+    def best(self, row: int = 0, max_lag: Optional[int] = None) -> Tuple[Optional[int], Optional[float]]:
+        """(lag, r) with the strongest significant positive correlation, or (None, None)."""
+        values = np.where(self.significant()[row], self.r[row], np.nan)
+        if max_lag is not None:
+            values = values[:max_lag + 1]
+        if not np.isfinite(values).any():
+            return None, None
+        lag = int(np.nanargmax(values))
+        return lag, float(values[lag])
+
+
+def lagged_correlation(x: np.ndarray, y: np.ndarray, y_present: np.ndarray, max_lag: int,
+                       x_present: Optional[np.ndarray] = None) -> LaggedCorrelation:
+    """Correlate x on day t with y on day t + lag for lags 0..max_lag, over days both have data."""
+    ys, ys_present = np.atleast_2d(y), np.atleast_2d(y_present)
+    d = x.shape[1]
+    if x_present is None:
+        x_present = np.ones(d, dtype=bool)
+    lags = max(0, min(max_lag, d - 1))
+    r = np.full((max(len(x), len(ys)), lags + 1), np.nan)
+    days = np.zeros((len(ys), lags + 1), dtype=np.int64)
+    for lag in range(lags + 1):
+        mask = ys_present[:, lag:] & x_present[None, :d - lag]
+        days[:, lag] = mask.sum(axis=1)
+        r[:, lag] = masked_pearson(x[:, :d - lag], ys[:, lag:], mask)
+    return LaggedCorrelation(r=r, days=days if y.ndim == 2 else days[0])
+
+
+def event_axis(engine: QueryEngine) -> np.ndarray:
+    """Contiguous day axis covering the engine's dates."""
+    if not len(engine.days):
+        return engine.days
+    return np.arange(engine.days[0], engine.days[-1] + 1, dtype='datetime64[D]')
+
+
+def event_on_axis(engine: QueryEngine, name: str, axis: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(values, present) of one event on a contiguous axis."""
+    values = np.zeros(len(axis), dtype=np.float64)
+    present = np.zeros(len(axis), dtype=bool)
+    if len(axis):
+        row = engine.rows[name]
+        cols = (engine.days - axis[0]).astype(np.int64)
+        values[cols] = engine.values[row]
+        present[cols] = engine.present[row]
+    return values, present
+
+
+def events_on_axis(engine: QueryEngine, axis: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(values, present) of every event on a contiguous axis, one row per event."""
+    values = np.zeros((len(engine.names), len(axis)), dtype=np.float64)
+    present = np.zeros((len(engine.names), len(axis)), dtype=bool)
+    if len(axis):
+        cols = (engine.days - axis[0]).astype(np.int64)
+        values[:, cols] = engine.values
+        present[:, cols] = engine.present
+    return values, present
+
+
+def views_vs_events(index: UgcIndex, engine: QueryEngine, max_lag: int) -> Dict[str, LaggedCorrelation]:
+    """Lagged correlation of total daily UGC views with every event, all events per lag at once."""
+    axis = event_axis(engine)
+    values, present = events_on_axis(engine, axis)
+    result = lagged_correlation(index.daily_views(axis), values, present, max_lag, index.covers(axis))
+    return {
+        name: LaggedCorrelation(r=result.r[row:row + 1], days=result.days[row])
+        for row, name in enumerate(engine.names)
+    }
+
+
+def creators_vs_event(index: UgcIndex, engine: QueryEngine, name: str,
+                      max_lag: int) -> LaggedCorrelation:
+    """Lagged correlation of each creator's daily views with one event."""
+    axis = event_axis(engine)
+    return lagged_correlation(index.daily_views(axis, creators=True),
+                              *event_on_axis(engine, name, axis), max_lag, index.covers(axis))
+
+
+class CorrelationCache:
+    """Correlations for one Mixpanel snapshot, kept for the newest UGC version only."""
+
+    def __init__(self, max_entries: int = CORRELATIONS_KEPT):
+        self.max_entries = max_entries
+        self.version: Optional[int] = None
+        self._entries: 'OrderedDict[Optional[str], object]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ugc_version: int, key: Optional[str], build: Callable[[], object]):
+        with self._lock:
+            if self.version is None or ugc_version > self.version:
+                self.version = ugc_version
+                self._entries.clear()
+            if ugc_version == self.version and key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            with tracing.span('data_load', kind='derived', source='ugc_correlation'):
+                value = build()
+            if ugc_version == self.version:  # A run pinned to older UGC data is not cached
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+
+
+def _correlations(snapshot) -> CorrelationCache:
+    return snapshot.derive('ugc_correlations', lambda s: CorrelationCache())
+
+
+def get_view_correlations(snapshot, ugc_snapshot) -> Dict[str, LaggedCorrelation]:
+    """Total views vs every event, cached on the Mixpanel snapshot for the newest UGC version."""
+    return _correlations(snapshot).get(
+        ugc_snapshot.version, None,
+        lambda: views_vs_events(get_ugc_index(ugc_snapshot), get_engine(snapshot), MAX_LAG),
+    )
+
+
+def get_creator_correlations(snapshot, ugc_snapshot, name: str) -> LaggedCorrelation:
+    """Per-creator views vs one event, cached like get_view_correlations."""
+    return _correlations(snapshot).get(
+        ugc_snapshot.version, name,
+        lambda: creators_vs_event(get_ugc_index(ugc_snapshot), get_engine(snapshot), name, MAX_LAG),
+    )